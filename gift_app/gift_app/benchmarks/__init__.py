@@ -0,0 +1,9 @@
+"""Бенчмарки приложения.
+
+Запускаются как модули, например::
+
+    python -m gift_app.benchmarks.bulk_import --citizens 10000
+
+Для работы нужна база данных, подготовленная через ``manage.py init-db``.
+Бенчмарки откатывают все свои изменения в базе.
+"""
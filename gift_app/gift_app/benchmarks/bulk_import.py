@@ -0,0 +1,94 @@
+"""Сравнение загрузки жителей через COPY и через пачки INSERT.
+"""
+import asyncio
+import time
+from typing import List
+
+import asyncpg
+import click
+from injector import Injector
+
+from gift_app.models import Citizen
+from gift_app.providers import ApplicationModule
+from gift_app.storage import Storage, citizen_table, relative_table
+
+from .generator import generate_citizens
+
+
+async def insert_citizens_batched(
+    conn: asyncpg.connection.Connection, import_id: int, citizens: List[Citizen]
+):
+    """Прежний способ загрузки: multi-VALUES INSERT по 1000 строк.
+    """
+    MAX_ARGS_LEN = 1000
+    while citizens:
+        citizens_batch = citizens[:MAX_ARGS_LEN]
+        citizens = citizens[MAX_ARGS_LEN:]
+        citizen_insert_args = []
+        relative_insert_args = []
+        for citizen in citizens_batch:
+            citizen_insert_args.append(
+                dict(
+                    import_id=import_id,
+                    citizen_id=citizen.citizen_id,
+                    town=citizen.town,
+                    street=citizen.street,
+                    building=citizen.building,
+                    apartment=citizen.apartment,
+                    name=citizen.name,
+                    birth_date=citizen.birth_date,
+                    gender=citizen.gender,
+                )
+            )
+            for relative in citizen.relatives:
+                relative_insert_args.append(
+                    dict(
+                        import_id=import_id,
+                        citizen_id=citizen.citizen_id,
+                        relative_citizen_id=relative,
+                    )
+                )
+        await conn.fetchrow(citizen_table.insert().values(citizen_insert_args))
+        if relative_insert_args:
+            await conn.fetchrow(relative_table.insert().values(relative_insert_args))
+
+
+async def run(storage: Storage, citizens_count: int, relatives: int, repeat: int):
+    await storage.initialize()
+    citizens = generate_citizens(citizens_count, relatives, seed=0)
+    loaders = {"insert": insert_citizens_batched, "copy": storage._copy_citizens}
+    results = {name: [] for name in loaders}
+    for _ in range(repeat):
+        for name, load in loaders.items():
+            async with storage.pool.acquire() as conn:
+                tx = conn.transaction()
+                await tx.start()
+                try:
+                    import_id = await storage._next_import_id(conn)
+                    await storage._create_import(conn, import_id)
+                    started = time.perf_counter()
+                    await load(conn, import_id, citizens)
+                    results[name].append(time.perf_counter() - started)
+                finally:
+                    await tx.rollback()
+    await storage.pool.close()
+    return results
+
+
+@click.command()
+@click.option("--citizens", "citizens_count", default=10000, show_default=True)
+@click.option("--relatives", default=2, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def main(citizens_count, relatives, repeat):
+    storage = Injector(modules=[ApplicationModule]).get(Storage)
+    results = asyncio.run(run(storage, citizens_count, relatives, repeat))
+    for name, timings in results.items():
+        best = min(timings)
+        click.echo(
+            f"{name:>8}: best {best:.3f}s, "
+            f"{citizens_count / best:,.0f} citizens/s over {repeat} runs"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import datetime as dt
+import math
+import random
+from typing import List, Optional
+
+from gift_app.models import Citizen, Gender
+from gift_app.schemas import CitizenSchema
+
+# Значения в духе жителей из tests/conftest.py.
+TOWNS = ["Москва", "Керчь"]
+STREETS = ["Льва Толстого", "Иосифа Бродского"]
+BUILDINGS = ["16к7стр5", "2"]
+NAMES = {
+    Gender.male: ["Иванов Иван Иванович", "Иванов Сергей Иванович"],
+    Gender.female: ["Романова Мария Леонидовна", "Иванова Мария Леонидовна"],
+}
+
+# Распределения числа родственников у жителя:
+# fixed - у всех relatives_per_citizen соседей по списку,
+# poisson - пуассоновское со средним relatives_per_citizen,
+# powerlaw - степенное: у немногих жителей очень много родственников.
+DEGREE_FIXED = "fixed"
+DEGREE_POISSON = "poisson"
+DEGREE_POWERLAW = "powerlaw"
+DEGREE_DISTRIBUTIONS = [DEGREE_FIXED, DEGREE_POISSON, DEGREE_POWERLAW]
+
+
+def generate_citizens(
+    count: int,
+    relatives_per_citizen: int = 2,
+    seed: Optional[int] = None,
+    towns: int = 100,
+    degree: str = DEGREE_FIXED,
+) -> List[Citizen]:
+    """Сгенерировать набор жителей с симметричными родственными связями.
+
+    towns - число различных городов, degree - распределение числа
+    родственников со средним relatives_per_citizen.
+    """
+    rnd = random.Random(seed)
+    town_names = [*TOWNS, *(f"Город {i}" for i in range(max(towns - len(TOWNS), 0)))]
+    town_names = town_names[:towns]
+    citizens = []
+    for citizen_id in range(1, count + 1):
+        gender = rnd.choice([Gender.male, Gender.female])
+        citizens.append(
+            Citizen(
+                citizen_id=citizen_id,
+                town=rnd.choice(town_names),
+                street=rnd.choice(STREETS),
+                building=rnd.choice(BUILDINGS),
+                apartment=rnd.randrange(1000),
+                name=rnd.choice(NAMES[gender]),
+                birth_date=dt.date(1950, 1, 1)
+                + dt.timedelta(days=rnd.randrange(20000)),
+                gender=gender,
+                relatives=[],
+            )
+        )
+    if degree == DEGREE_FIXED:
+        _link_neighbours(citizens, relatives_per_citizen)
+    else:
+        _link_random(citizens, relatives_per_citizen, degree, rnd)
+    return citizens
+
+
+def _link_neighbours(citizens: List[Citizen], relatives_per_citizen: int):
+    # Связываем соседей по списку, чтобы родство было двусторонним.
+    count = len(citizens)
+    for i, citizen in enumerate(citizens):
+        for offset in range(1, relatives_per_citizen // 2 + 1):
+            relative = citizens[(i + offset) % count]
+            if relative is citizen or relative.citizen_id in citizen.relatives:
+                continue
+            citizen.relatives.append(relative.citizen_id)
+            relative.relatives.append(citizen.citizen_id)
+
+
+def _link_random(
+    citizens: List[Citizen], relatives_per_citizen: int, degree: str, rnd: random.Random
+):
+    """Связать жителей случайно по заданному распределению числа родственников.
+
+    Каждому жителю выдается столько "половинок" связей, сколько у него должно
+    быть родственников, половинки перемешиваются и соединяются попарно.
+    Петли и повторы отбрасываются, поэтому среднее выходит чуть меньше.
+    """
+    stubs = []
+    for i in range(len(citizens)):
+        if degree == DEGREE_POISSON:
+            citizen_degree = _poisson(relatives_per_citizen, rnd)
+        else:
+            # Парето с alpha=2 имеет среднее 2, масштабируем его к нужному.
+            citizen_degree = round(rnd.paretovariate(2) * relatives_per_citizen / 2)
+        stubs.extend([i] * min(citizen_degree, len(citizens) - 1))
+    rnd.shuffle(stubs)
+    pairs = set()
+    for i, j in zip(stubs[::2], stubs[1::2]):
+        if i == j or (i, j) in pairs or (j, i) in pairs:
+            continue
+        pairs.add((i, j))
+        citizens[i].relatives.append(citizens[j].citizen_id)
+        citizens[j].relatives.append(citizens[i].citizen_id)
+
+
+def _poisson(mean: float, rnd: random.Random) -> int:
+    # Алгоритм Кнута, для средних в единицы-десятки родственников достаточно.
+    limit = math.exp(-mean)
+    k, p = 0, rnd.random()
+    while p > limit:
+        k += 1
+        p *= rnd.random()
+    return k
+
+
+def generate_import_payload(
+    count: int,
+    relatives_per_citizen: int = 2,
+    seed=None,
+    towns: int = 100,
+    degree: str = DEGREE_FIXED,
+) -> dict:
+    """Сгенерировать тело запроса POST /imports.
+    """
+    citizens = generate_citizens(count, relatives_per_citizen, seed, towns, degree)
+    return {"citizens": CitizenSchema(many=True).dump(citizens)}
@@ -0,0 +1,501 @@
+"""Нагрузочный бенчмарк всех маршрутов приложения.
+
+Сервер запускается командой manage serve в отдельном процессе поверх базы,
+подготовленной через init-db, либо используется уже запущенный по --url.
+Для каждого сценария считаются задержки p50/p95/p99, пропускная способность
+и пиковый RSS процессов сервера. Результаты сохраняются в JSON, с --baseline
+печатается сравнение с прошлым прогоном, например до изменения хранилища
+или сериализации.
+
+Бенчмарк создает свои наборы данных и удаляет их в конце.
+"""
+import asyncio
+import datetime as dt
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import aiohttp
+import click
+import numpy as np
+
+import gift_app
+from gift_app.serialization import JsonSerializer
+
+from .generator import DEGREE_DISTRIBUTIONS, DEGREE_FIXED, generate_import_payload
+
+# Путь и тело запроса, тело уже в json.
+Request = Tuple[str, Optional[bytes]]
+
+# Как часто замерять RSS сервера и опрашивать задания импорта, секунд.
+SAMPLE_INTERVAL = 0.1
+SERVER_START_TIMEOUT = 60
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # Шаблон маршрута из provide_app, для отчета.
+    route: str
+    make_request: Callable[[random.Random], Request]
+    requests: int
+    concurrency: int
+    status: int = 200
+    # Сюда складываются разобранные ответы, если они нужны следующим сценариям.
+    responses: Optional[List[dict]] = None
+
+
+@dataclass
+class LoadParams:
+    citizens: int
+    relatives: int
+    degree: str
+    towns: int
+    imports: int
+    requests: int
+    concurrency: int
+    workers: int
+    patch_size: int
+    seed: int = 0
+    url: Optional[str] = None
+    extra: dict = field(default_factory=dict)
+
+
+async def run_scenario(
+    session: aiohttp.ClientSession,
+    url: str,
+    scenario: Scenario,
+    server_pid: Optional[int],
+) -> dict:
+    rnd = random.Random(0)
+    latencies = []
+    errors = []
+    remaining = scenario.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            path, body = scenario.make_request(rnd)
+            started = time.perf_counter()
+            try:
+                async with session.request(
+                    scenario.method,
+                    url + path,
+                    data=body,
+                    headers={"Content-Type": "application/json"},
+                ) as rv:
+                    content = await rv.read()
+            except aiohttp.ClientError as e:
+                errors.append(repr(e))
+                continue
+            latencies.append(time.perf_counter() - started)
+            if rv.status != scenario.status:
+                errors.append(f"{rv.status} {content[:200]!r}")
+            elif scenario.responses is not None:
+                scenario.responses.append(json.loads(content))
+
+    sampler = asyncio.ensure_future(sample_rss(server_pid))
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*[worker() for _ in range(scenario.concurrency)])
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        rss = await sampler
+    # Если не прошел ни один запрос, задержки в отчете нулевые.
+    p50, p95, p99 = np.percentile(latencies or [0], [50, 95, 99]) * 1000
+    return {
+        "scenario": scenario.name,
+        "method": scenario.method,
+        "route": scenario.route,
+        "requests": len(latencies) + len(errors),
+        "concurrency": scenario.concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "max_ms": round(max(latencies or [0]) * 1000, 2),
+        "rss_mb": round(rss / 2 ** 20, 1) if rss is not None else None,
+    }
+
+
+async def sample_rss(pid: Optional[int]) -> Optional[int]:
+    """Замерять RSS сервера вместе с дочерними процессами до отмены, вернуть пик.
+    """
+    if pid is None:
+        return None
+    peak = 0
+    try:
+        while True:
+            peak = max(peak, process_tree_rss(pid))
+            await asyncio.sleep(SAMPLE_INTERVAL)
+    except asyncio.CancelledError:
+        return max(peak, process_tree_rss(pid))
+
+
+def process_tree_rss(pid: int) -> int:
+    """RSS процесса и всех его потомков по /proc, байт.
+    """
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            with open(f"/proc/{pid}/task/{pid}/children") as f:
+                pids.extend(int(x) for x in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            # Процесс успел завершиться.
+            continue
+    return total
+
+
+async def wait_jobs(session: aiohttp.ClientSession, url: str, job_ids: List[int]):
+    """Дождаться заданий импорта, вернуть import_id успешных.
+    """
+    import_ids = []
+    for job_id in job_ids:
+        while True:
+            async with session.get(f"{url}/imports/jobs/{job_id}") as rv:
+                job = (await rv.json())["data"]
+            if job["status"] == "failed":
+                click.echo(f"Import job {job_id} failed: {job['error']}", err=True)
+                break
+            if job["status"] == "done":
+                import_ids.append(job["import_id"])
+                break
+            await asyncio.sleep(SAMPLE_INTERVAL)
+    return import_ids
+
+
+def read_scenarios(params: LoadParams, import_id: int) -> List[Scenario]:
+    """Чтения одного набора данных и служебные маршруты.
+    """
+    reads = [
+        ("citizens", "/imports/{import_id}/citizens", "citizens"),
+        ("birthdays", "/imports/{import_id}/citizens/birthdays", "citizens/birthdays"),
+        (
+            "percentile_age",
+            "/imports/{import_id}/towns/stat/percentile/age",
+            "towns/stat/percentile/age",
+        ),
+    ]
+    scenarios = [
+        Scenario(
+            name,
+            "GET",
+            route,
+            lambda rnd, path=path: (f"/imports/{import_id}/{path}", None),
+            params.requests,
+            params.concurrency,
+        )
+        for name, route, path in reads
+    ]
+    # /x/problem намеренно падает, нагружать его незачем.
+    for name in ["version", "health", "cache", "pool", "metrics"]:
+        scenarios.append(
+            Scenario(
+                f"x_{name}",
+                "GET",
+                f"/x/{name}",
+                lambda rnd, name=name: (f"/x/{name}", None),
+                params.requests,
+                params.concurrency,
+            )
+        )
+    return scenarios
+
+
+def update_scenarios(params: LoadParams, import_id: int) -> List[Scenario]:
+    serializer = JsonSerializer()
+
+    def patch_citizen(rnd: random.Random) -> Request:
+        citizen_id = rnd.randint(1, params.citizens)
+        body = {"apartment": rnd.randrange(1000)}
+        return (f"/imports/{import_id}/citizens/{citizen_id}", serializer.dumps(body))
+
+    def patch_citizens(rnd: random.Random) -> Request:
+        size = min(params.patch_size, params.citizens)
+        citizen_ids = rnd.sample(range(1, params.citizens + 1), size)
+        body = {
+            "citizens": [
+                {"citizen_id": x, "apartment": rnd.randrange(1000)} for x in citizen_ids
+            ]
+        }
+        return f"/imports/{import_id}/citizens", serializer.dumps(body)
+
+    return [
+        Scenario(
+            "update_citizen",
+            "PATCH",
+            "/imports/{import_id}/citizens/{citizen_id}",
+            patch_citizen,
+            params.requests,
+            params.concurrency,
+        ),
+        Scenario(
+            "update_citizens",
+            "PATCH",
+            "/imports/{import_id}/citizens",
+            patch_citizens,
+            params.requests,
+            params.concurrency,
+        ),
+        # После обновлений кэш ответов сброшен.
+        Scenario(
+            "citizens_after_update",
+            "GET",
+            "/imports/{import_id}/citizens",
+            lambda rnd: (f"/imports/{import_id}/citizens", None),
+            params.requests,
+            params.concurrency,
+        ),
+    ]
+
+
+async def run_load(params: LoadParams, url: str, server_pid: Optional[int]) -> list:
+    payload = generate_import_payload(
+        params.citizens, params.relatives, params.seed, params.towns, params.degree
+    )
+    body = JsonSerializer().dumps(payload)
+    results = []
+    connector = aiohttp.TCPConnector(limit=max(params.concurrency, 1))
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def run(scenario: Scenario):
+            result = await run_scenario(session, url, scenario, server_pid)
+            results.append(result)
+            echo_result(result)
+
+        imports = Scenario(
+            "import",
+            "POST",
+            "/imports",
+            lambda rnd: ("/imports", body),
+            params.imports,
+            1,
+            status=201,
+            responses=[],
+        )
+        await run(imports)
+        import_ids = [x["data"]["import_id"] for x in imports.responses]
+        if not import_ids:
+            raise click.ClickException("No import succeeded, nothing to load")
+
+        jobs = Scenario(
+            "import_job",
+            "POST",
+            "/imports/jobs",
+            lambda rnd: ("/imports/jobs", body),
+            params.imports,
+            1,
+            status=202,
+            responses=[],
+        )
+        await run(jobs)
+        job_ids = [x["data"]["job_id"] for x in jobs.responses]
+        if job_ids:
+            await run(
+                Scenario(
+                    "import_job_status",
+                    "GET",
+                    "/imports/jobs/{job_id}",
+                    lambda rnd: (f"/imports/jobs/{rnd.choice(job_ids)}", None),
+                    params.requests,
+                    params.concurrency,
+                )
+            )
+            import_ids += await wait_jobs(session, url, job_ids)
+
+        for scenario in read_scenarios(params, import_ids[0]):
+            await run(scenario)
+        for scenario in update_scenarios(params, import_ids[0]):
+            await run(scenario)
+
+        to_delete = iter(import_ids)
+        await run(
+            Scenario(
+                "delete_import",
+                "DELETE",
+                "/imports/{import_id}",
+                lambda rnd: (f"/imports/{next(to_delete)}", None),
+                len(import_ids),
+                1,
+            )
+        )
+    return results
+
+
+def echo_result(result: dict):
+    rss = f"{result['rss_mb']} MB" if result["rss_mb"] is not None else "-"
+    click.echo(
+        f"{result['scenario']:>22}: {result['rps']:>9.1f} rps, "
+        f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+        f"p99 {result['p99_ms']:.1f} ms, rss {rss}, errors {result['errors']}"
+    )
+    if result["first_error"]:
+        click.echo(f"{'':>24}{result['first_error']}", err=True)
+
+
+def echo_comparison(results: List[dict], baseline: dict):
+    """Изменение p95 и пропускной способности относительно прошлого прогона.
+    """
+    previous = {x["scenario"]: x for x in baseline["results"]}
+    click.echo(f"Compared to {baseline.get('commit') or baseline['started_at']}:")
+    for result in results:
+        before = previous.get(result["scenario"])
+        if not before or not before["rps"] or not before["p95_ms"]:
+            continue
+        rps = (result["rps"] / before["rps"] - 1) * 100
+        p95 = (result["p95_ms"] / before["p95_ms"] - 1) * 100
+        click.echo(f"{result['scenario']:>22}: rps {rps:+.1f}%, p95 {p95:+.1f}%")
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    """Запустить manage serve, он лежит рядом с пакетом gift_app.
+    """
+    app_dir = Path(gift_app.__file__).resolve().parents[1]
+    command = [sys.executable, "-m", "manage", "serve", "--host", "127.0.0.1"]
+    command += ["--port", str(port), "--workers", str(workers)]
+    return subprocess.Popen(command, cwd=app_dir)
+
+
+async def wait_server(url: str, process: subprocess.Popen):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise click.ClickException("Server exited, is the database ready?")
+            try:
+                async with session.get(f"{url}/x/health") as rv:
+                    if rv.status == 200:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            await asyncio.sleep(SAMPLE_INTERVAL)
+    raise click.ClickException("Server did not become healthy in time")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(gift_app.__file__).resolve().parent,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(params: LoadParams) -> list:
+    if params.url:
+        return await run_load(params, params.url.rstrip("/"), server_pid=None)
+    url = f"http://127.0.0.1:{free_port()}"
+    process = start_server(int(url.rsplit(":", 1)[1]), params.workers)
+    try:
+        await wait_server(url, process)
+        return await run_load(params, url, process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@click.command()
+@click.option("--citizens", default=10000, show_default=True)
+@click.option("--relatives", default=2, show_default=True, help="Среднее число.")
+@click.option(
+    "--degree",
+    type=click.Choice(DEGREE_DISTRIBUTIONS),
+    default=DEGREE_FIXED,
+    show_default=True,
+    help="Распределение числа родственников.",
+)
+@click.option("--towns", default=100, show_default=True)
+@click.option("--imports", default=3, show_default=True, help="Импортов каждого вида.")
+@click.option("--requests", default=500, show_default=True, help="На сценарий.")
+@click.option("--concurrency", default=10, show_default=True)
+@click.option("--workers", default=1, show_default=True, help="Процессов сервера.")
+@click.option("--patch-size", default=10, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+@click.option("--url", help="Уже запущенный сервер, RSS тогда не замеряется.")
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="Файл для результатов, по умолчанию load-<коммит>-<время>.json.",
+)
+@click.option(
+    "--baseline", type=click.File(), help="Результаты прошлого прогона для сравнения."
+)
+def main(
+    citizens,
+    relatives,
+    degree,
+    towns,
+    imports,
+    requests,
+    concurrency,
+    workers,
+    patch_size,
+    seed,
+    url,
+    output,
+    baseline,
+):
+    params = LoadParams(
+        citizens=citizens,
+        relatives=relatives,
+        degree=degree,
+        towns=towns,
+        imports=imports,
+        requests=requests,
+        concurrency=concurrency,
+        workers=workers,
+        patch_size=patch_size,
+        seed=seed,
+        url=url,
+    )
+    # Настройки приложения тоже влияют на результат.
+    params.extra = {k: v for k, v in os.environ.items() if k.startswith("GIFT_APP_")}
+    params.extra.pop("GIFT_APP_DB_PASSWORD", None)
+    started_at = dt.datetime.now().replace(microsecond=0)
+    commit = current_commit()
+    results = asyncio.run(run(params))
+    report = {
+        "commit": commit,
+        "started_at": started_at.isoformat(),
+        "params": vars(params),
+        "results": results,
+    }
+    if not output:
+        output = f"load-{commit or 'unknown'}-{started_at:%Y%m%d-%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    click.echo(f"Saved to {output}")
+    if baseline:
+        echo_comparison(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
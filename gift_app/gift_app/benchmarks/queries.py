@@ -0,0 +1,60 @@
+"""Сравнение подготовки частых запросов: компиляция SQLAlchemy на каждый
+запрос против запросов, скомпилированных один раз.
+
+Меряется только CPU на стороне приложения, база данных не нужна.
+"""
+import time
+
+import click
+from asyncpgsa import compile_query
+
+from gift_app import storage
+
+# Запросы, которые выполняют обработчики GET на каждый запрос.
+REQUESTS = {
+    "citizens": [
+        (storage._import_exists_query, storage.IMPORT_EXISTS_QUERY),
+        (storage._citizens_with_relatives_query, storage.LIST_CITIZENS_QUERY),
+    ],
+    "birthdays": [
+        (storage._import_exists_query, storage.IMPORT_EXISTS_QUERY),
+        (storage._birthdays_report_query, storage.BIRTHDAYS_REPORT_QUERY),
+    ],
+    "percentile": [
+        (storage._import_exists_query, storage.IMPORT_EXISTS_QUERY),
+        (storage._age_stats_query, storage.AGE_STATS_QUERY),
+    ],
+}
+
+
+def measure(function, repeat: int) -> float:
+    started = time.process_time()
+    for i in range(repeat):
+        function(i)
+    return (time.process_time() - started) / repeat
+
+
+@click.command()
+@click.option("--repeat", default=2000, show_default=True)
+def main(repeat):
+    for name, queries in REQUESTS.items():
+
+        def compile_each_time(import_id):
+            for build, _ in queries:
+                compile_query(build(import_id))
+
+        def bind_compiled(import_id):
+            for _, compiled in queries:
+                compiled.bind(import_id=import_id)
+
+        compile_time = measure(compile_each_time, repeat)
+        bind_time = measure(bind_compiled, repeat)
+        click.echo(
+            f"{name:>10}: compile {compile_time * 1e6:.0f}us, "
+            f"compiled {bind_time * 1e6:.1f}us, "
+            f"saved {(compile_time - bind_time) * 1e6:.0f}us per request"
+        )
+
+
+if __name__ == "__main__":
+    main()
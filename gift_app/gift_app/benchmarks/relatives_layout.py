@@ -0,0 +1,87 @@
+"""Сравнение хранения родственников таблицей relative и массивом в строке жителя.
+
+Таблицы каждого варианта создаются в отдельной схеме внутри транзакции,
+которая затем откатывается, поэтому подготавливать базу через init-db не нужно.
+"""
+import asyncio
+import time
+
+import click
+from injector import Injector
+
+from gift_app.providers import ApplicationModule
+from gift_app.storage import (
+    RELATIVES_ARRAY,
+    RELATIVES_TABLE,
+    Storage,
+    citizen_table,
+    create_tables,
+    relative_table,
+)
+
+from .generator import generate_citizens
+
+
+async def run(storage: Storage, citizens_count: int, relatives: int, repeat: int):
+    await storage.initialize()
+    citizens = generate_citizens(citizens_count, relatives, seed=0)
+    results = {}
+    for layout in [RELATIVES_TABLE, RELATIVES_ARRAY]:
+        storage._relatives_layout = layout
+        imports, lists = [], []
+        async with storage.pool.acquire() as conn:
+            tx = conn.transaction()
+            await tx.start()
+            try:
+                schema = f"benchmark_relatives_{layout}"
+                await conn.execute(f"CREATE SCHEMA {schema}")
+                await conn.execute(f"SET LOCAL search_path TO {schema}")
+                # Подготовленные запросы ссылаются на таблицы прежней схемы.
+                await conn.reload_schema_state()
+                await create_tables(conn, relatives_layout=layout)
+                for _ in range(repeat):
+                    import_id = await storage._next_import_id(conn)
+                    await storage._create_import(conn, import_id)
+                    started = time.perf_counter()
+                    await storage._copy_citizens(conn, import_id, citizens)
+                    if layout == RELATIVES_ARRAY:
+                        await storage._check_relatives_symmetric(conn, import_id)
+                    await storage._build_analytics(conn, import_id)
+                    imports.append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    await storage._list_citizens(conn, import_id)
+                    lists.append(time.perf_counter() - started)
+                size = 0
+                for table in [citizen_table, relative_table]:
+                    size += await conn.fetchval(
+                        "SELECT coalesce(pg_total_relation_size(to_regclass($1)), 0)",
+                        table.name,
+                    )
+            finally:
+                await tx.rollback()
+        results[layout] = {"import": imports, "list": lists, "size": size / repeat}
+    await storage.pool.close()
+    return results
+
+
+@click.command()
+@click.option("--citizens", "citizens_count", default=10000, show_default=True)
+@click.option("--relatives", default=2, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def main(citizens_count, relatives, repeat):
+    storage = Injector(modules=[ApplicationModule]).get(Storage)
+    results = asyncio.run(run(storage, citizens_count, relatives, repeat))
+    for layout, result in results.items():
+        best_import = min(result["import"])
+        best_list = min(result["list"])
+        click.echo(
+            f"{layout:>6}: import {citizens_count / best_import:,.0f} citizens/s, "
+            f"list {citizens_count / best_list:,.0f} citizens/s, "
+            f"{result['size'] / 2 ** 20:.1f} MB per import "
+            f"(best of {repeat} runs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
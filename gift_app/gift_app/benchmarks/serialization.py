@@ -0,0 +1,52 @@
+"""Сравнение сериализации ответа со списком жителей: CitizenSchema и json
+против прямой сериализации строк и orjson.
+
+Меряется только CPU на стороне приложения, база данных не нужна.
+"""
+import time
+
+import click
+
+from gift_app.schemas import CitizenSchema, dump_citizen
+from gift_app.serialization import JsonSerializer, OrjsonSerializer, orjson
+
+from .generator import generate_citizens
+
+
+@click.command()
+@click.option("--citizens", "citizens_count", default=100000, show_default=True)
+@click.option("--relatives", default=2, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def main(citizens_count, relatives, repeat):
+    citizens = generate_citizens(citizens_count, relatives, seed=0)
+    # Строки из базы - отображения с теми же ключами, что и у Citizen.
+    rows = [vars(x) for x in citizens]
+    serializers = [JsonSerializer()]
+    if orjson:
+        serializers.append(OrjsonSerializer())
+    else:
+        click.echo("orjson is not installed, skipping it")
+
+    variants = {}
+    for serializer in serializers:
+        variants[f"schema + {serializer.name}"] = lambda s=serializer: s.dumps(
+            {"data": CitizenSchema(many=True).dump(citizens)}
+        )
+        variants[f"rows + {serializer.name}"] = lambda s=serializer: s.dumps(
+            {"data": [dump_citizen(x) for x in rows]}
+        )
+    for name, serialize in variants.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.process_time()
+            body = serialize()
+            timings.append(time.process_time() - started)
+        best = min(timings)
+        click.echo(
+            f"{name:>16}: best {best:.3f}s, {citizens_count / best:,.0f} citizens/s, "
+            f"{len(body) / 2 ** 20:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Накладные расходы замеров по фазам на GET /imports/{import_id}/citizens.
+
+База не нужна: хранилище отдает заранее сгенерированные строки, поэтому
+разница между прогонами с GIFT_APP_API_TIMING и без него - верхняя оценка,
+с базой доля замеров только меньше.
+"""
+import asyncio
+import logging
+import time
+
+import click
+from aiohttp.test_utils import TestClient, TestServer
+from injector import Binder
+
+from gift_app.config import Config
+from gift_app.main import init_func
+from gift_app.storage import Storage
+
+from .generator import generate_citizens
+
+
+class RowsStorage:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def initialize(self):
+        return self
+
+    async def close(self):
+        pass
+
+    async def list_citizens_rows(self, import_id):
+        return self.rows
+
+
+async def measure(timing: bool, rows: list, requests: int) -> float:
+    config = Config({"cache": {"max_bytes": 0}, "api": {"timing": timing}})
+    storage = RowsStorage(rows)
+
+    def configuration(binder: Binder):
+        binder.bind(Config, config)
+        binder.bind(Storage, storage)
+
+    app = await init_func([], extra_modules=[configuration])
+    logging.getLogger("gift_app").setLevel(logging.WARNING)
+    async with TestClient(TestServer(app)) as client:
+        started = time.perf_counter()
+        for _ in range(requests):
+            rv = await client.get("/imports/1/citizens")
+            await rv.read()
+        return time.perf_counter() - started
+
+
+@click.command()
+@click.option("--citizens", "citizens_count", default=1000, show_default=True)
+@click.option("--requests", default=300, show_default=True)
+@click.option("--repeat", default=5, show_default=True)
+def main(citizens_count, requests, repeat):
+    rows = [vars(x) for x in generate_citizens(citizens_count, 2, seed=0)]
+    timings = {False: [], True: []}
+    for _ in range(repeat):
+        # Прогоны чередуются, чтобы шум машины делился поровну.
+        for timing in timings:
+            timings[timing].append(asyncio.run(measure(timing, rows, requests)))
+    off, on = min(timings[False]), min(timings[True])
+    click.echo(
+        f"without timing: {requests / off:,.0f} rps, "
+        f"with timing: {requests / on:,.0f} rps, overhead {(on / off - 1) * 100:.1f}%"
+    )
+
+
+if __name__ == "__main__":
+    main()
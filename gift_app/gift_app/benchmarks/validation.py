@@ -0,0 +1,40 @@
+"""Сравнение валидации импорта ImportsSchema и FastImportsSchema.
+
+База данных для этого бенчмарка не нужна.
+"""
+import copy
+import time
+
+import click
+
+from gift_app.fast_schemas import FastImportsSchema
+from gift_app.schemas import ImportsSchema
+
+from .generator import generate_import_payload
+
+
+def measure(schema, payload: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        data = copy.deepcopy(payload)
+        started = time.perf_counter()
+        schema.load(data)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+@click.command()
+@click.option("--citizens", "citizens_count", default=10000, show_default=True)
+@click.option("--relatives", default=2, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def main(citizens_count, relatives, repeat):
+    payload = generate_import_payload(citizens_count, relatives, seed=0)
+    marshmallow_time = measure(ImportsSchema(), payload, repeat)
+    fast_time = measure(FastImportsSchema(), payload, repeat)
+    click.echo(f"marshmallow: {marshmallow_time:.3f}s")
+    click.echo(f"       fast: {fast_time:.3f}s")
+    click.echo(f"    speedup: {marshmallow_time / fast_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# (import_id, endpoint, version)
+CacheKey = Tuple[int, str, int]
+
+
+class ResponseCache:
+    """LRU кэш сериализованных ответов с ограничением по суммарному размеру.
+
+    Ключи включают версию импорта, так что после изменения импорта
+    старые записи просто перестают запрашиваться и со временем вытесняются.
+
+    Пока включено отслеживание версий (есть подписка на уведомления базы),
+    кэш помнит последние версии наборов данных и запрос версии в базу
+    не нужен. Поколение увеличивается при каждом включении и выключении
+    отслеживания, чтобы версия, прочитанная из базы до подписки, не была
+    запомнена после нее.
+    """
+
+    def __init__(self, max_bytes: int):
+        # При max_bytes == 0 кэш ничего не хранит.
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.tracking = False
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._versions: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: CacheKey) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: CacheKey, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        import_id, _, version = key
+        if version < self._versions.get(import_id, version):
+            # Набор успел измениться, пока готовился ответ.
+            return
+        self._remove(key)
+        self._entries[key] = body
+        self.size_bytes += len(body)
+        while self.size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= len(evicted)
+            self.evictions += 1
+
+    def invalidate(self, import_id: int):
+        """Удалить все записи набора данных.
+        """
+        for key in [key for key in self._entries if key[0] == import_id]:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._versions.clear()
+        self.size_bytes = 0
+
+    def known_version(self, import_id: int) -> Optional[int]:
+        """Последняя версия набора, если ей можно доверять без запроса в базу.
+        """
+        if not self.tracking:
+            return None
+        return self._versions.get(import_id)
+
+    def remember_version(self, import_id: int, version: int, generation: int):
+        """Запомнить версию, прочитанную из базы в поколении generation.
+        """
+        if not self.tracking or generation != self.generation:
+            return
+        if version > self._versions.get(import_id, -1):
+            self._versions[import_id] = version
+
+    def set_version(self, import_id: int, version: int):
+        """Обработать уведомление об изменении набора данных.
+        """
+        if version <= self._versions.get(import_id, -1):
+            return
+        self._versions[import_id] = version
+        self.invalidate(import_id)
+        self.invalidations += 1
+
+    def start_tracking(self):
+        # Уведомления, пропущенные до подписки, могли сделать кэш устаревшим.
+        self.clear()
+        self.generation += 1
+        self.tracking = True
+
+    def stop_tracking(self):
+        self._versions.clear()
+        self.generation += 1
+        self.tracking = False
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "tracking": self.tracking,
+        }
+
+    def _remove(self, key: CacheKey):
+        body = self._entries.pop(key, None)
+        if body is not None:
+            self.size_bytes -= len(body)
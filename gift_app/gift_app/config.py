@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import List, Optional
 
 from environs import Env
 
@@ -12,6 +13,74 @@ class DbConfig:
     host: str
     port: int
     password: str = field(repr=False)
+    # Размер пула соединений одного процесса приложения.
+    pool_min_size: int = 10
+    pool_max_size: int = 10
+    # Соединения, простаивающие дольше, закрываются, секунд.
+    max_inactive_connection_lifetime: float = 300
+    # Таймауты запроса на стороне клиента и на стороне сервера, секунд.
+    command_timeout: Optional[float] = None
+    statement_timeout: Optional[float] = None
+    # Реплики для чтения, "host" или "host:port". Набор, измененный менее
+    # read_your_writes_window секунд назад, читается с основной базы.
+    replica_hosts: List[str] = field(default_factory=list)
+    read_your_writes_window: float = 5
+    # Сколько строк удалять одной транзакцией при удалении набора данных.
+    delete_batch_size: int = 5000
+    # Предел соединений к основной базе со всех процессов хоста, делится
+    # поровну между процессами сервера. 0 - пул каждого процесса pool_max_size.
+    host_pool_max_size: int = 0
+
+
+@dataclass
+class ApiConfig:
+    # Максимальный размер тела запроса.
+    client_max_size: int = 2 ** 20 * 100  # 100 mB
+    # Разбирать тело импорта потоково и грузить жителей в базу пачками.
+    streaming_imports: bool = False
+    import_batch_size: int = 1000
+    # Валидировать импорт FastImportsSchema вместо ImportsSchema.
+    fast_validation: bool = False
+    # Отдавать список жителей потоково, читая их из базы пачками.
+    streaming_citizens_list: bool = False
+    citizens_list_batch_size: int = 1000
+    # Сериализатор json: "json", "orjson" или "auto" - orjson, если установлен.
+    json_backend: str = "auto"
+    # Процессов для разбора и валидации импорта, 0 - разбирать POST /imports
+    # в цикле событий, а задания импорта - в пуле из одного процесса.
+    parse_workers: int = 0
+    # Сколько импортов одновременно разбирается или ждет свободного процесса.
+    parse_queue_size: int = 4
+    # Замерять запросы по фазам для /x/metrics и заголовка Server-Timing.
+    timing: bool = True
+    # Асинхронные импорты: сколько выполняется одновременно и сколько
+    # принятых ждет очереди.
+    import_jobs_concurrency: int = 1
+    import_jobs_queue_size: int = 16
+    # DELETE /imports/{import_id} только скрывает набор, а строки удаляются
+    # в фоне после ответа.
+    purge_in_background: bool = True
+
+
+@dataclass
+class ServerConfig:
+    # Число процессов сервера, слушающих один порт.
+    workers: int = 1
+    # Номер текущего процесса, его выставляет сервер при запуске процесса.
+    worker_id: int = 0
+    # Сколько ждать завершения запросов при остановке, секунд.
+    shutdown_timeout: float = 30
+
+
+@dataclass
+class CacheConfig:
+    # Максимальный суммарный размер закэшированных ответов, 0 отключает кэш.
+    max_bytes: int = 2 ** 20 * 64  # 64 mB
+    # Сбрасывать кэш по уведомлениям базы об изменениях наборов данных,
+    # чтобы не сверять версию набора с базой на каждом запросе.
+    listen: bool = False
+    listen_ping_interval: float = 5
+    listen_reconnect_delay: float = 1
 
 
 class Config:
@@ -19,6 +88,9 @@ class Config:
     """
 
     db: DbConfig
+    api: ApiConfig
+    cache: CacheConfig
+    server: ServerConfig
 
     def __init__(self, overrides=None):
         self._env_config_vars = self._read_env()
@@ -26,24 +98,111 @@ class Config:
         self._update()
 
     def __repr__(self):
-        return f"<Config db={self.db!r}>"
+        return (
+            f"<Config db={self.db!r} api={self.api!r} cache={self.cache!r} "
+            f"server={self.server!r}>"
+        )
 
     def _update(self):
         config_vars = merge_dicts(self._env_config_vars, self._overrides)
         self.db = DbConfig(**config_vars["db"])
+        self.api = ApiConfig(**config_vars["api"])
+        self.cache = CacheConfig(**config_vars["cache"])
+        self.server = ServerConfig(**config_vars["server"])
 
     def _read_env(self) -> dict:
         env = Env()
         env.read_env()
         with env.prefixed("GIFT_APP_"):
             with env.prefixed("DB_"):
-                config_vars = {
-                    "db": {
-                        "name": env("NAME"),
-                        "host": env("HOST"),
-                        "username": env("USERNAME"),
-                        "password": env("PASSWORD", None),
-                        "port": env.int("PORT", 5432),
-                    }
+                db_vars = {
+                    "name": env("NAME"),
+                    "host": env("HOST"),
+                    "username": env("USERNAME"),
+                    "password": env("PASSWORD", None),
+                    "port": env.int("PORT", 5432),
+                    "pool_min_size": env.int("POOL_MIN_SIZE", DbConfig.pool_min_size),
+                    "pool_max_size": env.int("POOL_MAX_SIZE", DbConfig.pool_max_size),
+                    "max_inactive_connection_lifetime": env.float(
+                        "MAX_INACTIVE_CONNECTION_LIFETIME",
+                        DbConfig.max_inactive_connection_lifetime,
+                    ),
+                    "command_timeout": env.float(
+                        "COMMAND_TIMEOUT", DbConfig.command_timeout
+                    ),
+                    "statement_timeout": env.float(
+                        "STATEMENT_TIMEOUT", DbConfig.statement_timeout
+                    ),
+                    "replica_hosts": env.list("REPLICA_HOSTS", []),
+                    "read_your_writes_window": env.float(
+                        "READ_YOUR_WRITES_WINDOW", DbConfig.read_your_writes_window
+                    ),
+                    "delete_batch_size": env.int(
+                        "DELETE_BATCH_SIZE", DbConfig.delete_batch_size
+                    ),
+                    "host_pool_max_size": env.int(
+                        "HOST_POOL_MAX_SIZE", DbConfig.host_pool_max_size
+                    ),
+                }
+            with env.prefixed("API_"):
+                api_vars = {
+                    "client_max_size": env.int(
+                        "CLIENT_MAX_SIZE", ApiConfig.client_max_size
+                    ),
+                    "streaming_imports": env.bool(
+                        "STREAMING_IMPORTS", ApiConfig.streaming_imports
+                    ),
+                    "import_batch_size": env.int(
+                        "IMPORT_BATCH_SIZE", ApiConfig.import_batch_size
+                    ),
+                    "fast_validation": env.bool(
+                        "FAST_VALIDATION", ApiConfig.fast_validation
+                    ),
+                    "streaming_citizens_list": env.bool(
+                        "STREAMING_CITIZENS_LIST", ApiConfig.streaming_citizens_list
+                    ),
+                    "citizens_list_batch_size": env.int(
+                        "CITIZENS_LIST_BATCH_SIZE", ApiConfig.citizens_list_batch_size
+                    ),
+                    "json_backend": env("JSON_BACKEND", ApiConfig.json_backend),
+                    "parse_workers": env.int("PARSE_WORKERS", ApiConfig.parse_workers),
+                    "parse_queue_size": env.int(
+                        "PARSE_QUEUE_SIZE", ApiConfig.parse_queue_size
+                    ),
+                    "timing": env.bool("TIMING", ApiConfig.timing),
+                    "import_jobs_concurrency": env.int(
+                        "IMPORT_JOBS_CONCURRENCY", ApiConfig.import_jobs_concurrency
+                    ),
+                    "import_jobs_queue_size": env.int(
+                        "IMPORT_JOBS_QUEUE_SIZE", ApiConfig.import_jobs_queue_size
+                    ),
+                    "purge_in_background": env.bool(
+                        "PURGE_IN_BACKGROUND", ApiConfig.purge_in_background
+                    ),
+                }
+            with env.prefixed("CACHE_"):
+                cache_vars = {
+                    "max_bytes": env.int("MAX_BYTES", CacheConfig.max_bytes),
+                    "listen": env.bool("LISTEN", CacheConfig.listen),
+                    "listen_ping_interval": env.float(
+                        "LISTEN_PING_INTERVAL", CacheConfig.listen_ping_interval
+                    ),
+                    "listen_reconnect_delay": env.float(
+                        "LISTEN_RECONNECT_DELAY", CacheConfig.listen_reconnect_delay
+                    ),
+                }
+            with env.prefixed("SERVER_"):
+                server_vars = {
+                    "workers": env.int("WORKERS", ServerConfig.workers),
+                    "worker_id": ServerConfig.worker_id,
+                    "shutdown_timeout": env.float(
+                        "SHUTDOWN_TIMEOUT", ServerConfig.shutdown_timeout
+                    ),
                 }
-                return config_vars
+        config_vars = {
+            "db": db_vars,
+            "api": api_vars,
+            "cache": cache_vars,
+            "server": server_vars,
+        }
+        return config_vars
@@ -1,8 +1,11 @@
+import datetime as dt
 import json
 from functools import partial, wraps
 
 from aiohttp import web
 
+from .metrics import timed
+
 
 def expect_json_body(view_function):
     """Декоратор для валидации входных данных на соответствие json формату.
@@ -10,17 +13,18 @@ def expect_json_body(view_function):
 
     @wraps(view_function)
     async def view_function_wrapper(self, request: web.Request):
+        body = await request.read()
         try:
-            # aiohttp обещает возвращать те же данные при повторных
-            # вызовах web.Request.json()
-            # https://docs.aiohttp.org/en/stable/web_reference.html#aiohttp.web.BaseRequest.json
-            await request.json()
-            return await view_function(self, request)
-        except json.decoder.JSONDecodeError as exc:
+            # Разобранное тело сохраняется в запросе, чтобы view
+            # не разбирала его повторно.
+            with timed("parse"):
+                request["json"] = self.serializer.loads(body)
+        except (json.decoder.JSONDecodeError, UnicodeDecodeError) as exc:
             self.logger.exception(exc)
-            return web.json_response(
+            return self.serializer.response(
                 {"error": "Expecting a valid json body. Try again."}, status=400
             )
+        return await view_function(self, request)
 
     return view_function_wrapper
 
@@ -33,7 +37,56 @@ def json_response(function=None, status=200):
         @wraps(view_function)
         async def view_function_wrapper(self, request: web.Request):
             result = await view_function(self, request)
-            return web.json_response(result, status=status)
+            with timed("serialize"):
+                return self.serializer.response(result, status=status)
+
+        return view_function_wrapper
+
+    if function and callable(function):
+        return decorator(function)
+    return decorator
+
+
+def cached_json_response(function=None, by_date=False):
+    """Сериализовать результат в json и закэшировать по версии набора данных.
+
+    Версия читается до данных, поэтому под ключом никогда не окажется ответ
+    старше версии: после изменения набора старые записи не запрашиваются.
+    Версия и данные читаются с одной реплики, иначе данные отстающей
+    реплики попали бы под новую версию.
+    Если кэш подписан на уведомления базы, версия берется из кэша.
+    С by_date в ключ входит текущая дата, для ответов, которые меняются
+    со временем без изменения набора, например возрастов.
+    """
+
+    def decorator(view_function):
+        @wraps(view_function)
+        async def view_function_wrapper(self, request: web.Request):
+            if not self.cache.max_bytes:
+                result = await view_function(self, request)
+                with timed("serialize"):
+                    return self.serializer.response(result)
+
+            import_id = int(request.match_info["import_id"])
+            with self.storage.pinned_reads():
+                version = self.cache.known_version(import_id)
+                if version is None:
+                    generation = self.cache.generation
+                    version = await self.storage.retrieve_import_version(import_id)
+                    self.cache.remember_version(import_id, version, generation)
+                endpoint = view_function.__name__
+                if by_date:
+                    endpoint = f"{endpoint}:{dt.date.today().isoformat()}"
+                key = (import_id, endpoint, version)
+                body = self.cache.get(key)
+                if body is None:
+                    result = await view_function(self, request)
+                    with timed("serialize"):
+                        body = self.serializer.dumps(result)
+                    self.cache.put(key, body)
+            return web.Response(
+                body=body, content_type="application/json", charset="utf-8"
+            )
 
         return view_function_wrapper
 
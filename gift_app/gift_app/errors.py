@@ -4,6 +4,10 @@ class InvalidUsage(Exception):
         self.message = message
         self.status_code = status_code
 
+    def __reduce__(self):
+        # Чтобы код ответа пережил передачу из пула процессов.
+        return InvalidUsage, (self.message, self.status_code)
+
     @staticmethod
     def not_found(msg="Не найдено"):
         return InvalidUsage(msg, status_code=404)
@@ -11,3 +15,7 @@ class InvalidUsage(Exception):
     @staticmethod
     def bad_request(msg="Неправильный запрос"):
         return InvalidUsage(msg, status_code=400)
+
+    @staticmethod
+    def unavailable(msg="Сервис недоступен"):
+        return InvalidUsage(msg, status_code=503)
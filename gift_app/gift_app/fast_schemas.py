@@ -0,0 +1,119 @@
+"""Быстрая загрузка импорта без marshmallow.
+
+Проверки CitizenSchema развернуты в плоский код для типичного случая:
+корректных данных ровно тех типов, что приходят из json. Все, что не
+проходит быстрые проверки, загружается обычной схемой, поэтому ошибки
+и принимаемые значения совпадают с ImportsSchema.
+"""
+import datetime as dt
+import re
+from typing import Any, List, Optional
+
+from marshmallow import ValidationError
+
+from .models import Citizen, Gender, ImportMessage
+from .schemas import CitizenSchema, ImportsSchema, collect_citizens_set_errors
+
+CITIZEN_FIELDS = frozenset(CitizenSchema().fields)
+IMPORT_FIELDS = frozenset(ImportsSchema().fields)
+GENDERS = {x.name: x for x in Gender}
+BIRTH_DATE = re.compile(r"(\d\d)\.(\d\d)\.(\d\d\d\d)", re.ASCII)
+MAX_STRING_LENGTH = 257
+
+
+class FastImportsSchema:
+    """Замена ImportsSchema с тем же интерфейсом load.
+    """
+
+    def load(self, data: Any) -> ImportMessage:
+        citizens = self._load_citizens(data)
+        if citizens is None:
+            return ImportsSchema().load(data)
+        return ImportMessage(citizens=citizens)
+
+    def load_citizen(self, data: Any) -> Citizen:
+        """Замена CitizenSchema().load для одного жителя.
+        """
+        citizen = _load_citizen(data, dt.date.today())
+        if citizen is None:
+            return CitizenSchema().load(data)
+        return citizen
+
+    def _load_citizens(self, data: Any) -> Optional[List[Citizen]]:
+        if type(data) is not dict or data.keys() != IMPORT_FIELDS:
+            return None
+        items = data["citizens"]
+        if type(items) is not list:
+            return None
+        today = dt.date.today()
+        citizens = []
+        for item in items:
+            citizen = _load_citizen(item, today)
+            if citizen is None:
+                return None
+            citizens.append(citizen)
+        errors = collect_citizens_set_errors(
+            [(citizen.citizen_id, citizen.relatives) for citizen in citizens]
+        )
+        if errors:
+            raise ValidationError({"citizens": {"_schema": errors}})
+        return citizens
+
+
+def _load_citizen(data: Any, today: dt.date) -> Optional[Citizen]:
+    """Загрузить жителя, если он проходит быстрые проверки, иначе вернуть None.
+    """
+    if type(data) is not dict or data.keys() != CITIZEN_FIELDS:
+        return None
+    citizen_id = data["citizen_id"]
+    apartment = data["apartment"]
+    if type(citizen_id) is not int or citizen_id < 0:
+        return None
+    if type(apartment) is not int or apartment < 0:
+        return None
+    town = data["town"]
+    street = data["street"]
+    building = data["building"]
+    name = data["name"]
+    for value in (town, street, building, name):
+        if type(value) is not str or not 0 < len(value) <= MAX_STRING_LENGTH:
+            return None
+    birth_date = _parse_birth_date(data["birth_date"], today)
+    if birth_date is None:
+        return None
+    gender = data["gender"]
+    if type(gender) is not str or gender not in GENDERS:
+        return None
+    relatives = data["relatives"]
+    if type(relatives) is not list:
+        return None
+    for relative in relatives:
+        if type(relative) is not int or relative < 0:
+            return None
+    return Citizen(
+        citizen_id=citizen_id,
+        town=town,
+        street=street,
+        building=building,
+        apartment=apartment,
+        name=name,
+        birth_date=birth_date,
+        gender=GENDERS[gender],
+        relatives=list(relatives),
+    )
+
+
+def _parse_birth_date(value: Any, today: dt.date) -> Optional[dt.date]:
+    if type(value) is not str:
+        return None
+    match = BIRTH_DATE.fullmatch(value)
+    if not match:
+        return None
+    day, month, year = match.groups()
+    try:
+        birth_date = dt.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+    if birth_date >= today:
+        return None
+    return birth_date
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional, Set
+
+from injector import inject
+from marshmallow import ValidationError
+
+from .config import Config
+from .errors import InvalidUsage
+from .models import Citizen, JobStatus
+from .parsing import ImportParser
+from .storage import Storage
+
+
+@inject
+class ImportJobs:
+    """Очередь асинхронных импортов.
+
+    Принятое тело ждет в ограниченной очереди, а import_jobs_concurrency
+    задач по очереди разбирают его в пуле процессов ImportParser, дожидаясь
+    места в очереди разбора, и грузят жителей пачками. Состояние и прогресс
+    заданий хранятся в базе, поэтому задание можно опрашивать через любой
+    процесс сервера. Сколько импортов грузится в базу одновременно,
+    ограничено числом задач.
+
+    Здесь же по одному в фоне удаляются строки скрытых наборов данных.
+    Удаления, прерванные остановкой, доделывает manage purge-imports.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        parser: ImportParser,
+        config: Config,
+        logger: logging.Logger,
+    ):
+        self.storage = storage
+        self.parser = parser
+        self.config = config
+        self.logger = logger
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Set[int] = set()
+        self._purges: Optional[asyncio.Queue] = None
+
+    def start(self):
+        api = self.config.api
+        self._queue = asyncio.Queue(maxsize=api.import_jobs_queue_size)
+        self._workers = [
+            asyncio.ensure_future(self._work())
+            for _ in range(api.import_jobs_concurrency)
+        ]
+        self._purges = asyncio.Queue()
+        self._workers.append(asyncio.ensure_future(self._purge_work()))
+
+    async def stop(self):
+        """Остановить задачи, а незавершенные задания пометить неудавшимися.
+
+        Тела заданий хранятся только в памяти, продолжить их после
+        перезапуска нельзя.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        job_ids = set(self._running)
+        while self._queue and not self._queue.empty():
+            job_id, _ = self._queue.get_nowait()
+            job_ids.add(job_id)
+        for job_id in sorted(job_ids):
+            await self._fail(job_id, "Server is shutting down. Try again.")
+        self._running.clear()
+
+    async def submit(self, body: bytes) -> int:
+        """Поставить импорт в очередь и вернуть номер задания.
+        """
+        if self._queue is None or self._queue.full():
+            raise InvalidUsage.unavailable("Too many import jobs. Try again later.")
+        job_id = await self.storage.create_import_job()
+        try:
+            self._queue.put_nowait((job_id, body))
+        except asyncio.QueueFull:
+            # Очередь заполнилась, пока создавалось задание.
+            await self._fail(job_id, "Too many import jobs. Try again later.")
+            raise InvalidUsage.unavailable("Too many import jobs. Try again later.")
+        return job_id
+
+    def purge_later(self, import_id: int):
+        """Удалить строки скрытого набора данных в фоне.
+        """
+        self._purges.put_nowait(import_id)
+
+    async def _purge_work(self):
+        while True:
+            import_id = await self._purges.get()
+            try:
+                await self.storage.purge_import(import_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.logger.exception(exc)
+            finally:
+                self._purges.task_done()
+
+    async def _work(self):
+        while True:
+            job_id, body = await self._queue.get()
+            self._running.add(job_id)
+            try:
+                await self._run(job_id, body)
+            except asyncio.CancelledError:
+                # Задание остается в _running, его пометит stop.
+                raise
+            except Exception as exc:
+                # Например, база недоступна и состояние не записать.
+                self.logger.exception(exc)
+            finally:
+                self._queue.task_done()
+            self._running.discard(job_id)
+
+    async def _run(self, job_id: int, body: bytes):
+        await self.storage.update_import_job(job_id, status=JobStatus.running)
+        try:
+            citizens = await self.parser.parse_citizens(body, wait=True)
+            await self.storage.update_import_job(
+                job_id, citizens_validated=len(citizens)
+            )
+            import_id = await self.storage.import_citizens_stream(
+                self._batches(job_id, citizens)
+            )
+        except asyncio.CancelledError:
+            raise
+        except ValidationError as exc:
+            await self._fail(job_id, exc.normalized_messages())
+        except InvalidUsage as exc:
+            await self._fail(job_id, exc.message)
+        except Exception as exc:
+            self.logger.exception(exc)
+            await self._fail(job_id, "Server got itself in trouble")
+        else:
+            await self.storage.update_import_job(
+                job_id, status=JobStatus.done, import_id=import_id
+            )
+
+    async def _batches(
+        self, job_id: int, citizens: List[Citizen]
+    ) -> AsyncIterator[List[Citizen]]:
+        """Отдавать жителей пачками, отмечая прогресс после каждой записанной.
+        """
+        batch_size = self.config.api.import_batch_size
+        for start in range(0, len(citizens), batch_size):
+            yield citizens[start : start + batch_size]
+            inserted = min(start + batch_size, len(citizens))
+            await self.storage.update_import_job(job_id, citizens_inserted=inserted)
+
+    async def _fail(self, job_id: int, error):
+        try:
+            await self.storage.update_import_job(
+                job_id, status=JobStatus.failed, error=error
+            )
+        except Exception as exc:
+            self.logger.exception(exc)
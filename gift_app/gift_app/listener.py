@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from injector import inject
+
+from .cache import ResponseCache
+from .config import Config
+from .storage import Storage
+
+
+@inject
+class ImportsListener:
+    """Подписка на уведомления базы об изменениях наборов данных.
+
+    Держит LISTEN соединение из пула и сбрасывает записи локального кэша
+    об измененных наборах, а сами наборы на время читает с основной базы.
+    Пока подписки нет, кэш не доверяет запомненным версиям и сверяет версию
+    с базой на каждом запросе.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        cache: ResponseCache,
+        config: Config,
+        logger: logging.Logger,
+    ):
+        self.storage = storage
+        self.cache = cache
+        self.config = config
+        self.logger = logger
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.storage.listen_imports(
+                    self._on_notification,
+                    on_listen=self._on_listen,
+                    ping_interval=self.config.cache.listen_ping_interval,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.logger.warning("Imports listener is disconnected: %r", exc)
+            finally:
+                self.cache.stop_tracking()
+            await asyncio.sleep(self.config.cache.listen_reconnect_delay)
+
+    def _on_notification(self, import_id: int, version: int):
+        self.cache.set_version(import_id, version)
+        # Изменение могло прийти с другой реплики приложения.
+        self.storage.mark_import_written(import_id)
+
+    def _on_listen(self):
+        self.logger.info("Imports listener is connected")
+        self.cache.start_tracking()
@@ -0,0 +1,139 @@
+"""Время обработки запросов по фазам: разбор, валидация, ожидание пула,
+работа с базой, сериализация.
+
+Фазы текущего запроса копятся в contextvar, который выставляет timing
+middleware, поэтому хукам в Storage и декораторах не нужен сам запрос.
+Вне запроса, например в заданиях импорта, замеры никуда не пишутся.
+"""
+import bisect
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from injector import inject
+
+from .config import Config
+
+_request_timings = ContextVar(
+    "request_timings", default=None
+)  # type: ContextVar[Optional[Dict[str, float]]]
+
+# Верхние границы корзин гистограмм, секунд.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Собирать фазы, замеренные внутри блока, в отдаваемый словарь.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def record(phase: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - started)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Значение заголовка Server-Timing, длительности в миллисекундах.
+    """
+    return ", ".join(
+        f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items()
+    )
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        # Последняя корзина - значения больше BUCKETS[-1].
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+@inject
+class Metrics:
+    """Гистограммы фаз по маршрутам в формате Prometheus.
+
+    У каждого процесса сервера свои метрики, они помечены меткой worker.
+    """
+
+    def __init__(self, config: Config):
+        self.worker = str(config.server.worker_id)
+        self._phases: Dict[Tuple[str, str, str], Histogram] = {}
+        self._requests: Counter = Counter()
+
+    def observe_request(
+        self, method: str, route: str, status: int, timings: Dict[str, float]
+    ):
+        self._requests[method, route, status] += 1
+        for phase, seconds in timings.items():
+            key = (method, route, phase)
+            histogram = self._phases.get(key)
+            if histogram is None:
+                histogram = self._phases[key] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP gift_app_requests_total Handled requests.",
+            "# TYPE gift_app_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self._requests.items()):
+            labels = self._labels(method=method, route=route, status=str(status))
+            lines.append(f"gift_app_requests_total{{{labels}}} {count}")
+        lines += [
+            "# HELP gift_app_request_phase_seconds Time spent in request phases.",
+            "# TYPE gift_app_request_phase_seconds histogram",
+        ]
+        for (method, route, phase), histogram in sorted(self._phases.items()):
+            lines += self._render_histogram(
+                "gift_app_request_phase_seconds",
+                histogram,
+                method=method,
+                route=route,
+                phase=phase,
+            )
+        return "\n".join(lines) + "\n"
+
+    def _render_histogram(self, name: str, histogram: Histogram, **labels) -> List[str]:
+        lines = []
+        cumulative = 0
+        bounds = [*(str(x) for x in BUCKETS), "+Inf"]
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            bucket_labels = self._labels(**labels, le=bound)
+            lines.append(f"{name}_bucket{{{bucket_labels}}} {cumulative}")
+        labels = self._labels(**labels)
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return lines
+
+    def _labels(self, **labels) -> str:
+        labels = {"worker": self.worker, **labels}
+        return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,24 +1,27 @@
 import logging
 import inspect
+import time
 
 from aiohttp import web
 from marshmallow import ValidationError
 
 from .errors import InvalidUsage
+from .metrics import Metrics, collect_timings, server_timing
+from .serialization import JsonSerializer
 
 
-def create_error_middleware(logger: logging.Logger):
+def create_error_middleware(logger: logging.Logger, serializer: JsonSerializer):
     @web.middleware
     async def error_middleware(request: web.Request, handler):
         try:
             response = await handler(request)
             return response
         except ValidationError as exc:
-            return web.json_response({"error": exc.normalized_messages()}, status=400)
+            return serializer.response({"error": exc.normalized_messages()}, status=400)
         except InvalidUsage as exc:
-            return web.json_response({"error": exc.message}, status=exc.status_code)
+            return serializer.response({"error": exc.message}, status=exc.status_code)
         except web.HTTPError as exc:
-            return web.json_response({"error": exc.reason}, status=exc.status_code)
+            return serializer.response({"error": exc.reason}, status=exc.status_code)
         except Exception as exc:
             logger.info("error headers start")
             logger.info(request.headers)
@@ -35,8 +38,32 @@ def create_error_middleware(logger: logging.Logger):
 
             logger.exception(exc)
 
-            return web.json_response(
+            return serializer.response(
                 {"error": "Server got itself in trouble"}, status=500
             )
 
     return error_middleware
+
+
+def create_timing_middleware(metrics: Metrics):
+    """Замерить запрос по фазам, записать в метрики и вернуть в Server-Timing.
+
+    Должна стоять перед error_middleware, чтобы замерялись и ответы с ошибками.
+    """
+
+    @web.middleware
+    async def timing_middleware(request: web.Request, handler):
+        started = time.perf_counter()
+        with collect_timings() as timings:
+            response = await handler(request)
+        timings["total"] = time.perf_counter() - started
+        resource = request.match_info.route.resource
+        # Шаблон маршрута, а не путь: иначе метки размножатся по import_id.
+        route = resource.canonical if resource else "unmatched"
+        metrics.observe_request(request.method, route, response.status, timings)
+        # У потоковых ответов заголовки уже отправлены.
+        if not response.prepared:
+            response.headers["Server-Timing"] = server_timing(timings)
+        return response
+
+    return timing_middleware
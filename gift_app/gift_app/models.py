@@ -1,7 +1,7 @@
 import datetime as dt
 import enum
 from dataclasses import dataclass, field
-from typing import List
+from typing import Any, List, Optional
 
 
 class Gender(enum.Enum):
@@ -36,3 +36,21 @@ class TownAgeStat:
     p50: float
     p75: float
     p99: float
+
+
+class JobStatus(enum.Enum):
+    pending = enum.auto()
+    running = enum.auto()
+    done = enum.auto()
+    failed = enum.auto()
+
+
+@dataclass
+class ImportJob:
+    job_id: int
+    status: JobStatus
+    citizens_validated: int
+    citizens_inserted: int
+    import_id: Optional[int] = None
+    # Текст ошибки или ошибки валидации в том же виде, что и в ответе 400.
+    error: Any = None
@@ -0,0 +1,163 @@
+"""Разбор и валидация тела импорта в пуле процессов.
+
+Разбор json и проверки схемы импорта на 100 тысяч жителей занимают секунды
+CPU, и на это время цикл событий не обслуживает другие запросы. В пул
+процессов уходят сырые байты тела, а обратно приходят кортежи значений
+жителей: их сериализация дешевле, чем у объектов Citizen.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from json import JSONDecodeError
+from typing import List, Optional, Tuple
+
+from injector import inject
+
+from .config import Config
+from .errors import InvalidUsage
+from .fast_schemas import FastImportsSchema
+from .metrics import timed
+from .models import Citizen, Gender
+from .schemas import ImportsSchema
+from .serialization import create_serializer
+
+CitizenTuple = Tuple[int, str, str, str, int, str, object, str, List[int]]
+
+
+def parse_import(
+    body: bytes, fast_validation: bool, json_backend: str
+) -> List[CitizenTuple]:
+    """Разобрать и провалидировать тело POST /imports.
+
+    Выполняется в процессе пула, поэтому ошибки поднимаются такими, что
+    переживают pickle: ValidationError и InvalidUsage.
+    """
+    try:
+        data = create_serializer(json_backend).loads(body)
+    except (JSONDecodeError, UnicodeDecodeError):
+        raise InvalidUsage.bad_request("Expecting a valid json body. Try again.")
+    if fast_validation:
+        schema = FastImportsSchema()
+    else:
+        schema = ImportsSchema()
+    import_message = schema.load(data)
+    return [
+        (
+            x.citizen_id,
+            x.town,
+            x.street,
+            x.building,
+            x.apartment,
+            x.name,
+            x.birth_date,
+            x.gender.name,
+            x.relatives,
+        )
+        for x in import_message.citizens
+    ]
+
+
+def citizen_from_tuple(values: CitizenTuple) -> Citizen:
+    *fields, gender, relatives = values
+    return Citizen(*fields, gender=Gender[gender], relatives=relatives)
+
+
+def _warm_up():
+    """Пустая задача, чтобы пул запустил процессы заранее.
+    """
+
+
+@inject
+class ImportParser:
+    """Пул процессов для разбора импортов.
+
+    Одновременно разбирается или ждет очереди не больше parse_queue_size
+    импортов, остальным сразу отвечаем 503: тела ждущих импортов держатся
+    в памяти целиком. Задания импорта вместо 503 ждут места: их тела уже
+    лежат в очереди заданий.
+
+    POST /imports разбирается в пуле, только если задан parse_workers.
+    Задания разбираются в пуле всегда, чтобы валидация не делила GIL
+    с циклом событий: без parse_workers пул из одного процесса запускается
+    при первом задании.
+    """
+
+    def __init__(self, config: Config, logger: logging.Logger):
+        self.config = config
+        self.logger = logger
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._slot_freed = asyncio.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.api.parse_workers > 0
+
+    async def start(self):
+        if not self.enabled:
+            return
+        self._executor = self._create_executor()
+        await asyncio.get_event_loop().run_in_executor(self._executor, _warm_up)
+
+    async def stop(self):
+        if not self._executor:
+            return
+        executor, self._executor = self._executor, None
+        # shutdown ждет процессы и заблокировал бы цикл событий.
+        await asyncio.get_event_loop().run_in_executor(None, executor.shutdown)
+
+    async def parse_citizens(self, body: bytes, wait: bool = False) -> List[Citizen]:
+        """Разобрать тело импорта в пуле процессов.
+
+        При заполненной очереди разбора отвечает 503, а с wait ждет места.
+        """
+        api = self.config.api
+        if self._in_flight >= api.parse_queue_size:
+            if not wait:
+                raise InvalidUsage.unavailable(
+                    "Too many imports in progress. Try again later."
+                )
+            async with self._slot_freed:
+                await self._slot_freed.wait_for(
+                    lambda: self._in_flight < api.parse_queue_size
+                )
+        self._in_flight += 1
+        if self._executor is None:
+            self._executor = self._create_executor()
+        executor = self._executor
+        try:
+            # Вместе с валидацией и ожиданием свободного процесса.
+            with timed("parse"):
+                rows = await asyncio.get_event_loop().run_in_executor(
+                    executor, parse_import, body, api.fast_validation, api.json_backend
+                )
+        except BrokenProcessPool as exc:
+            # Процесс пула убит, например, по памяти - пул больше не примет задач.
+            self.logger.exception(exc)
+            self._replace_executor(executor)
+            raise InvalidUsage.unavailable("Import parser crashed. Try again later.")
+        finally:
+            self._in_flight -= 1
+            async with self._slot_freed:
+                self._slot_freed.notify()
+        citizens = [citizen_from_tuple(x) for x in rows]
+        return citizens
+
+    def _replace_executor(self, broken: ProcessPoolExecutor):
+        """Заменить сломавшийся пул, если его еще не заменил другой запрос.
+        """
+        if self._executor is not broken:
+            return
+        self._executor = self._create_executor()
+        # Сломанный пул уже не ждет процессов, shutdown не блокирует.
+        broken.shutdown(wait=False)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn, а не fork: при fork процесса с потоками и открытыми
+        # соединениями дочерний процесс может унаследовать захваченные блокировки.
+        return ProcessPoolExecutor(
+            max(self.config.api.parse_workers, 1),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
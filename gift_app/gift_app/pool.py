@@ -0,0 +1,95 @@
+import time
+
+import asyncpg
+from asyncpgsa.transactionmanager import ConnectionTransactionContextManager
+
+from .metrics import record
+
+
+class MonitoredPool:
+    """Обертка пула asyncpg, считающая занятые соединения и время ожидания.
+
+    Все соединения приложения берутся через acquire и transaction,
+    остальные атрибуты пула доступны как есть.
+    """
+
+    def __init__(self, pool: asyncpg.pool.Pool, min_size: int, max_size: int):
+        self._pool = pool
+        self.min_size = min_size
+        self.max_size = max_size
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def acquire(self, *, timeout=None):
+        return _MonitoredAcquireContext(self, timeout)
+
+    def transaction(self, **kwargs):
+        return ConnectionTransactionContextManager(self, **kwargs)
+
+    def stats(self) -> dict:
+        size = self._size()
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "in_use": self.in_use,
+            "idle": max(size - self.in_use, 0),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "wait_time_total": round(self.wait_time_total, 6),
+            "wait_time_avg": round(self.wait_time_total / (self.acquired or 1), 6),
+            "wait_time_max": round(self.wait_time_max, 6),
+        }
+
+    def _size(self) -> int:
+        if hasattr(self._pool, "get_size"):
+            return self._pool.get_size()
+        # В старых версиях asyncpg нет get_size.
+        return sum(1 for holder in self._pool._holders if holder._con is not None)
+
+    def _record_acquire(self, wait_time: float):
+        self.in_use += 1
+        self.acquired += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+
+class _MonitoredAcquireContext:
+    """Заодно пишет в фазы запроса ожидание пула и время, пока соединение
+    занято, как "pool" и "db".
+    """
+
+    __slots__ = ("monitor", "timeout", "context", "acquired_at")
+
+    def __init__(self, monitor: MonitoredPool, timeout):
+        self.monitor = monitor
+        self.timeout = timeout
+        self.context = None
+        self.acquired_at = 0.0
+
+    async def __aenter__(self):
+        started = time.monotonic()
+        self.monitor.waiting += 1
+        try:
+            self.context = self.monitor._pool.acquire(timeout=self.timeout)
+            connection = await self.context.__aenter__()
+        finally:
+            self.monitor.waiting -= 1
+        self.acquired_at = time.monotonic()
+        wait_time = self.acquired_at - started
+        self.monitor._record_acquire(wait_time)
+        record("pool", wait_time)
+        return connection
+
+    async def __aexit__(self, *exc):
+        self.monitor.in_use -= 1
+        try:
+            await self.context.__aexit__(*exc)
+        finally:
+            record("db", time.monotonic() - self.acquired_at)
@@ -4,8 +4,14 @@ import logging.config
 from aiohttp import web
 from injector import Module, provider, singleton
 
+from .cache import ResponseCache
 from .config import Config
-from .middleware import create_error_middleware
+from .jobs import ImportJobs
+from .listener import ImportsListener
+from .metrics import Metrics
+from .middleware import create_error_middleware, create_timing_middleware
+from .parsing import ImportParser
+from .serialization import JsonSerializer, create_serializer
 from .storage import Storage
 from .views import ImportsView
 
@@ -44,6 +50,45 @@ class ApplicationModule(Module):
         storage = Storage(config, logger)
         return storage
 
+    @singleton
+    @provider
+    def provide_cache(self, config: Config) -> ResponseCache:
+        cache = ResponseCache(config.cache.max_bytes)
+        return cache
+
+    @singleton
+    @provider
+    def provide_serializer(self, config: Config) -> JsonSerializer:
+        serializer = create_serializer(config.api.json_backend)
+        return serializer
+
+    @singleton
+    @provider
+    def provide_metrics(self, config: Config) -> Metrics:
+        metrics = Metrics(config)
+        return metrics
+
+    @singleton
+    @provider
+    def provide_import_parser(
+        self, config: Config, logger: logging.Logger
+    ) -> ImportParser:
+        # Один пул процессов на приложение: парсер нужен и view, и хукам запуска.
+        parser = ImportParser(config, logger)
+        return parser
+
+    @singleton
+    @provider
+    def provide_import_jobs(
+        self,
+        storage: Storage,
+        parser: ImportParser,
+        config: Config,
+        logger: logging.Logger,
+    ) -> ImportJobs:
+        jobs = ImportJobs(storage, parser, config, logger)
+        return jobs
+
     @singleton
     @provider
     def provide_app(
@@ -52,17 +97,35 @@ class ApplicationModule(Module):
         storage: Storage,
         logger: logging.Logger,
         imports_views: ImportsView,
+        imports_listener: ImportsListener,
+        import_parser: ImportParser,
+        import_jobs: ImportJobs,
+        serializer: JsonSerializer,
+        metrics: Metrics,
     ) -> web.Application:
         logger.info(config)
+        middlewares = [create_error_middleware(logger, serializer)]
+        if config.api.timing:
+            middlewares.insert(0, create_timing_middleware(metrics))
         app = web.Application(
-            middlewares=[create_error_middleware(logger)], logger=logger, client_max_size=2**20 * 100  # 100 mB
+            middlewares=middlewares,
+            logger=logger,
+            client_max_size=config.api.client_max_size,
         )
         app.router.add_routes(
             [
                 web.post("/imports", imports_views.import_citizens),
+                web.post("/imports/jobs", imports_views.create_import_job),
+                web.get(
+                    "/imports/jobs/{job_id:\d+}", imports_views.retrieve_import_job
+                ),
+                web.delete("/imports/{import_id:\d+}", imports_views.delete_import),
                 web.get(
                     "/imports/{import_id:\d+}/citizens", imports_views.list_citizens
                 ),
+                web.patch(
+                    "/imports/{import_id:\d+}/citizens", imports_views.update_citizens
+                ),
                 web.patch(
                     "/imports/{import_id:\d+}/citizens/{citizen_id:\d+}",
                     imports_views.update_citizen,
@@ -76,6 +139,10 @@ class ApplicationModule(Module):
                     imports_views.retrieve_age_stats,
                 ),
                 web.get("/x/version", imports_views.retrieve_version),
+                web.get("/x/health", imports_views.retrieve_health),
+                web.get("/x/metrics", imports_views.retrieve_metrics),
+                web.get("/x/cache", imports_views.retrieve_cache_stats),
+                web.get("/x/pool", imports_views.retrieve_pool_stats),
                 web.post("/x/problem", imports_views.create_a_problem),
             ]
         )
@@ -83,5 +150,39 @@ class ApplicationModule(Module):
         async def init_storage(app):
             await storage.initialize()
 
+        async def start_parser(app):
+            await import_parser.start()
+
+        async def stop_parser(app):
+            await import_parser.stop()
+
+        async def start_jobs(app):
+            import_jobs.start()
+
+        async def stop_jobs(app):
+            await import_jobs.stop()
+
         app.on_startup.append(init_storage)
+        app.on_startup.append(start_parser)
+        app.on_startup.append(start_jobs)
+        # Задания пользуются парсером, поэтому останавливаются раньше него.
+        app.on_cleanup.append(stop_jobs)
+        app.on_cleanup.append(stop_parser)
+
+        if config.cache.listen and config.cache.max_bytes:
+
+            async def start_listener(app):
+                imports_listener.start()
+
+            async def stop_listener(app):
+                await imports_listener.stop()
+
+            app.on_startup.append(start_listener)
+            app.on_cleanup.append(stop_listener)
+
+        # Последним: подписка на уведомления держит соединение из пула.
+        async def close_storage(app):
+            await storage.close()
+
+        app.on_cleanup.append(close_storage)
         return app
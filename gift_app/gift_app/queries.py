@@ -0,0 +1,37 @@
+from typing import List, Tuple
+
+from asyncpgsa.connection import get_dialect
+from sqlalchemy.sql import ClauseElement
+
+_dialect = get_dialect()
+
+
+class CompiledQuery:
+    """SQLAlchemy запрос, один раз скомпилированный в SQL с параметрами $n.
+
+    Значения параметров передаются по именам sa.bindparam, остальные
+    параметры запроса (константы) берутся из компиляции. Готовый SQL
+    asyncpgsa передает asyncpg без изменений, а asyncpg подготавливает
+    его один раз на соединение и дальше берет из кэша запросов.
+    """
+
+    def __init__(self, query: ClauseElement):
+        compiled = query.compile(dialect=_dialect)
+        # Тот же порядок параметров, что и у asyncpgsa.compile_query.
+        self._names = sorted(compiled.params)
+        mapping = {name: f"${i}" for i, name in enumerate(self._names, start=1)}
+        self.sql = compiled.string % mapping
+        self._defaults = compiled.params
+        self._processors = compiled._bind_processors
+
+    def bind(self, **values) -> Tuple[str, List]:
+        """Вернуть SQL и список значений параметров.
+
+        Значения передаются отдельными параметрами: conn.fetch(sql, *args).
+        """
+        args = []
+        for name in self._names:
+            value = values[name] if name in values else self._defaults[name]
+            processor = self._processors.get(name)
+            args.append(processor(value) if processor else value)
+        return (self.sql, args)
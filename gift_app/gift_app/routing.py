@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .pool import MonitoredPool
+
+_pinned_replicas = ContextVar(
+    "pinned_replicas", default=None
+)  # type: ContextVar[Optional[Dict[int, Optional[MonitoredPool]]]]
+
+
+class ReadRouter:
+    """Выбор реплики для чтения набора данных.
+
+    Чтения распределяются по репликам по кругу. Набор, измененный менее
+    window секунд назад, читается с основной базы (для него возвращается
+    None), чтобы реплики с задержкой репликации не отдали старые данные.
+    Внутри pinned набор читается с той же базы, что и в первый раз.
+    """
+
+    def __init__(
+        self,
+        replicas: List[MonitoredPool],
+        window: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.replicas = replicas
+        self.window = window
+        self._clock = clock
+        self._next = 0
+        # import_id -> время изменения, в порядке изменения.
+        self._written = OrderedDict()
+
+    def mark_written(self, import_id: int):
+        now = self._clock()
+        self._written.pop(import_id, None)
+        self._written[import_id] = now
+        self._forget_expired(now)
+        pinned = _pinned_replicas.get()
+        if pinned is not None:
+            pinned.pop(import_id, None)
+
+    @contextmanager
+    def pinned(self) -> Iterator[None]:
+        """Читать каждый набор внутри блока с одной и той же базы.
+
+        Иначе версия набора и данные под нее придут с разных реплик,
+        и данные отстающей реплики попадут в кэш под новой версией.
+        """
+        token = _pinned_replicas.set({})
+        try:
+            yield
+        finally:
+            _pinned_replicas.reset(token)
+
+    def replica_for_read(self, import_id: int) -> Optional[MonitoredPool]:
+        if not self.replicas:
+            return None
+        now = self._clock()
+        self._forget_expired(now)
+        if import_id in self._written:
+            return None
+        pinned = _pinned_replicas.get()
+        if pinned is not None and import_id in pinned:
+            return pinned[import_id]
+        replica = self.replicas[self._next % len(self.replicas)]
+        self._next += 1
+        if pinned is not None:
+            pinned[import_id] = replica
+        return replica
+
+    def _forget_expired(self, now: float):
+        while self._written:
+            import_id, written_at = next(iter(self._written.items()))
+            if now - written_at < self.window:
+                break
+            del self._written[import_id]
@@ -1,5 +1,7 @@
 import datetime as dt
 from functools import partial
+from itertools import chain
+from typing import Iterable, List, Mapping, Tuple
 
 from marshmallow import (
     Schema,
@@ -10,9 +12,10 @@ from marshmallow import (
     validates,
     validates_schema,
 )
+import numpy as np
 
 from .fields import EnumField
-from .models import Citizen, Gender, ImportMessage
+from .models import Citizen, Gender, ImportMessage, JobStatus
 
 NonEmptyString = partial(fields.String, validate=[validate.Length(min=1, max=257)])
 NonNegativeInteger = partial(fields.Integer, validate=[validate.Range(min=0)])
@@ -23,7 +26,156 @@ def _vaildate_birth_date(birth_date: dt.date):
         raise ValidationError("Дата рождения должна быть меньше текущей даты.")
 
 
-BirthDate = partial(fields.Date, format="%d.%m.%Y", validate=[_vaildate_birth_date])
+BIRTH_DATE_FORMAT = "%d.%m.%Y"
+
+BirthDate = partial(
+    fields.Date, format=BIRTH_DATE_FORMAT, validate=[_vaildate_birth_date]
+)
+
+# Ребро (житель, родственник) упаковывается в одно int64 число.
+MAX_VECTORIZED_ID = 2 ** 31
+
+
+def check_relatives_graph(citizens: Iterable[Tuple[int, List[int]]]):
+    """Проверить граф родственных связей, заданный парами (citizen_id, relatives).
+
+    Ребра упаковываются в массивы int64. Граф корректен, если отсортированные
+    прямые ребра без повторов совпадают с отсортированными обратными.
+    Иначе первый житель с ошибкой ищется бинарным поиском, а сообщение
+    строится по тому же родственнику, что и при обходе графа в цикле.
+    """
+    citizens = list(citizens)
+    if not citizens:
+        return
+    try:
+        ids = np.fromiter((x for x, _ in citizens), dtype=np.int64, count=len(citizens))
+        lengths = np.fromiter(
+            (len(x) for _, x in citizens), dtype=np.int64, count=len(citizens)
+        )
+        relatives = np.fromiter(
+            chain.from_iterable(x for _, x in citizens),
+            dtype=np.int64,
+            count=int(lengths.sum()),
+        )
+    except OverflowError:
+        return _check_relatives_graph_naive(citizens)
+    sorted_ids = np.sort(ids)
+    max_id = max(sorted_ids[-1], relatives.max(initial=0))
+    if (
+        sorted_ids[0] < 0
+        or relatives.min(initial=0) < 0
+        or max_id >= MAX_VECTORIZED_ID
+        or (sorted_ids[1:] == sorted_ids[:-1]).any()
+    ):
+        # Редкие случаи, которые не укладываются в упаковку ребер
+        # в int64 или зависят от порядка перезаписи повторных citizen_id.
+        return _check_relatives_graph_naive(citizens)
+
+    key_base = int(max_id) + 1
+    sources = np.repeat(ids, lengths)
+    forward = np.sort(sources * key_base + relatives)
+    backward = np.sort(relatives * key_base + sources)
+    if not (forward[1:] == forward[:-1]).any() and (forward == backward).all():
+        # Ребра без повторов совпадают с обратными: граф симметричен,
+        # а значит, и все родственники есть в наборе.
+        return
+
+    positions = np.repeat(np.arange(len(citizens), dtype=np.int64), lengths)
+
+    # Повторы родственников у одного жителя.
+    edges = np.sort(positions * key_base + relatives)
+    repeated = edges[1:][edges[1:] == edges[:-1]]
+    if len(repeated):
+        citizen_id, relatives_list = citizens[int(repeated.min() // key_base)]
+        raise ValidationError(
+            f"У жителя #{citizen_id} повторяются родственники: {relatives_list}"
+        )
+
+    # Отсутствующие и несимметричные связи.
+    broken = ~_sorted_contains(sorted_ids, relatives) | ~_sorted_contains(
+        forward, relatives * key_base + sources
+    )
+    position = int(positions[broken].min())
+    _check_citizen_relatives(citizens, ids, position)
+
+
+def _sorted_contains(sorted_values: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Для каждого из values проверить, есть ли оно в отсортированном массиве.
+    """
+    indexes = np.searchsorted(sorted_values, values)
+    indexes[indexes == len(sorted_values)] = 0
+    return sorted_values[indexes] == values
+
+
+def _check_citizen_relatives(
+    citizens: List[Tuple[int, List[int]]], ids: np.ndarray, position: int
+):
+    """Повторить проверки цикла для одного жителя, чтобы получить то же сообщение.
+    """
+    order = np.argsort(ids)
+    sorted_ids = ids[order]
+    citizen, citizen_relatives = citizens[position]
+    for relative in set(citizen_relatives):
+        index = int(np.searchsorted(sorted_ids, relative))
+        if index == len(sorted_ids) or sorted_ids[index] != relative:
+            raise ValidationError(
+                f"У жителя #{citizen} не найден родственник #{relative}."
+            )
+        _, relative_relatives = citizens[int(order[index])]
+        if citizen not in relative_relatives:
+            raise ValidationError(
+                f"Родственник #{relative} жителя #{citizen} не признает его своим."
+            )
+
+
+def _check_relatives_graph_naive(citizens: Iterable[Tuple[int, List[int]]]):
+    """Проверить граф родственных связей обходом в цикле.
+    """
+    relatives_graph = {}
+    for citizen_id, relatives_list in citizens:
+        relatives = set(relatives_list)
+        if len(relatives) != len(relatives_list):
+            raise ValidationError(
+                f"У жителя #{citizen_id} повторяются родственники: {relatives_list}"
+            )
+        relatives_graph[citizen_id] = relatives
+    for citizen, citizen_relatives in relatives_graph.items():
+        for relative in citizen_relatives:
+            if relative not in relatives_graph:
+                raise ValidationError(
+                    f"У жителя #{citizen} не найден родственник #{relative}."
+                )
+            relative_relatives = relatives_graph[relative]
+            if citizen not in relative_relatives:
+                raise ValidationError(
+                    f"Родственник #{relative} жителя #{citizen} не признает его своим."
+                )
+
+
+def check_citizens_ids_unique(ids: Iterable[int]):
+    """Проверить, что citizen_id не повторяются.
+    """
+    ids = list(ids)
+    if len(ids) != len(set(ids)):
+        raise ValidationError(f"citizen_id жителей не могут повторяться.")
+
+
+def collect_citizens_set_errors(citizens: List[Tuple[int, List[int]]]) -> List[str]:
+    """Выполнить проверки всего набора жителей в том же порядке, что и CitizenSchema.
+
+    Возвращает список сообщений об ошибках.
+    """
+    messages = []
+    checks = [
+        (check_citizens_ids_unique, (citizen_id for citizen_id, _ in citizens)),
+        (check_relatives_graph, citizens),
+    ]
+    for check, arg in checks:
+        try:
+            check(arg)
+        except ValidationError as exc:
+            messages.extend(exc.messages)
+    return messages
 
 
 class CitizenSchema(Schema):
@@ -49,26 +201,7 @@ class CitizenSchema(Schema):
         """
         if not many:
             return data
-        relatives_graph = {}
-        for x in data:
-            relatives = set(x["relatives"])
-            citizen_id = x["citizen_id"]
-            if len(relatives) != len(x["relatives"]):
-                raise ValidationError(
-                    f"У жителя #{citizen_id} повторяются родственники: {x['relatives']}"
-                )
-            relatives_graph[citizen_id] = relatives
-        for citizen, citizen_relatives in relatives_graph.items():
-            for relative in citizen_relatives:
-                if relative not in relatives_graph:
-                    raise ValidationError(
-                        f"У жителя #{citizen} не найден родственник #{relative}."
-                    )
-                relative_relatives = relatives_graph[relative]
-                if citizen not in relative_relatives:
-                    raise ValidationError(
-                        f"Родственник #{relative} жителя #{citizen} не признает его своим."
-                    )
+        check_relatives_graph((x["citizen_id"], x["relatives"]) for x in data)
 
     @validates_schema(pass_many=True)
     def validate_citizens_ids_unique(self, data, many=False, **kwargs):
@@ -76,15 +209,33 @@ class CitizenSchema(Schema):
         """
         if not many:
             return data
-        ids = [x["citizen_id"] for x in data]
-        if len(ids) != len(set(ids)):
-            raise ValidationError(f"citizen_id жителей не могут повторяться.")
+        check_citizens_ids_unique(x["citizen_id"] for x in data)
 
     @post_load
     def make_citizen(self, data, **kw):
         return Citizen(**data)
 
 
+def dump_citizen(values: Mapping) -> dict:
+    """Сериализовать жителя так же, как CitizenSchema.dump, но без marshmallow.
+
+    values - строка из базы или vars(citizen).
+    """
+    gender = values["gender"]
+    return {
+        "citizen_id": values["citizen_id"],
+        "town": values["town"],
+        "street": values["street"],
+        "building": values["building"],
+        "apartment": values["apartment"],
+        "name": values["name"],
+        "birth_date": values["birth_date"].strftime(BIRTH_DATE_FORMAT),
+        # На соединениях без кодека для citizen_gender пол приходит строкой.
+        "gender": gender if isinstance(gender, str) else gender.name,
+        "relatives": values["relatives"] or [],
+    }
+
+
 class CitizenUpdateSchema(Schema):
     town = NonEmptyString()
     street = NonEmptyString()
@@ -101,6 +252,25 @@ class CitizenUpdateSchema(Schema):
             raise ValidationError(f"Список родственников неуникален")
 
 
+class CitizenBulkUpdateSchema(CitizenUpdateSchema):
+    citizen_id = NonNegativeInteger(required=True)
+
+
+class CitizensUpdateSchema(Schema):
+    """Схема пакетного обновления жителей одного набора.
+    """
+
+    citizens = fields.List(fields.Nested(CitizenBulkUpdateSchema), required=True)
+
+    @validates("citizens")
+    def validate_citizens_ids_unique(self, citizens):
+        check_citizens_ids_unique(x["citizen_id"] for x in citizens)
+
+    @post_load
+    def make_updates(self, data, **kw):
+        return data["citizens"]
+
+
 class ImportsSchema(Schema):
     citizens = fields.List(fields.Nested(CitizenSchema), required=True)
 
@@ -109,6 +279,15 @@ class ImportsSchema(Schema):
         return ImportMessage(citizens=data["citizens"])
 
 
+class ImportJobSchema(Schema):
+    job_id = fields.Integer()
+    status = EnumField(JobStatus)
+    citizens_validated = fields.Integer()
+    citizens_inserted = fields.Integer()
+    import_id = fields.Integer(allow_none=True)
+    error = fields.Raw(allow_none=True)
+
+
 class TownAgeStatSchema(Schema):
     town = fields.String()
     p50 = fields.Float()
@@ -0,0 +1,152 @@
+"""Запуск приложения в нескольких процессах на одном порту.
+
+Каждый процесс - отдельный цикл событий со своим контейнером зависимостей и
+пулом соединений. Если ядро умеет SO_REUSEPORT, каждый процесс открывает
+свой сокет и входящие соединения между ними распределяет ядро, иначе все
+процессы слушают общий сокет, открытый до их запуска.
+"""
+import logging
+import multiprocessing
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Dict, Optional
+
+from aiohttp import web
+from injector import Binder
+
+from .config import Config
+from .main import init_func
+
+# Очередь соединений, еще не принятых процессом.
+BACKLOG = 128
+# Пауза перед перезапуском упавшего процесса, секунд.
+RESTART_DELAY = 1
+
+
+def create_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    return sock
+
+
+def run_worker(
+    worker_id: int, workers: int, host: str, port: int, sock: Optional[socket.socket]
+):
+    """Запустить приложение в текущем процессе.
+
+    SIGTERM и SIGINT останавливают процесс штатно: aiohttp дожидается
+    запросов в работе и закрывает пулы соединений в on_cleanup.
+    """
+    # Обработчики главного процесса наследуются при fork.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if sock is None:
+        sock = create_socket(host, port, reuse_port=True)
+    config = Config({"server": {"workers": workers, "worker_id": worker_id}})
+
+    def configuration(binder: Binder):
+        binder.bind(Config, config)
+
+    web.run_app(
+        init_func([], extra_modules=[configuration]),
+        sock=sock,
+        shutdown_timeout=config.server.shutdown_timeout,
+        print=None,
+    )
+
+
+class Server:
+    """Главный процесс: запускает процессы приложения, перезапускает упавшие
+    и останавливает все по SIGTERM или SIGINT.
+    """
+
+    def __init__(
+        self, host: str, port: int, workers: int, config: Config, logger: logging.Logger
+    ):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.config = config
+        self.logger = logger
+        self._context = multiprocessing.get_context("fork")
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._sock = None
+        self._stopping = False
+
+    def run(self):
+        reuse_port = hasattr(socket, "SO_REUSEPORT")
+        if not reuse_port:
+            self._sock = create_socket(self.host, self.port, reuse_port=False)
+        self.logger.info(
+            "Starting %s workers on %s:%s, SO_REUSEPORT: %s",
+            self.workers,
+            self.host,
+            self.port,
+            reuse_port,
+        )
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        try:
+            for worker_id in range(self.workers):
+                self._start_worker(worker_id)
+            self._supervise()
+        finally:
+            self._stop_workers()
+            if self._sock:
+                self._sock.close()
+
+    def _on_signal(self, signum, frame):
+        self.logger.info("Got signal %s, stopping workers", signum)
+        self._stopping = True
+
+    def _start_worker(self, worker_id: int):
+        process = self._context.Process(
+            target=run_worker,
+            args=(worker_id, self.workers, self.host, self.port, self._sock),
+            name=f"gift_app-worker-{worker_id}",
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self.logger.info("Worker %s started, pid %s", worker_id, process.pid)
+
+    def _supervise(self):
+        while not self._stopping:
+            sentinels = [x.sentinel for x in self._processes.values()]
+            # Таймаут - чтобы сигнал остановки проверялся и без падений процессов.
+            wait(sentinels, timeout=RESTART_DELAY)
+            if self._stopping:
+                break
+            for worker_id, process in list(self._processes.items()):
+                if self._stopping:
+                    break
+                if process.is_alive():
+                    continue
+                self.logger.warning(
+                    "Worker %s exited with code %s, restarting",
+                    worker_id,
+                    process.exitcode,
+                )
+                # Чтобы процесс, падающий при запуске, не перезапускался в цикле.
+                time.sleep(RESTART_DELAY)
+                if not self._stopping:
+                    self._start_worker(worker_id)
+
+    def _stop_workers(self):
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        # Сверх shutdown_timeout процессу нужно время закрыть пулы.
+        timeout = self.config.server.shutdown_timeout + 5
+        for worker_id, process in self._processes.items():
+            process.join(timeout)
+            if process.is_alive():
+                self.logger.warning("Worker %s did not stop, killing it", worker_id)
+                process.kill()
+                process.join()
@@ -1,16 +1,34 @@
+import asyncio
+import datetime as dt
+import json
 import logging
-from itertools import groupby
-from operator import itemgetter
-from typing import List, Optional
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import replace
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import asyncpg
 import asyncpgsa
 import sqlalchemy as sa
-import numpy as np
+from sqlalchemy.dialects import postgresql
 
 from .config import Config
 from .errors import InvalidUsage
-from .models import Citizen, Gender, TownAgeStat
+from .models import Citizen, Gender, ImportJob, JobStatus, TownAgeStat
+from .pool import MonitoredPool
+from .queries import CompiledQuery
+from .routing import ReadRouter
 
 
 class Storage:
@@ -18,65 +36,287 @@ class Storage:
         self.config = config
         self.logger = logger
         self._pool = None
+        self._router = ReadRouter([], config.db.read_your_writes_window)
+        self._partitioning = PARTITIONING_NONE
+        self._relatives_layout = RELATIVES_TABLE
+        # Подписчики listen_imports, которым изменения этого процесса
+        # передаются сразу, не дожидаясь уведомления из базы.
+        self._write_callbacks: List[Callable[[int, int], None]] = []
 
     async def initialize(self):
         DSN = "postgresql://{username}:{password}@{host}:{port}/{db_name}"
-        pool = await asyncpgsa.create_pool(
-            dsn=DSN.format(
-                username=self.config.db.username,
-                password=self.config.db.password,
-                host=self.config.db.host,
-                port=self.config.db.port,
-                db_name=self.config.db.name,
-            )
+        db = self.config.db
+        server_settings = {}
+        if db.statement_timeout:
+            # Через параметры соединения, а не SET в init: пул делает
+            # RESET ALL при возврате соединения, и SET бы потерялся.
+            server_settings["statement_timeout"] = str(int(db.statement_timeout * 1000))
+        min_size, max_size = pool_sizes(self.config)
+        pool_kwargs = dict(
+            min_size=min_size,
+            max_size=max_size,
+            max_inactive_connection_lifetime=db.max_inactive_connection_lifetime,
+            command_timeout=db.command_timeout,
+            server_settings=server_settings,
+            init=self._init_connection,
         )
-        self._pool = pool
+        hosts = [(db.host, db.port)]
+        for replica_host in db.replica_hosts:
+            host, _, port = replica_host.partition(":")
+            hosts.append((host, int(port or db.port)))
+        pools = []
+        for host, port in hosts:
+            pool = await asyncpgsa.create_pool(
+                dsn=DSN.format(
+                    username=db.username,
+                    password=db.password,
+                    host=host,
+                    port=port,
+                    db_name=db.name,
+                ),
+                **pool_kwargs,
+            )
+            pools.append(MonitoredPool(pool, min_size, max_size))
+        self._pool, *replicas = pools
+        self._router = ReadRouter(replicas, db.read_your_writes_window)
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            self._partitioning = await retrieve_partitioning(conn)
+            self._relatives_layout = await retrieve_relatives_layout(conn)
         return self
 
+    async def close(self):
+        """Закрыть пулы, дождавшись возврата соединений.
+        """
+        pools = [self._pool, *self._router.replicas] if self._pool else []
+        await asyncio.gather(*[pool.close() for pool in pools])
+        self._pool = None
+        self._router = ReadRouter([], self.config.db.read_your_writes_window)
+
+    async def ping(self, timeout: float):
+        """Проверить, что основная база отвечает.
+        """
+        async with self.pool.acquire(timeout=timeout) as conn:
+            await conn.fetchval("SELECT 1", timeout=timeout)
+
+    @asynccontextmanager
+    async def _new_import(self):
+        """Создать импорт и отдать соединение с открытой транзакцией и import_id.
+
+        После загрузки жителей в той же транзакции считается аналитика.
+        """
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            import_id = await self._next_import_id(conn)
+            if self._partitioning == PARTITIONING_RANGE:
+                # Отдельной короткой транзакцией: создание секции блокирует
+                # всю таблицу до конца транзакции.
+                await self._create_import_partitions_waiting(conn, import_id)
+        try:
+            async with self.pool.transaction() as conn:  # type: asyncpg.connection.Connection
+                await self._create_import(conn, import_id)
+                yield conn, import_id
+                if self._relatives_layout == RELATIVES_ARRAY:
+                    await self._check_relatives_symmetric(conn, import_id)
+                await self._build_analytics(conn, import_id)
+                await self._notify_import_changed(conn, import_id, 0)
+        except Exception:
+            if self._partitioning == PARTITIONING_RANGE:
+                async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+                    await self._drop_import_partitions(conn, import_id)
+            raise
+        self.mark_import_written(import_id, 0)
+
+    async def _drop_import_partitions(
+        self, conn: asyncpg.connection.Connection, import_id: int
+    ):
+        tables = ", ".join(
+            f"{x.name}_{import_id}" for x in reversed(PARTITIONED_TABLES)
+        )
+        await conn.execute(f"DROP TABLE IF EXISTS {tables}")
+
+    def mark_import_written(self, import_id: int, version: Optional[int] = None):
+        """Читать набор с основной базы, пока реплики могут его не догнать.
+
+        Версия, записанная этим процессом, сразу передается подписчикам:
+        уведомление из базы придет позже, и до него кэш отдавал бы старые
+        ответы.
+        """
+        self._router.mark_written(import_id)
+        if version is None:
+            return
+        for callback in self._write_callbacks:
+            callback(import_id, version)
+
+    def pinned_reads(self):
+        """Читать наборы внутри блока каждый с одной базы, см. ReadRouter.pinned.
+        """
+        return self._router.pinned()
+
+    def _read_pool(self, import_id: int) -> MonitoredPool:
+        replica = self._router.replica_for_read(import_id)
+        return replica or self.pool
+
+    def pool_stats(self) -> dict:
+        stats = {
+            "primary": self.pool.stats(),
+            "replicas": [pool.stats() for pool in self._router.replicas],
+        }
+        return stats
+
+    async def _init_connection(self, conn: asyncpg.connection.Connection):
+        """Настроить новое соединение пула.
+        """
+        try:
+            await conn.set_type_codec(
+                gender_enum.name,
+                encoder=_encode_gender,
+                decoder=_decode_gender_label,
+                schema="public",
+                format="binary",
+            )
+        except ValueError:
+            # Типа еще нет, например до init-db. Значения придут строками.
+            self.logger.warning("Type %s is not found", gender_enum.name)
+
     @property
-    def pool(self) -> asyncpg.pool.Pool:
+    def pool(self) -> MonitoredPool:
         if not self._pool:
             raise RuntimeError("Storage is not initialized")
         return self._pool
 
     async def import_citizens(self, citizens: List[Citizen]) -> int:
-        async with self.pool.transaction() as conn:  # type: asyncpg.connection.Connection
-            import_id = await self._next_import_id(conn)
-            await self._create_import(conn, import_id)
-            MAX_ARGS_LEN = 1000
-            while citizens:
-                citizens_batch = citizens[:MAX_ARGS_LEN]
-                citizens = citizens[MAX_ARGS_LEN:]
-                citizen_insert_args = []
-                relative_insert_args = []
-                for citizen in citizens_batch:
-                    citizen_insert_args.append(
-                        dict(
-                            import_id=import_id,
-                            citizen_id=citizen.citizen_id,
-                            town=citizen.town,
-                            street=citizen.street,
-                            building=citizen.building,
-                            apartment=citizen.apartment,
-                            name=citizen.name,
-                            birth_date=citizen.birth_date,
-                            gender=citizen.gender,
-                        )
+        async with self._new_import() as (conn, import_id):
+            await self._copy_citizens(conn, import_id, citizens)
+        return import_id
+
+    async def import_citizens_stream(
+        self, batches: AsyncIterable[List[Citizen]]
+    ) -> int:
+        """Загрузить жителей, поступающих пачками, в одной транзакции.
+        """
+        async with self._new_import() as (conn, import_id):
+            async for citizens in batches:
+                await self._copy_citizens(conn, import_id, citizens)
+        return import_id
+
+    async def delete_import(self, import_id: int):
+        """Удалить набор данных вместе с жителями и аналитикой.
+
+        Набор сразу помечается удаленным и перестает быть виден читателям,
+        а подписчики получают уведомление. Строки затем удаляются пачками
+        короткими транзакциями, поэтому долгих блокировок нет. Прерванное
+        удаление доделывает purge_imports.
+        """
+        await self.hide_import(import_id)
+        await self.purge_import(import_id)
+
+    async def hide_import(self, import_id: int):
+        """Пометить набор удаленным, не трогая его строки.
+
+        Строки потом удаляет purge_import, например в фоне.
+        """
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            version = await self._bump_import_version(conn, import_id, delete=True)
+        if version is None:
+            raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+        self.mark_import_written(import_id, version)
+
+    async def purge_imports(self, older_than: dt.timedelta) -> List[int]:
+        """Удалить наборы данных, созданные раньше чем older_than назад.
+
+        Заодно доделываются прерванные удаления. Возвращает import_id
+        удаленных наборов.
+        """
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            await conn.execute(
+                _delete_imports_query(
+                    import_table.c.created_at
+                    < sa.func.now() - sa.literal(older_than, sa.Interval)
+                )
+            )
+            import_ids = await conn.fetch(
+                sa.select([import_table.c.import_id])
+                .where(import_table.c.deleted)
+                .order_by(import_table.c.import_id)
+            )
+        import_ids = [x["import_id"] for x in import_ids]
+        for import_id in import_ids:
+            self.mark_import_written(import_id)
+            await self.purge_import(import_id)
+        return import_ids
+
+    async def purge_import(self, import_id: int):
+        """Удалить строки набора, уже помеченного удаленным.
+        """
+        batch_size = self.config.db.delete_batch_size
+        tables = [
+            *RELATIVES_LAYOUT_TABLES[self._relatives_layout],
+            birthday_presents_table,
+            town_birth_dates_table,
+        ]
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            if self._partitioning == PARTITIONING_RANGE:
+                await self._drop_import_partitions_waiting(conn, import_id)
+                tables = [x for x in tables if x not in PARTITIONED_TABLES]
+            for table in tables:
+                await _delete_in_batches(conn, table, import_id, batch_size)
+            await conn.execute(
+                import_table.delete().where(import_table.c.import_id == import_id)
+            )
+
+    async def _drop_import_partitions_waiting(
+        self, conn: asyncpg.connection.Connection, import_id: int
+    ):
+        """Удалить секции набора, не выстраивая читателей в очередь за блокировкой.
+        """
+        await self._alter_partitions_waiting(
+            conn, import_id, self._drop_import_partitions
+        )
+
+    async def _create_import_partitions_waiting(
+        self, conn: asyncpg.connection.Connection, import_id: int
+    ):
+        """Создать секции набора, не выстраивая читателей в очередь за блокировкой.
+        """
+
+        async def create(conn: asyncpg.connection.Connection, import_id: int):
+            await _create_partitions(
+                conn, str(import_id), _range_bounds(import_id), self._relatives_layout
+            )
+
+        await self._alter_partitions_waiting(conn, import_id, create)
+
+    async def _alter_partitions_waiting(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        alter: Callable[[asyncpg.connection.Connection, int], Awaitable[None]],
+    ):
+        """Изменить секции набора в транзакции с коротким ожиданием блокировки.
+
+        CREATE TABLE ... PARTITION OF и DROP TABLE ждут эксклюзивную блокировку
+        родительской таблицы, и все новые запросы встают за ними в очередь.
+        Поэтому блокировка берется с коротким таймаутом, а при неудаче попытка
+        повторяется позже.
+        """
+        for attempt in range(PARTITIONS_LOCK_ATTEMPTS):
+            try:
+                async with conn.transaction():
+                    await conn.execute(
+                        f"SET LOCAL lock_timeout = '{PARTITIONS_LOCK_TIMEOUT}'"
                     )
-                    for relative in citizen.relatives:
-                        relative_insert_args.append(
-                            dict(
-                                import_id=import_id,
-                                citizen_id=citizen.citizen_id,
-                                relative_citizen_id=relative,
-                            )
-                        )
-                await conn.fetchrow(citizen_table.insert().values(citizen_insert_args))
-                await conn.fetchrow(relative_table.insert().values(relative_insert_args))
-            return import_id
+                    await alter(conn, import_id)
+                return
+            except asyncpg.exceptions.LockNotAvailableError:
+                if attempt == PARTITIONS_LOCK_ATTEMPTS - 1:
+                    raise
+                self.logger.warning(
+                    "Partitions of import %s are locked, retrying", import_id
+                )
+                await asyncio.sleep(PARTITIONS_LOCK_RETRY_DELAY)
 
     async def retrieve_citizen(self, import_id: int, citizen_id: int) -> Citizen:
-        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+        pool = self._read_pool(import_id)
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
             if not await self._import_exists(conn, import_id):
                 raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
             citizen = await self._retrieve_citizen(conn, import_id, citizen_id)
@@ -86,67 +326,235 @@ class Storage:
                 )
             return citizen
 
-    async def list_citizens(self, import_id: int) -> List[Citizen]:
+    async def retrieve_import_version(self, import_id: int) -> int:
+        pool = self._read_pool(import_id)
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            sql, args = IMPORT_VERSION_QUERY.bind(import_id=import_id)
+            version = await conn.fetchval(sql, *args)
+            if version is None:
+                raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+            return version
+
+    async def create_import_job(self) -> int:
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            job_id = await conn.fetchval(
+                import_job_table.insert().returning(import_job_table.c.job_id)
+            )
+        return job_id
+
+    async def update_import_job(self, job_id: int, **values):
+        """Обновить состояние задания импорта.
+
+        Пишется отдельным соединением вне транзакции импорта, чтобы прогресс
+        был виден всем процессам сразу.
+        """
+        if "status" in values:
+            values["status"] = values["status"].name
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            await conn.execute(
+                import_job_table.update()
+                .values(updated_at=sa.func.now(), **values)
+                .where(import_job_table.c.job_id == job_id)
+            )
+
+    async def retrieve_import_job(self, job_id: int) -> ImportJob:
+        # С основной базы: состояние меняется каждую секунду.
         async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            row = await conn.fetchrow(
+                sa.select(
+                    [
+                        import_job_table.c.job_id,
+                        import_job_table.c.status,
+                        import_job_table.c.citizens_validated,
+                        import_job_table.c.citizens_inserted,
+                        import_job_table.c.import_id,
+                        import_job_table.c.error,
+                    ]
+                ).where(import_job_table.c.job_id == job_id)
+            )
+        if row is None:
+            raise InvalidUsage.not_found(f"Задания №{job_id} не найдено.")
+        job = ImportJob(**row)
+        job.status = JobStatus[job.status]
+        if job.error is not None:
+            job.error = json.loads(job.error)
+        return job
+
+    async def listen_imports(
+        self,
+        callback: Callable[[int, int], None],
+        on_listen: Optional[Callable[[], None]] = None,
+        ping_interval: float = 5,
+    ):
+        """Подписаться на изменения наборов данных.
+
+        callback вызывается с import_id и новой версией набора, для изменений
+        этого процесса - сразу после коммита. Корутина держит соединение
+        из пула и завершается только с ошибкой, когда соединение потеряно.
+        """
+        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+
+            def on_notification(connection, pid, channel, payload):
+                import_id, version = map(int, payload.split(":"))
+                callback(import_id, version)
+
+            await conn.add_listener(IMPORTS_CHANNEL, on_notification)
+            self._write_callbacks.append(callback)
+            try:
+                if on_listen:
+                    on_listen()
+                while True:
+                    await asyncio.sleep(ping_interval)
+                    # Обрыв соединения без запросов можно не заметить.
+                    await asyncio.wait_for(conn.fetchval("SELECT 1"), ping_interval)
+            finally:
+                self._write_callbacks.remove(callback)
+                if not conn.is_closed():
+                    await conn.remove_listener(IMPORTS_CHANNEL, on_notification)
+
+    async def list_citizens(self, import_id: int) -> List[Citizen]:
+        pool = self._read_pool(import_id)
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
             if not await self._import_exists(conn, import_id):
                 raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
             citizens = await self._list_citizens(conn, import_id)
             return citizens
 
+    async def list_citizens_rows(self, import_id: int) -> List[asyncpg.Record]:
+        """Жители набора строками базы, для сериализации без промежуточных объектов.
+        """
+        pool = self._read_pool(import_id)
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            if not await self._import_exists(conn, import_id):
+                raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+            query = LIST_CITIZENS_QUERIES[self._relatives_layout]
+            sql, args = query.bind(import_id=import_id)
+            rows = await conn.fetch(sql, *args)
+            return rows
+
+    async def iter_citizens(
+        self, import_id: int, batch_size: int
+    ) -> AsyncIterator[List[Citizen]]:
+        """Отдавать жителей набора пачками, читая их серверным курсором.
+
+        Первая пачка отдается всегда, даже пустая, поэтому ошибка
+        несуществующего набора возникает на первой итерации.
+        """
+        pool = self._read_pool(import_id)
+        async with pool.transaction() as conn:  # type: asyncpg.connection.Connection
+            if not await self._import_exists(conn, import_id):
+                raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+            query = LIST_CITIZENS_QUERIES[self._relatives_layout]
+            sql, args = query.bind(import_id=import_id)
+            cursor = await conn.cursor(sql, *args)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                yield [_citizen_with_relatives_from_row(row) for row in rows]
+                if len(rows) < batch_size:
+                    break
+
     async def update_citizen(
         self, import_id: int, citizen_id: int, citizen_update: dict
     ) -> Citizen:
+        """Обновить жителя в одной транзакции.
+
+        Увеличение версии набора заодно проверяет, что набор существует,
+        и блокирует его от параллельных изменений. UPDATE возвращает жителя
+        до и после изменения, отсутствие строки означает, что жителя нет.
+        """
         async with self.pool.transaction() as conn:  # type: asyncpg.connection.Connection
-            if "relatives" in citizen_update:
-                await self._update_citizen_relatives(
-                    conn, import_id, citizen_id, citizen_update.pop("relatives")
+            version = await self._bump_import_version(conn, import_id)
+            if version is None:
+                raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+            new_relatives = citizen_update.pop("relatives", None)
+            row = await conn.fetchrow(
+                _update_citizen_query(
+                    import_id, citizen_id, citizen_update, self._relatives_layout
                 )
-            if citizen_update:
-                stmt = (
-                    citizen_table.update()
-                    .where(citizen_table.c.import_id == import_id)
-                    .where(citizen_table.c.citizen_id == citizen_id)
-                    .values(**citizen_update)
+            )
+            if not row:
+                raise InvalidUsage.not_found(
+                    f"Житель #{citizen_id} из набора #{import_id} не найден"
                 )
-                await conn.fetchrow(stmt)
-            new_citizen = await self._retrieve_citizen(conn, import_id, citizen_id)
-            assert new_citizen
-            return new_citizen
-
-    async def birthdays_report(self, import_id: int) -> dict:
-        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
-            if not await self._import_exists(conn, import_id):
-                raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+            old_citizen = _citizen_from_row(row, prefix="old_")
+            old_citizen.relatives = row["old_relatives"] or []
+            new_citizen = _citizen_from_row(row)
+            new_citizen.relatives = old_citizen.relatives
+            if new_relatives is not None:
+                new_citizen.relatives = await self._update_citizen_relatives(
+                    conn, import_id, citizen_id, old_citizen.relatives, new_relatives
+                )
+            await self._update_analytics(conn, import_id, [(old_citizen, new_citizen)])
+        self.mark_import_written(import_id, version)
+        return new_citizen
 
-            # select date_part('month', c.birth_date) as month, count(c.citizen_id), r.relative_citizen_id
-            # from citizen as c join relative as r on c.citizen_id = r.citizen_id and c.import_id = r.import_id
-            # where c.import_id = 7084
-            # group by month, r.relative_citizen_id
+    async def update_citizens(
+        self, import_id: int, updates: List[dict]
+    ) -> List[Citizen]:
+        """Обновить нескольких жителей в одной транзакции.
 
-            birth_month = sa.func.date_part("month", citizen_table.c.birth_date).cast(
-                sa.Integer
+        Каждое обновление содержит citizen_id и изменяемые поля. Граф
+        родственников после всех изменений проверяется один раз, а поля,
+        связи и аналитика меняются запросами над множествами, число которых
+        не зависит от числа жителей. Возвращает жителей в порядке обновлений.
+        """
+        updates = [dict(x) for x in updates]
+        citizen_ids = [x.pop("citizen_id") for x in updates]
+        async with self.pool.transaction() as conn:  # type: asyncpg.connection.Connection
+            version = await self._bump_import_version(conn, import_id)
+            if version is None:
+                raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+            old_citizens = {
+                x.citizen_id: x
+                for x in await self._retrieve_citizens(conn, import_id, citizen_ids)
+            }
+            missing = set(citizen_ids) - set(old_citizens)
+            if missing:
+                raise InvalidUsage.not_found(
+                    f"Житель #{min(missing)} из набора #{import_id} не найден"
+                )
+            new_relatives = {
+                citizen_id: set(update.pop("relatives"))
+                for citizen_id, update in zip(citizen_ids, updates)
+                if "relatives" in update
+            }
+            added, removed = _relatives_changes(old_citizens, new_relatives)
+            await self._check_citizens_exist(
+                conn, import_id, {x for edge in added for x in edge} - set(old_citizens)
             )
-            joined = citizen_table.join(
-                relative_table,
-                sa.and_(
-                    citizen_table.c.citizen_id == relative_table.c.citizen_id,
-                    citizen_table.c.import_id == relative_table.c.import_id,
-                ),
+
+            new_citizens = {}
+            for citizen_id, update in zip(citizen_ids, updates):
+                citizen = replace(old_citizens[citizen_id], **update)
+                citizen.relatives = set(citizen.relatives)
+                new_citizens[citizen_id] = citizen
+            _apply_relatives_changes(
+                {x: y.relatives for x, y in new_citizens.items()}, added, removed
             )
-            query = (
-                sa.select(
-                    [
-                        birth_month,
-                        relative_table.c.relative_citizen_id,
-                        sa.func.count(citizen_table.c.citizen_id),
-                    ]
+            for citizen in new_citizens.values():
+                citizen.relatives = sorted(citizen.relatives)
+
+            await self._update_citizens_fields(conn, import_id, citizen_ids, updates)
+            if added or removed:
+                await self._update_relatives_edges(
+                    conn, import_id, new_citizens, added, removed
                 )
-                .select_from(joined)
-                .where(citizen_table.c.import_id == import_id)
-                .order_by(birth_month)
-                .group_by(birth_month, relative_table.c.relative_citizen_id)
+            await self._update_analytics(
+                conn,
+                import_id,
+                [(old_citizens[x], new_citizens[x]) for x in new_citizens],
             )
-            rows = await conn.fetch(query)
+        self.mark_import_written(import_id, version)
+        return [new_citizens[x] for x in citizen_ids]
+
+    async def birthdays_report(self, import_id: int) -> dict:
+        pool = self._read_pool(import_id)
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            if not await self._import_exists(conn, import_id):
+                raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+
+            sql, args = BIRTHDAYS_REPORT_QUERY.bind(import_id=import_id)
+            rows = await conn.fetch(sql, *args)
             report = {n: [] for n in range(1, 13)}
             for month_num, citizen_id, relatives_birthdays_cnt in rows:
                 report[month_num].append(
@@ -155,31 +563,15 @@ class Storage:
             return report
 
     async def retrieve_age_stats(self, import_id: int) -> List[TownAgeStat]:
-        async with self.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+        pool = self._read_pool(import_id)
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
             if not await self._import_exists(conn, import_id):
                 raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
-            town_rows = await conn.fetch(
-                sa.select([citizen_table.c.town])
-                .where(citizen_table.c.import_id == import_id)
-                .order_by(citizen_table.c.town)
-                .distinct()
-            )
+            sql, args = AGE_STATS_QUERY.bind(import_id=import_id)
+            rows = await conn.fetch(sql, *args)
             stats = []
-            for [town] in town_rows:
-                age_rows = await conn.fetch(
-                    sa.select(
-                        [
-                            sa.func.date_part(
-                                "year", sa.func.age(citizen_table.c.birth_date)
-                            )
-                        ]
-                    )
-                    .where(citizen_table.c.import_id == import_id)
-                    .where(citizen_table.c.town == town)
-                )
-                ages = [row[0] for row in age_rows]
-
-                [p50, p75, p99] = np.percentile(ages, [50, 75, 99])
+            for town, p50, p75, p99 in rows:
+                # Интерполяция та же, что у np.percentile по умолчанию.
                 stat = TownAgeStat(
                     town=town, p50=round(p50, 2), p75=round(p75, 2), p99=round(p99, 2)
                 )
@@ -189,120 +581,521 @@ class Storage:
     ######################################## ########################################
     ######################################## ########################################
 
+    async def _copy_citizens(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizens: List[Citizen],
+    ):
+        """Загрузить жителей и их родственные связи через бинарный COPY.
+
+        Записи собираются кортежами прямо из провалидированных жителей,
+        минуя построение словарей и компиляцию запросов в SQLAlchemy.
+        """
+        if self._relatives_layout == RELATIVES_ARRAY:
+            await self._copy_citizens_with_relatives(conn, import_id, citizens)
+            return
+        await conn.copy_records_to_table(
+            citizen_table.name,
+            records=(
+                (
+                    import_id,
+                    citizen.citizen_id,
+                    citizen.town,
+                    citizen.street,
+                    citizen.building,
+                    citizen.apartment,
+                    citizen.name,
+                    citizen.birth_date,
+                    citizen.gender.name,
+                )
+                for citizen in citizens
+            ),
+            columns=CITIZEN_COPY_COLUMNS,
+        )
+        await conn.copy_records_to_table(
+            relative_table.name,
+            records=(
+                (import_id, citizen.citizen_id, relative)
+                for citizen in citizens
+                for relative in citizen.relatives
+            ),
+            columns=RELATIVE_COPY_COLUMNS,
+        )
+
+    async def _copy_citizens_with_relatives(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizens: List[Citizen],
+    ):
+        """Загрузить жителей вместе с отсортированными массивами родственников.
+
+        Повторы родственников отсекает схема импорта до хранилища.
+        """
+        await conn.copy_records_to_table(
+            citizen_table.name,
+            records=(
+                (
+                    import_id,
+                    citizen.citizen_id,
+                    citizen.town,
+                    citizen.street,
+                    citizen.building,
+                    citizen.apartment,
+                    citizen.name,
+                    citizen.birth_date,
+                    citizen.gender.name,
+                    sorted(citizen.relatives),
+                )
+                for citizen in citizens
+            ),
+            columns=CITIZEN_ARRAY_COPY_COLUMNS,
+        )
+
+    async def _check_relatives_symmetric(
+        self, conn: asyncpg.connection.Connection, import_id: int
+    ):
+        """Проверить, что массивы родственников набора ссылаются друг на друга.
+
+        В таблице родственников это обеспечивают внешние ключи и двусторонние
+        ребра, а у массивов проверка делается одним запросом после загрузки.
+        """
+        sql, args = ASYMMETRIC_RELATIVES_QUERY.bind(import_id=import_id)
+        row = await conn.fetchrow(sql, *args)
+        if not row:
+            return
+        citizen_id, relative = row["citizen_id"], row["relative_citizen_id"]
+        exists = await conn.fetchval(
+            sa.select([citizen_table.c.citizen_id])
+            .where(citizen_table.c.import_id == import_id)
+            .where(citizen_table.c.citizen_id == relative)
+        )
+        if exists is None:
+            raise InvalidUsage.bad_request(
+                f"У жителя #{citizen_id} не найден родственник #{relative}."
+            )
+        raise InvalidUsage.bad_request(
+            f"Родственник #{relative} жителя #{citizen_id} не признает его своим."
+        )
+
+    async def _build_analytics(
+        self, conn: asyncpg.connection.Connection, import_id: int
+    ):
+        """Посчитать подарки по месяцам и гистограмму дат рождения для импорта.
+        """
+        await self._refresh_birthday_presents(conn, import_id)
+        histogram = town_birth_dates_table
+        await conn.execute(
+            histogram.insert().from_select(
+                [
+                    histogram.c.import_id,
+                    histogram.c.town,
+                    histogram.c.birth_date,
+                    histogram.c.citizens,
+                ],
+                sa.select(
+                    [
+                        citizen_table.c.import_id,
+                        citizen_table.c.town,
+                        citizen_table.c.birth_date,
+                        sa.func.count(),
+                    ]
+                )
+                .where(citizen_table.c.import_id == import_id)
+                .group_by(
+                    citizen_table.c.import_id,
+                    citizen_table.c.town,
+                    citizen_table.c.birth_date,
+                ),
+            )
+        )
+
+    async def _update_analytics(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        changes: List[Tuple[Citizen, Citizen]],
+    ):
+        """Обновить аналитику после изменения жителей.
+
+        changes - пары жителей до и после изменения.
+        """
+        affected = set()
+        histogram = Counter()
+        for old_citizen, new_citizen in changes:
+            if old_citizen.birth_date.month != new_citizen.birth_date.month or set(
+                old_citizen.relatives
+            ) != set(new_citizen.relatives):
+                # Подарки получают родственники жителя, а сам житель получает
+                # подарки от своих родственников. Пересчитываем только их.
+                affected.update(
+                    [
+                        new_citizen.citizen_id,
+                        *old_citizen.relatives,
+                        *new_citizen.relatives,
+                    ]
+                )
+            histogram[old_citizen.town, old_citizen.birth_date] -= 1
+            histogram[new_citizen.town, new_citizen.birth_date] += 1
+        if affected:
+            await self._refresh_birthday_presents(conn, import_id, affected)
+        await self._add_town_birth_dates(conn, import_id, histogram)
+
+    async def _refresh_birthday_presents(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizen_ids: Optional[Iterable[int]] = None,
+    ):
+        """Пересчитать подарки по месяцам для указанных жителей или всего импорта.
+        """
+        presents = birthday_presents_table
+        delete = presents.delete().where(presents.c.import_id == import_id)
+        citizen, relative, froms = _relatives_edges_source(self._relatives_layout)
+        birth_month = sa.func.date_part("month", citizen.c.birth_date).cast(sa.Integer)
+        query = sa.select(
+            [citizen.c.import_id, relative, birth_month, sa.func.count()]
+        ).where(citizen.c.import_id == import_id)
+        for from_clause in froms:
+            query = query.select_from(from_clause)
+        query = query.group_by(citizen.c.import_id, relative, birth_month)
+        if citizen_ids is not None:
+            citizen_ids = list(citizen_ids)
+            delete = delete.where(presents.c.citizen_id.in_(citizen_ids))
+            query = query.where(relative.in_(citizen_ids))
+            await conn.execute(delete)
+        await conn.execute(
+            presents.insert().from_select(
+                [
+                    presents.c.import_id,
+                    presents.c.citizen_id,
+                    presents.c.month,
+                    presents.c.presents,
+                ],
+                query,
+            )
+        )
+
+    async def _add_town_birth_dates(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        deltas: Dict[Tuple[str, dt.date], int],
+    ):
+        """Изменить число жителей по парам (город, дата рождения) двумя запросами.
+        """
+        deltas = sorted((key, delta) for key, delta in deltas.items() if delta)
+        if not deltas:
+            return
+        histogram = town_birth_dates_table
+        towns = _array((town for (town, _), _ in deltas), sa.String)
+        birth_dates = _array((birth_date for (_, birth_date), _ in deltas), sa.Date)
+        insert = postgresql.insert(histogram).from_select(
+            [
+                histogram.c.import_id,
+                histogram.c.town,
+                histogram.c.birth_date,
+                histogram.c.citizens,
+            ],
+            sa.select(
+                [
+                    sa.cast(sa.literal(import_id), sa.Integer),
+                    sa.func.unnest(towns),
+                    sa.func.unnest(birth_dates),
+                    sa.func.unnest(_int_array(delta for _, delta in deltas)),
+                ]
+            ),
+        )
+        stmt = insert.on_conflict_do_update(
+            index_elements=[
+                histogram.c.import_id,
+                histogram.c.town,
+                histogram.c.birth_date,
+            ],
+            set_={"citizens": histogram.c.citizens + insert.excluded.citizens},
+        )
+        await conn.execute(stmt)
+        await conn.execute(
+            histogram.delete()
+            .where(histogram.c.import_id == import_id)
+            .where(
+                sa.tuple_(histogram.c.town, histogram.c.birth_date).in_(
+                    sa.select([sa.func.unnest(towns), sa.func.unnest(birth_dates)])
+                )
+            )
+            .where(histogram.c.citizens <= 0)
+        )
+
     async def _update_citizen_relatives(
         self,
         conn: asyncpg.connection.Connection,
         import_id: int,
         citizen_id: int,
+        old_relatives: List[int],
         new_relatives: List[int],
     ) -> List[int]:
+        """Применить разницу списков родственников постоянным числом запросов.
+
+        Связи двусторонние, поэтому удаляются и добавляются ребра в обе стороны.
+        """
         new_relatives_set = set(new_relatives)
-        old_relatives = set(
-            await self._retrieve_citizen_relatives_ids(conn, import_id, citizen_id)
-        )
-        to_delete = old_relatives - new_relatives_set
-        to_add = new_relatives_set - old_relatives
-        for relative in to_delete:
-            await conn.fetchrow(
-                relative_table.delete()
-                .where(relative_table.c.import_id == import_id)
-                .where(relative_table.c.citizen_id == citizen_id)
-                .where(relative_table.c.relative_citizen_id == relative)
-            )
-            await conn.fetchrow(
-                relative_table.delete()
-                .where(relative_table.c.import_id == import_id)
-                .where(relative_table.c.citizen_id == relative)
-                .where(relative_table.c.relative_citizen_id == citizen_id)
+        old_relatives_set = set(old_relatives)
+        to_delete = old_relatives_set - new_relatives_set
+        to_add = new_relatives_set - old_relatives_set
+        if to_add:
+            found = await conn.fetch(
+                sa.select([citizen_table.c.citizen_id])
+                .where(citizen_table.c.import_id == import_id)
+                .where(citizen_table.c.citizen_id == sa.any_(_int_array(to_add)))
             )
-        for relative in to_add:
-            if not await self._check_citizen_exists(conn, import_id, relative):
+            missing = to_add - {row["citizen_id"] for row in found}
+            if missing:
                 raise InvalidUsage.bad_request(
-                    f"Родственник #{relative} не существует в наборе #{import_id}."
+                    f"Родственник #{min(missing)} не существует в наборе #{import_id}."
                 )
-            await conn.fetchrow(
-                relative_table.insert().values(
-                    import_id=import_id,
-                    citizen_id=citizen_id,
-                    relative_citizen_id=relative,
+        if self._relatives_layout == RELATIVES_ARRAY:
+            if to_delete or to_add:
+                await self._update_citizen_relatives_arrays(
+                    conn, import_id, citizen_id, new_relatives_set, to_delete, to_add
+                )
+            return sorted(new_relatives_set)
+        if to_delete:
+            # Ребро жителя самому себе попадает в список дважды, для DELETE это неважно.
+            edges = _relatives_edges(citizen_id, to_delete)
+            await conn.execute(
+                relative_table.delete()
+                .where(relative_table.c.import_id == import_id)
+                .where(
+                    sa.tuple_(
+                        relative_table.c.citizen_id,
+                        relative_table.c.relative_citizen_id,
+                    ).in_(_unnest_edges(edges))
                 )
             )
-            await conn.fetchrow(
-                relative_table.insert().values(
-                    import_id=import_id,
-                    citizen_id=relative,
-                    relative_citizen_id=citizen_id,
+        if to_add:
+            # А для INSERT ребра должны быть уникальны.
+            edges = sorted(set(_relatives_edges(citizen_id, to_add)))
+            await conn.execute(
+                relative_table.insert().from_select(
+                    [
+                        relative_table.c.import_id,
+                        relative_table.c.citizen_id,
+                        relative_table.c.relative_citizen_id,
+                    ],
+                    _unnest_edges(edges, import_id),
                 )
             )
-        saved_relatives = await self._retrieve_citizen_relatives_ids(
-            conn, import_id, citizen_id
-        )
-        return saved_relatives
+        return sorted(new_relatives_set)
 
-    async def _retrieve_citizen_relatives_ids(
-        self, conn: asyncpg.connection.Connection, import_id: int, citizen_id: int
-    ) -> List[int]:
-        r = await conn.fetch(
-            relative_table.select()
-            .where(relative_table.c.import_id == import_id)
-            .where(relative_table.c.citizen_id == citizen_id)
+    async def _update_citizen_relatives_arrays(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizen_id: int,
+        new_relatives: Set[int],
+        to_delete: Set[int],
+        to_add: Set[int],
+    ):
+        """Применить разницу родственников к массивам, сохраняя их симметричными.
+
+        Массив самого жителя заменяется целиком, у удаленных родственников
+        житель убирается из массива, у добавленных вставляется с сохранением
+        порядка.
+        """
+        table = citizen_array_table
+        citizen = table.c.citizen_id
+        await conn.execute(
+            table.update()
+            .where(table.c.import_id == import_id)
+            .where(citizen == citizen_id)
+            .values(relatives=_int_array(sorted(new_relatives)))
         )
-        relative_ids = []
-        for row in r:
-            relative_ids.append(row["relative_citizen_id"])
-        return relative_ids
+        # Связь жителя с самим собой уже учтена в его массиве.
+        to_delete = to_delete - {citizen_id}
+        to_add = to_add - {citizen_id}
+        if to_delete:
+            await conn.execute(
+                table.update()
+                .where(table.c.import_id == import_id)
+                .where(citizen == sa.any_(_int_array(to_delete)))
+                .values(relatives=sa.func.array_remove(table.c.relatives, citizen_id))
+            )
+        if to_add:
+            item = sa.column("item")
+            items = sa.func.unnest(
+                sa.func.array_append(table.c.relatives, citizen_id)
+            ).alias(item.name)
+            await conn.execute(
+                table.update()
+                .where(table.c.import_id == import_id)
+                .where(citizen == sa.any_(_int_array(to_add)))
+                .values(
+                    relatives=sa.select(
+                        [sa.func.array_agg(postgresql.aggregate_order_by(item, item))]
+                    )
+                    .select_from(items)
+                    .as_scalar()
+                )
+            )
 
-    async def _check_citizen_exists(
-        self, conn: asyncpg.connection.Connection, import_id: int, citizen_id: int
-    ) -> bool:
-        val = await conn.fetchval(
-            citizen_table.select()
-            .where(citizen_table.c.citizen_id == citizen_id)
+    async def _retrieve_citizens(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizen_ids: Iterable[int],
+    ) -> List[Citizen]:
+        if self._relatives_layout == RELATIVES_ARRAY:
+            build_query = _citizens_with_relatives_array_query
+        else:
+            build_query = _citizens_with_relatives_query
+        rows = await conn.fetch(build_query(import_id, citizen_ids=citizen_ids))
+        citizens = [_citizen_with_relatives_from_row(row) for row in rows]
+        return citizens
+
+    async def _check_citizens_exist(
+        self, conn: asyncpg.connection.Connection, import_id: int, citizen_ids: Set[int]
+    ):
+        """Проверить, что новые родственники есть в наборе.
+        """
+        if not citizen_ids:
+            return
+        found = await conn.fetch(
+            sa.select([citizen_table.c.citizen_id])
             .where(citizen_table.c.import_id == import_id)
-            .limit(1)
+            .where(citizen_table.c.citizen_id == sa.any_(_int_array(citizen_ids)))
+        )
+        missing = citizen_ids - {row["citizen_id"] for row in found}
+        if missing:
+            raise InvalidUsage.bad_request(
+                f"Родственник #{min(missing)} не существует в наборе #{import_id}."
+            )
+
+    async def _update_citizens_fields(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizen_ids: List[int],
+        updates: List[dict],
+    ):
+        """Обновить поля жителей, по запросу на каждый набор изменяемых полей.
+        """
+        groups = defaultdict(list)
+        for citizen_id, update in zip(citizen_ids, updates):
+            if update:
+                groups[tuple(sorted(update))].append((citizen_id, update))
+        for fields, group in groups.items():
+            await conn.execute(_update_citizens_fields_query(import_id, fields, group))
+
+    async def _update_relatives_edges(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizens: Dict[int, Citizen],
+        added: Set[Tuple[int, int]],
+        removed: Set[Tuple[int, int]],
+    ):
+        """Удалить и добавить связи, заданные парами жителей.
+        """
+        if self._relatives_layout == RELATIVES_ARRAY:
+            await self._update_relatives_arrays(
+                conn, import_id, citizens, added, removed
+            )
+            return
+        if removed:
+            edges = sorted({x for a, b in removed for x in [(a, b), (b, a)]})
+            await conn.execute(
+                relative_table.delete()
+                .where(relative_table.c.import_id == import_id)
+                .where(
+                    sa.tuple_(
+                        relative_table.c.citizen_id,
+                        relative_table.c.relative_citizen_id,
+                    ).in_(_unnest_edges(edges))
+                )
+            )
+        if added:
+            edges = sorted({x for a, b in added for x in [(a, b), (b, a)]})
+            await conn.execute(
+                relative_table.insert().from_select(
+                    [
+                        relative_table.c.import_id,
+                        relative_table.c.citizen_id,
+                        relative_table.c.relative_citizen_id,
+                    ],
+                    _unnest_edges(edges, import_id),
+                )
+            )
+
+    async def _update_relatives_arrays(
+        self,
+        conn: asyncpg.connection.Connection,
+        import_id: int,
+        citizens: Dict[int, Citizen],
+        added: Set[Tuple[int, int]],
+        removed: Set[Tuple[int, int]],
+    ):
+        """Переписать массивы родственников всех жителей, затронутых связями.
+
+        Массивы обновленных жителей уже посчитаны, массивы остальных
+        читаются и меняются здесь же.
+        """
+        touched = {x for edge in added | removed for x in edge}
+        relatives = {x: set(citizens[x].relatives) for x in touched & set(citizens)}
+        others = touched - set(citizens)
+        if others:
+            rows = await conn.fetch(
+                sa.select(
+                    [citizen_array_table.c.citizen_id, citizen_array_table.c.relatives]
+                )
+                .where(citizen_array_table.c.import_id == import_id)
+                .where(citizen_array_table.c.citizen_id == sa.any_(_int_array(others)))
+            )
+            others_relatives = {
+                row["citizen_id"]: set(row["relatives"]) for row in rows
+            }
+            _apply_relatives_changes(others_relatives, added, removed)
+            relatives.update(others_relatives)
+        citizen_ids = sorted(relatives)
+        # Массивы разной длины нельзя передать одним двумерным массивом,
+        # поэтому они передаются текстом и приводятся к integer[] в запросе.
+        arrays = [
+            "{%s}" % ",".join(str(x) for x in sorted(relatives[citizen_id]))
+            for citizen_id in citizen_ids
+        ]
+        new = sa.select(
+            [
+                sa.func.unnest(_int_array(citizen_ids)).label("citizen_id"),
+                sa.cast(sa.func.unnest(_array(arrays, sa.Text)), INT_ARRAY).label(
+                    "relatives"
+                ),
+            ]
+        ).alias("new")
+        await conn.execute(
+            citizen_array_table.update()
+            .where(citizen_array_table.c.import_id == import_id)
+            .where(citizen_array_table.c.citizen_id == new.c.citizen_id)
+            .values(relatives=new.c.relatives)
         )
-        return bool(val)
 
     async def _retrieve_citizen(
         self, conn: asyncpg.connection.Connection, import_id: int, citizen_id: int
     ) -> Optional[Citizen]:
-        row = await conn.fetchrow(
-            citizen_table.select()
-            .where(citizen_table.c.citizen_id == citizen_id)
-            .where(citizen_table.c.import_id == import_id)
-            .limit(1)
-        )
+        query = RETRIEVE_CITIZEN_QUERIES[self._relatives_layout]
+        sql, args = query.bind(import_id=import_id, citizen_id=citizen_id)
+        row = await conn.fetchrow(sql, *args)
         if not row:
             return None
-        citizen = _citizen_from_row(row)
-        relatives = await self._retrieve_citizen_relatives_ids(
-            conn, import_id, citizen_id
-        )
-        citizen.relatives = relatives
+        citizen = _citizen_with_relatives_from_row(row)
         return citizen
 
     async def _list_citizens(
         self, conn: asyncpg.connection.Connection, import_id: int
     ) -> List[Citizen]:
-        citizens_rows = await conn.fetch(
-            citizen_table.select()
-            .where(citizen_table.c.import_id == import_id)
-            .order_by(citizen_table.c.citizen_id)
-        )
-        relatives_rows = await conn.fetch(
-            relative_table.select().where(relative_table.c.import_id == import_id)
-        )
-        relatives_map = {
-            citizen_id: list(map(itemgetter("citizen_id"), relatives_it))
-            for citizen_id, relatives_it in groupby(
-                relatives_rows, key=itemgetter("relative_citizen_id")
-            )
-        }
-        citizens = []
-        for citizen_row in citizens_rows:
-            citizen = _citizen_from_row(citizen_row)
-            citizen.relatives = relatives_map.get(citizen.citizen_id, [])
-            citizens.append(citizen)
+        query = LIST_CITIZENS_QUERIES[self._relatives_layout]
+        sql, args = query.bind(import_id=import_id)
+        rows = await conn.fetch(sql, *args)
+        citizens = [_citizen_with_relatives_from_row(row) for row in rows]
         return citizens
 
     async def _retrieve_many_citizens(
@@ -331,9 +1124,8 @@ class Storage:
     async def _import_exists(
         self, conn: asyncpg.connection.Connection, import_id: int
     ) -> bool:
-        r = await conn.fetchval(
-            import_table.select().where(import_table.c.import_id == import_id).limit(1)
-        )
+        sql, args = IMPORT_EXISTS_QUERY.bind(import_id=import_id)
+        r = await conn.fetchval(sql, *args)
         return bool(r)
 
     async def _create_import(
@@ -342,6 +1134,31 @@ class Storage:
         r = await conn.fetchrow(import_table.insert().values(import_id=import_id))
         return bool(r)
 
+    async def _bump_import_version(
+        self, conn: asyncpg.connection.Connection, import_id: int, delete=False
+    ) -> Optional[int]:
+        """Увеличить версию набора и уведомить подписчиков тем же запросом.
+
+        При delete=True набор заодно помечается удаленным. Возвращает новую
+        версию или None, если набора нет.
+        """
+        condition = import_table.c.import_id == import_id
+        if delete:
+            query = _delete_imports_query(condition)
+        else:
+            query = _bump_import_version_query(condition)
+        version = await conn.fetchval(query)
+        return version
+
+    async def _notify_import_changed(
+        self, conn: asyncpg.connection.Connection, import_id: int, version: int
+    ):
+        """Уведомить подписчиков. Уведомление доставляется после коммита транзакции.
+        """
+        await conn.fetchval(
+            sa.select([sa.func.pg_notify(IMPORTS_CHANNEL, f"{import_id}:{version}")])
+        )
+
     async def _next_import_id(self, conn: asyncpg.connection.Connection) -> int:
         t = await conn.fetchval(sa.select([import_seq.next_value()]))
         return t
@@ -361,8 +1178,22 @@ gender_enum = sa.Enum(Gender, name="citizen_gender")
 
 import_seq = sa.Sequence("import_seq")
 
+INT_ARRAY = postgresql.ARRAY(sa.Integer)
+
 import_table = sa.Table(
-    "import", meta, sa.Column("import_id", sa.Integer, primary_key=True)
+    "import",
+    meta,
+    sa.Column("import_id", sa.Integer, primary_key=True),
+    # Увеличивается при каждом изменении набора, служит ключом кэша ответов.
+    sa.Column("version", sa.Integer, nullable=False, server_default="0"),
+    sa.Column(
+        "created_at",
+        sa.DateTime(timezone=True),
+        nullable=False,
+        server_default=sa.func.now(),
+    ),
+    # Удаленный набор не виден читателям, пока его строки удаляются пачками.
+    sa.Column("deleted", sa.Boolean, nullable=False, server_default=sa.false()),
 )
 
 citizen_table = sa.Table(
@@ -400,21 +1231,244 @@ relative_table = sa.Table(
     ),
 )
 
+# Задания асинхронного импорта. Набор данных появляется в import только
+# в конце задания, поэтому import_id - не внешний ключ.
+import_job_table = sa.Table(
+    "import_job",
+    meta,
+    sa.Column("job_id", sa.Integer, primary_key=True),
+    sa.Column(
+        "status", sa.String, nullable=False, server_default=JobStatus.pending.name
+    ),
+    sa.Column("citizens_validated", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("citizens_inserted", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("import_id", sa.Integer),
+    sa.Column("error", postgresql.JSONB),
+    sa.Column(
+        "created_at",
+        sa.DateTime(timezone=True),
+        nullable=False,
+        server_default=sa.func.now(),
+    ),
+    sa.Column(
+        "updated_at",
+        sa.DateTime(timezone=True),
+        nullable=False,
+        server_default=sa.func.now(),
+    ),
+)
+
+# Аналитика, которая считается при импорте и поддерживается при обновлениях.
+
+birthday_presents_table = sa.Table(
+    "birthday_presents",
+    meta,
+    sa.Column("import_id", sa.Integer, sa.ForeignKey("import.import_id")),
+    sa.Column("citizen_id", sa.Integer),
+    sa.Column("month", sa.Integer),
+    sa.Column("presents", sa.Integer, nullable=False),
+    sa.PrimaryKeyConstraint("import_id", "citizen_id", "month"),
+)
+
+town_birth_dates_table = sa.Table(
+    "town_birth_dates",
+    meta,
+    sa.Column("import_id", sa.Integer, sa.ForeignKey("import.import_id")),
+    sa.Column("town", sa.String),
+    sa.Column("birth_date", sa.Date),
+    sa.Column("citizens", sa.Integer, nullable=False),
+    sa.PrimaryKeyConstraint("import_id", "town", "birth_date"),
+)
+
+# Жители с родственниками в колонке-массиве вместо таблицы relative.
+# Колонка добавляется к citizen в create_tables, таблица нужна только
+# для построения запросов.
+citizen_array_table = sa.Table(
+    citizen_table.name,
+    sa.MetaData(),
+    *(sa.Column(x.name, x.type, primary_key=x.primary_key) for x in citizen_table.c),
+    sa.Column("relatives", INT_ARRAY, nullable=False),
+)
+
+TABLES = [
+    import_table,
+    citizen_table,
+    relative_table,
+    birthday_presents_table,
+    town_birth_dates_table,
+    import_job_table,
+]
+
+AGE_PERCENTILES = [0.5, 0.75, 0.99]
+
+# Варианты секционирования жителей и родственников по import_id.
+PARTITIONING_NONE = "none"
+PARTITIONING_HASH = "hash"
+PARTITIONING_RANGE = "range"
+PARTITION_STRATEGIES = {PARTITIONING_HASH: "HASH", PARTITIONING_RANGE: "RANGE"}
+PARTITIONED_TABLES = [citizen_table, relative_table]
+# Варианты хранения родственников: строками в таблице relative,
+# по строке на каждое направление связи, или массивом в строке жителя.
+RELATIVES_TABLE = "table"
+RELATIVES_ARRAY = "array"
+# Таблицы с жителями и родственниками в порядке удаления.
+RELATIVES_LAYOUT_TABLES = {
+    RELATIVES_TABLE: [relative_table, citizen_table],
+    RELATIVES_ARRAY: [citizen_table],
+}
+
+RELATIVE_CITIZEN_FOREIGN_KEYS = [
+    ("citizen_id", "import_id"),
+    ("relative_citizen_id", "import_id"),
+]
+
+# Канал уведомлений об изменении наборов данных, payload "import_id:version".
+IMPORTS_CHANNEL = "gift_app_imports"
+
+# Создание и удаление секций набора: таймаут ожидания блокировки,
+# число попыток и пауза между ними, секунд.
+PARTITIONS_LOCK_TIMEOUT = "1s"
+PARTITIONS_LOCK_ATTEMPTS = 10
+PARTITIONS_LOCK_RETRY_DELAY = 1
+
+CITIZEN_COPY_COLUMNS = [
+    "import_id",
+    "citizen_id",
+    "town",
+    "street",
+    "building",
+    "apartment",
+    "name",
+    "birth_date",
+    "gender",
+]
+
+CITIZEN_ARRAY_COPY_COLUMNS = [*CITIZEN_COPY_COLUMNS, "relatives"]
 
-async def create_tables(conn: asyncpg.connection.Connection):
+RELATIVE_COPY_COLUMNS = ["import_id", "citizen_id", "relative_citizen_id"]
+
+
+async def create_tables(
+    conn: asyncpg.connection.Connection,
+    partitioning: str = PARTITIONING_NONE,
+    hash_partitions: int = 16,
+    relatives_layout: str = RELATIVES_TABLE,
+):
+    """Создать таблицы.
+
+    При partitioning="hash" жители и родственники делятся по import_id
+    на hash_partitions секций, при partitioning="range" у каждого импорта
+    своя секция, которая создается при импорте.
+
+    При relatives_layout="array" родственники хранятся в колонке relatives
+    таблицы citizen, а таблица relative не создается.
+    """
     stmt = sa.dialects.postgresql.CreateEnumType(gender_enum)
     await conn.execute(stmt)
 
     stmt = sa.schema.CreateSequence(import_seq)
     await conn.execute(stmt)
 
-    for table in [import_table, citizen_table, relative_table]:
+    tables = [
+        x
+        for x in TABLES
+        if x is not relative_table or relatives_layout == RELATIVES_TABLE
+    ]
+    for table in tables:
+        await _create_table(conn, table, partitioning)
+        if table is citizen_table and relatives_layout == RELATIVES_ARRAY:
+            await conn.execute(
+                f"ALTER TABLE {citizen_table.name} "
+                f"ADD COLUMN relatives integer[] NOT NULL DEFAULT '{{}}'"
+            )
+
+    if partitioning == PARTITIONING_HASH:
+        for remainder in range(hash_partitions):
+            bounds = (
+                f"FOR VALUES WITH (MODULUS {hash_partitions}, REMAINDER {remainder})"
+            )
+            await _create_partitions(conn, f"p{remainder}", bounds, relatives_layout)
+
+
+async def _create_table(
+    conn: asyncpg.connection.Connection, table: sa.Table, partitioning: str
+):
+    if partitioning == PARTITIONING_NONE or table not in PARTITIONED_TABLES:
         stmt = sa.schema.CreateTable(table)
         await conn.execute(stmt)
+        return
+    # Внешние ключи на секционированную таблицу появились только
+    # в Postgres 12, поэтому связи родственников с жителями
+    # создаются между секциями.
+    create = sa.schema.CreateTable(
+        table,
+        include_foreign_key_constraints=[
+            x
+            for x in table.foreign_key_constraints
+            if x.referred_table is not citizen_table
+        ],
+    )
+    ddl = str(create.compile(dialect=postgresql.dialect())).strip()
+    strategy = PARTITION_STRATEGIES[partitioning]
+    await conn.execute(f"{ddl} PARTITION BY {strategy} (import_id)")
+
+
+async def _create_partitions(
+    conn: asyncpg.connection.Connection,
+    suffix: str,
+    bounds: str,
+    relatives_layout: str = RELATIVES_TABLE,
+):
+    """Создать секции жителей и родственников и связи между ними.
+    """
+    for table in PARTITIONED_TABLES:
+        if table not in RELATIVES_LAYOUT_TABLES[relatives_layout]:
+            continue
+        await conn.execute(
+            f"CREATE TABLE {table.name}_{suffix} PARTITION OF {table.name} {bounds}"
+        )
+    if relatives_layout == RELATIVES_ARRAY:
+        return
+    for columns in RELATIVE_CITIZEN_FOREIGN_KEYS:
+        await conn.execute(
+            f"ALTER TABLE {relative_table.name}_{suffix} "
+            f"ADD CONSTRAINT fk_{relative_table.name}_{suffix}_{columns[0]} "
+            f"FOREIGN KEY ({', '.join(columns)}) "
+            f"REFERENCES {citizen_table.name}_{suffix} (citizen_id, import_id) "
+            f"DEFERRABLE INITIALLY DEFERRED"
+        )
+
+
+def _range_bounds(import_id: int) -> str:
+    return f"FOR VALUES FROM ({import_id}) TO ({import_id + 1})"
+
+
+async def retrieve_partitioning(conn: asyncpg.connection.Connection) -> str:
+    """Определить, как секционированы жители в базе.
+    """
+    strategy = await conn.fetchval(
+        "SELECT partstrat FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass($1)",
+        citizen_table.name,
+    )
+    partitioning = {"h": PARTITIONING_HASH, "r": PARTITIONING_RANGE}
+    return partitioning.get(strategy, PARTITIONING_NONE)
+
+
+async def retrieve_relatives_layout(conn: asyncpg.connection.Connection) -> str:
+    """Определить, как хранятся родственники в базе.
+    """
+    has_column = await conn.fetchval(
+        "SELECT true FROM pg_attribute "
+        "WHERE attrelid = to_regclass($1) AND attname = $2 AND NOT attisdropped",
+        citizen_table.name,
+        citizen_array_table.c.relatives.name,
+    )
+    return RELATIVES_ARRAY if has_column else RELATIVES_TABLE
 
 
 async def drop_tables(conn: asyncpg.connection.Connection):
-    for table in [import_table, citizen_table, relative_table]:
+    for table in reversed(TABLES):
         stmt = f"DROP TABLE IF EXISTS {table.name}"
         await conn.execute(stmt)
 
@@ -425,15 +1479,493 @@ async def drop_tables(conn: asyncpg.connection.Connection):
     await conn.execute(stmt)
 
 
-def _citizen_from_row(row) -> Citizen:
+def pool_sizes(config: Config) -> Tuple[int, int]:
+    """Минимальный и максимальный размер пула одного процесса сервера.
+
+    Предел соединений хоста делится поровну между процессами, чтобы их
+    общее число не зависело от числа процессов.
+    """
+    db = config.db
+    max_size = db.pool_max_size
+    if db.host_pool_max_size:
+        max_size = max(db.host_pool_max_size // config.server.workers, 1)
+    min_size = min(db.pool_min_size, max_size)
+    return min_size, max_size
+
+
+def _int_array(values: Iterable[int]):
+    """Список чисел одним параметром запроса с явным типом integer[].
+    """
+    return _array(values, sa.Integer)
+
+
+def _array(values: Iterable, item_type):
+    """Список значений одним параметром запроса с явным типом массива.
+    """
+    array_type = postgresql.ARRAY(item_type)
+    return sa.cast(sa.literal(list(values), type_=array_type), array_type)
+
+
+def _relatives_changes(
+    old_citizens: Dict[int, Citizen], new_relatives: Dict[int, Set[int]]
+) -> Tuple[Set[Tuple[int, int]], Set[Tuple[int, int]]]:
+    """Добавленные и удаленные связи, пары (меньший, больший citizen_id).
+
+    Если оба жителя связи обновляются, их новые списки должны
+    согласовываться друг с другом.
+    """
+    added, removed = set(), set()
+    for citizen_id, relatives in sorted(new_relatives.items()):
+        for relative in sorted(relatives):
+            if citizen_id not in new_relatives.get(relative, {citizen_id}):
+                raise InvalidUsage.bad_request(
+                    f"Родственник #{relative} жителя #{citizen_id} не признает его своим."
+                )
+        old_relatives = set(old_citizens[citizen_id].relatives)
+        for relative in relatives - old_relatives:
+            added.add((min(citizen_id, relative), max(citizen_id, relative)))
+        for relative in old_relatives - relatives:
+            removed.add((min(citizen_id, relative), max(citizen_id, relative)))
+    return added, removed
+
+
+def _apply_relatives_changes(
+    relatives: Dict[int, Set[int]],
+    added: Set[Tuple[int, int]],
+    removed: Set[Tuple[int, int]],
+):
+    """Применить изменения связей к множествам родственников известных жителей.
+    """
+    for changes, apply in [(removed, set.discard), (added, set.add)]:
+        for a, b in changes:
+            if a in relatives:
+                apply(relatives[a], b)
+            if b in relatives:
+                apply(relatives[b], a)
+
+
+def _relatives_edges(citizen_id: int, relatives: Iterable[int]) -> List[tuple]:
+    """Ребра родственных связей жителя в обе стороны.
+    """
+    edges = []
+    for relative in relatives:
+        edges.append((citizen_id, relative))
+        edges.append((relative, citizen_id))
+    return edges
+
+
+def _unnest_edges(edges: List[tuple], import_id: Optional[int] = None):
+    """Выборка ребер из двух массивов, при import_id с ним в первой колонке.
+    """
+    columns = [
+        sa.func.unnest(_int_array(x for x, _ in edges)),
+        sa.func.unnest(_int_array(x for _, x in edges)),
+    ]
+    if import_id is not None:
+        columns.insert(0, sa.cast(sa.literal(import_id), sa.Integer))
+    return sa.select(columns)
+
+
+def _citizens_with_relatives_query(
+    import_id: int,
+    citizen_id: Optional[int] = None,
+    citizen_ids: Optional[Iterable[int]] = None,
+):
+    """Жители набора со списком родственников, собранным в массив.
+
+    Если указан citizen_id, выбирается только один житель,
+    если citizen_ids - только указанные жители.
+    """
+    relatives = (
+        sa.select(
+            [
+                relative_table.c.citizen_id,
+                sa.func.array_agg(
+                    postgresql.aggregate_order_by(
+                        relative_table.c.relative_citizen_id,
+                        relative_table.c.relative_citizen_id,
+                    )
+                ).label("relatives"),
+            ]
+        )
+        .where(relative_table.c.import_id == import_id)
+        .group_by(relative_table.c.citizen_id)
+    )
+    query = sa.select([citizen_table]).where(citizen_table.c.import_id == import_id)
+    if citizen_id is not None:
+        relatives = relatives.where(relative_table.c.citizen_id == citizen_id)
+        query = query.where(citizen_table.c.citizen_id == citizen_id)
+    if citizen_ids is not None:
+        ids = _int_array(citizen_ids)
+        relatives = relatives.where(relative_table.c.citizen_id == sa.any_(ids))
+        query = query.where(citizen_table.c.citizen_id == sa.any_(ids))
+    relatives = relatives.alias("relatives")
+    query = (
+        query.column(relatives.c.relatives)
+        .select_from(
+            citizen_table.outerjoin(
+                relatives, relatives.c.citizen_id == citizen_table.c.citizen_id
+            )
+        )
+        .order_by(citizen_table.c.citizen_id)
+    )
+    return query
+
+
+def _citizens_with_relatives_array_query(
+    import_id: int,
+    citizen_id: Optional[int] = None,
+    citizen_ids: Optional[Iterable[int]] = None,
+):
+    """То же, что _citizens_with_relatives_query, для родственников в массиве.
+    """
+    table = citizen_array_table
+    query = (
+        sa.select([table])
+        .where(table.c.import_id == import_id)
+        .order_by(table.c.citizen_id)
+    )
+    if citizen_id is not None:
+        query = query.where(table.c.citizen_id == citizen_id)
+    if citizen_ids is not None:
+        query = query.where(table.c.citizen_id == sa.any_(_int_array(citizen_ids)))
+    return query
+
+
+def _asymmetric_relatives_query(import_id: int):
+    """Первая связь из массивов набора, у которой нет обратной.
+    """
+    table = citizen_array_table
+    edges = sa.select(
+        [
+            table.c.citizen_id,
+            sa.func.unnest(table.c.relatives).label("relative_citizen_id"),
+        ]
+    ).where(table.c.import_id == import_id)
+    forward = edges.alias("forward")
+    backward = edges.alias("backward")
+    query = (
+        sa.select([forward.c.citizen_id, forward.c.relative_citizen_id])
+        .select_from(
+            forward.outerjoin(
+                backward,
+                sa.and_(
+                    backward.c.citizen_id == forward.c.relative_citizen_id,
+                    backward.c.relative_citizen_id == forward.c.citizen_id,
+                ),
+            )
+        )
+        .where(backward.c.citizen_id.is_(None))
+        .order_by(forward.c.citizen_id, forward.c.relative_citizen_id)
+        .limit(1)
+    )
+    return query
+
+
+def _relatives_edges_source(relatives_layout: str):
+    """Источник связей жителей с родственниками для расчета аналитики.
+
+    Возвращает таблицу жителей, колонку родственника и список FROM.
+    """
+    if relatives_layout == RELATIVES_ARRAY:
+        relative = sa.column("relative_citizen_id")
+        edges = sa.func.unnest(citizen_array_table.c.relatives).alias(relative.name)
+        return citizen_array_table, relative, [citizen_array_table, edges]
+    joined = citizen_table.join(
+        relative_table,
+        sa.and_(
+            citizen_table.c.citizen_id == relative_table.c.citizen_id,
+            citizen_table.c.import_id == relative_table.c.import_id,
+        ),
+    )
+    return citizen_table, relative_table.c.relative_citizen_id, [joined]
+
+
+def _import_exists_query(import_id):
+    query = (
+        sa.select([import_table.c.import_id])
+        .where(import_table.c.import_id == import_id)
+        .where(~import_table.c.deleted)
+        .limit(1)
+    )
+    return query
+
+
+def _import_version_query(import_id):
+    query = (
+        sa.select([import_table.c.version])
+        .where(import_table.c.import_id == import_id)
+        .where(~import_table.c.deleted)
+    )
+    return query
+
+
+def _bump_import_version_query(condition, values: Optional[dict] = None):
+    """Увеличить версию неудаленных наборов и уведомить об этом подписчиков.
+    """
+    payload = (
+        sa.cast(import_table.c.import_id, sa.Text)
+        + ":"
+        + sa.cast(import_table.c.version, sa.Text)
+    )
+    query = (
+        import_table.update()
+        .where(condition)
+        .where(~import_table.c.deleted)
+        .values(version=import_table.c.version + 1, **(values or {}))
+        .returning(import_table.c.version, sa.func.pg_notify(IMPORTS_CHANNEL, payload))
+    )
+    return query
+
+
+def _delete_imports_query(condition):
+    """Пометить наборы удаленными. Новая версия сбрасывает их в кэшах.
+    """
+    return _bump_import_version_query(condition, {"deleted": True})
+
+
+async def _delete_in_batches(
+    conn: asyncpg.connection.Connection, table: sa.Table, import_id: int, batch_size
+):
+    """Удалить строки набора из таблицы пачками по первичному ключу.
+
+    Каждая пачка удаляется отдельной транзакцией, поэтому блокировки строк
+    держатся недолго и не копятся до конца удаления.
+    """
+    batch = table.alias("batch")
+    key = [x for x in table.primary_key.columns if x.name != "import_id"]
+    batch_key = [batch.c[x.name] for x in key]
+    query = (
+        table.delete()
+        .where(table.c.import_id == import_id)
+        .where(
+            sa.tuple_(*key).in_(
+                sa.select(batch_key)
+                .where(batch.c.import_id == import_id)
+                .limit(batch_size)
+            )
+        )
+    )
+    while True:
+        status = await conn.execute(query)
+        if int(status.split()[-1]) < batch_size:
+            break
+
+
+def _update_citizens_fields_query(
+    import_id: int, fields: Tuple[str, ...], updates: List[Tuple[int, dict]]
+):
+    """UPDATE одних и тех же полей у нескольких жителей.
+
+    Новые значения передаются массивами по колонкам и разворачиваются
+    в строки через unnest.
+    """
+    columns = [sa.func.unnest(_int_array(x for x, _ in updates)).label("citizen_id")]
+    for field in fields:
+        column = citizen_table.c[field]
+        values = [update[field] for _, update in updates]
+        if field == "gender":
+            values = sa.cast(
+                sa.func.unnest(_array((x.name for x in values), sa.String)), gender_enum
+            )
+        else:
+            values = sa.func.unnest(_array(values, column.type))
+        columns.append(values.label(field))
+    new = sa.select(columns).alias("new")
+    query = (
+        citizen_table.update()
+        .where(citizen_table.c.import_id == import_id)
+        .where(citizen_table.c.citizen_id == new.c.citizen_id)
+        .values({field: new.c[field] for field in fields})
+    )
+    return query
+
+
+def _birthdays_report_query(import_id):
+    query = (
+        sa.select(
+            [
+                birthday_presents_table.c.month,
+                birthday_presents_table.c.citizen_id,
+                birthday_presents_table.c.presents,
+            ]
+        )
+        .where(birthday_presents_table.c.import_id == import_id)
+        .order_by(birthday_presents_table.c.month, birthday_presents_table.c.citizen_id)
+    )
+    return query
+
+
+def _age_stats_query(import_id):
+    """Перцентили возраста жителей по городам.
+
+    Гистограмма хранит даты рождения, а не возраст: возраст меняется
+    со временем, поэтому перцентили считаются при чтении, но по строкам
+    гистограммы, без разворачивания в жителей. Как и percentile_cont,
+    уровень q интерполируется между k-м и (k+1)-м по возрасту жителем,
+    где k = floor(q * (n - 1)). Возраст k-го жителя - возраст первой строки,
+    на которой накопленное число жителей превышает k.
+    """
+    histogram = town_birth_dates_table
+    age = sa.func.date_part("year", sa.func.age(histogram.c.birth_date))
+    buckets = (
+        sa.select(
+            [
+                histogram.c.town,
+                age.label("age"),
+                sa.func.sum(histogram.c.citizens)
+                .over(partition_by=histogram.c.town, order_by=age)
+                .label("cumulative"),
+                sa.func.sum(histogram.c.citizens)
+                .over(partition_by=histogram.c.town)
+                .label("total"),
+            ]
+        )
+        .where(histogram.c.import_id == import_id)
+        .alias("buckets")
+    )
+    percentiles = []
+    for q in AGE_PERCENTILES:
+        position = sa.literal_column(str(q)) * (buckets.c.total - 1)
+        lower, upper = [
+            sa.func.min(buckets.c.age).filter(buckets.c.cumulative > rank)
+            for rank in [sa.func.floor(position), sa.func.ceil(position)]
+        ]
+        fraction = position - sa.func.floor(position)
+        percentiles.append(lower + (upper - lower) * fraction)
+    query = (
+        sa.select([buckets.c.town, *percentiles])
+        .group_by(buckets.c.town, buckets.c.total)
+        .order_by(buckets.c.town)
+    )
+    return query
+
+
+def _update_citizen_query(
+    import_id: int,
+    citizen_id: int,
+    values: dict,
+    relatives_layout: str = RELATIVES_TABLE,
+):
+    """UPDATE жителя, возвращающий новые колонки и старые с префиксом old_.
+
+    Таблица, присоединенная во FROM, видит строку до изменения.
+    Родственники до изменения собираются подзапросом или берутся из массива.
+    """
+    if relatives_layout == RELATIVES_ARRAY:
+        table = citizen_array_table
+    else:
+        table = citizen_table
+    old = table.alias("old")
+    old_columns = [column.label(f"old_{column.name}") for column in old.c]
+    if relatives_layout == RELATIVES_TABLE:
+        old_columns.append(_old_relatives_query(import_id, citizen_id))
+    if not values:
+        # Пустой UPDATE все равно нужен, чтобы вернуть жителя.
+        values = {"name": table.c.name}
+    query = (
+        table.update()
+        .where(table.c.import_id == import_id)
+        .where(table.c.citizen_id == citizen_id)
+        .where(old.c.import_id == table.c.import_id)
+        .where(old.c.citizen_id == table.c.citizen_id)
+        .values(**values)
+        .returning(*table.c, *old_columns)
+    )
+    return query
+
+
+def _old_relatives_query(import_id: int, citizen_id: int):
+    old_relatives = (
+        sa.select(
+            [
+                sa.func.array_agg(
+                    postgresql.aggregate_order_by(
+                        relative_table.c.relative_citizen_id,
+                        relative_table.c.relative_citizen_id,
+                    )
+                )
+            ]
+        )
+        .where(relative_table.c.import_id == import_id)
+        .where(relative_table.c.citizen_id == citizen_id)
+        .as_scalar()
+    )
+    return old_relatives.label("old_relatives")
+
+
+def _citizen_with_relatives_from_row(row) -> Citizen:
+    citizen = _citizen_from_row(row)
+    # У жителя без родственников LEFT JOIN дает NULL.
+    citizen.relatives = row["relatives"] or []
+    return citizen
+
+
+def _citizen_from_row(row, prefix: str = "") -> Citizen:
     citizen = Citizen(
-        citizen_id=row["citizen_id"],
-        town=row["town"],
-        street=row["street"],
-        building=row["building"],
-        apartment=row["apartment"],
-        name=row["name"],
-        birth_date=row["birth_date"],
-        gender=Gender.male if row["gender"] == "male" else Gender.female,
+        citizen_id=row[f"{prefix}citizen_id"],
+        town=row[f"{prefix}town"],
+        street=row[f"{prefix}street"],
+        building=row[f"{prefix}building"],
+        apartment=row[f"{prefix}apartment"],
+        name=row[f"{prefix}name"],
+        birth_date=row[f"{prefix}birth_date"],
+        gender=_decode_gender(row[f"{prefix}gender"]),
     )
     return citizen
+
+
+def _encode_gender(value) -> bytes:
+    # Бинарное представление enum в Postgres - метка в UTF-8. Кодек нужен
+    # бинарный, иначе copy_records_to_table не сможет передать пол.
+    # SQLAlchemy и COPY передают пол строкой, остальные запросы - Gender.
+    if isinstance(value, Gender):
+        value = value.name
+    return value.encode()
+
+
+def _decode_gender_label(value: bytes) -> Gender:
+    return Gender[value.decode()]
+
+
+def _decode_gender(value) -> Gender:
+    # На соединениях без кодека для citizen_gender пол приходит строкой.
+    if isinstance(value, Gender):
+        return value
+    return Gender[value]
+
+
+# Частые запросы компилируются один раз при импорте модуля.
+IMPORT_EXISTS_QUERY = CompiledQuery(_import_exists_query(sa.bindparam("import_id")))
+IMPORT_VERSION_QUERY = CompiledQuery(_import_version_query(sa.bindparam("import_id")))
+BIRTHDAYS_REPORT_QUERY = CompiledQuery(
+    _birthdays_report_query(sa.bindparam("import_id"))
+)
+AGE_STATS_QUERY = CompiledQuery(_age_stats_query(sa.bindparam("import_id")))
+LIST_CITIZENS_QUERY = CompiledQuery(
+    _citizens_with_relatives_query(sa.bindparam("import_id"))
+)
+RETRIEVE_CITIZEN_QUERY = CompiledQuery(
+    _citizens_with_relatives_query(
+        sa.bindparam("import_id"), sa.bindparam("citizen_id")
+    )
+)
+ARRAY_LIST_CITIZENS_QUERY = CompiledQuery(
+    _citizens_with_relatives_array_query(sa.bindparam("import_id"))
+)
+ARRAY_RETRIEVE_CITIZEN_QUERY = CompiledQuery(
+    _citizens_with_relatives_array_query(
+        sa.bindparam("import_id"), sa.bindparam("citizen_id")
+    )
+)
+ASYMMETRIC_RELATIVES_QUERY = CompiledQuery(
+    _asymmetric_relatives_query(sa.bindparam("import_id"))
+)
+LIST_CITIZENS_QUERIES = {
+    RELATIVES_TABLE: LIST_CITIZENS_QUERY,
+    RELATIVES_ARRAY: ARRAY_LIST_CITIZENS_QUERY,
+}
+RETRIEVE_CITIZEN_QUERIES = {
+    RELATIVES_TABLE: RETRIEVE_CITIZEN_QUERY,
+    RELATIVES_ARRAY: ARRAY_RETRIEVE_CITIZEN_QUERY,
+}
@@ -0,0 +1,224 @@
+"""Потоковый разбор тела импорта.
+
+Тело запроса читается из ``request.content`` порциями, жители валидируются
+по одному и отдаются пачками, так что загрузка в базу начинается до того,
+как клиент закончит передачу, а память зависит от размера пачки,
+а не от размера всего импорта.
+"""
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator, Callable, List
+
+from aiohttp import StreamReader, web
+from marshmallow import ValidationError
+
+from .models import Citizen
+from .schemas import collect_citizens_set_errors
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CHARS = re.compile(r"[-+0-9.eE]*")
+
+
+class JsonStreamParser:
+    """Инкрементальный json токенайзер поверх aiohttp.StreamReader.
+
+    Объекты и массивы верхних уровней разбираются по элементам,
+    а каждый элемент целиком декодируется стандартным json.
+    """
+
+    def __init__(
+        self, stream: StreamReader, chunk_size: int = 2 ** 16, max_size: int = None
+    ):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._max_size = max_size
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._size = 0
+        self._eof = False
+
+    async def peek(self) -> str:
+        """Пропустить пробелы и вернуть следующий значимый символ.
+
+        В конце потока возвращает пустую строку.
+        """
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not await self._fill():
+                return ""
+
+    async def read_value(self) -> Any:
+        """Прочитать очередное json значение целиком.
+        """
+        await self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Значение могло оборваться на границе порции.
+                if not await self._fill():
+                    raise
+                continue
+            # Число на границе порции могло быть прочитано не полностью:
+            # "-1." из "-1.5" тоже разбирается как число.
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                number_end = NUMBER_CHARS.match(self._buffer, self._pos).end()
+                if number_end == len(self._buffer) and await self._fill():
+                    continue
+            self._pos = end
+            return value
+
+    async def iter_object(self) -> AsyncIterator[str]:
+        """Итерировать ключи объекта.
+
+        Значение каждого ключа должен дочитать вызывающий код
+        до перехода к следующему ключу.
+        """
+        await self._expect("{")
+        if await self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if await self.peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = await self.read_value()
+            await self._expect(":")
+            yield key
+            if not await self._next_item("}"):
+                return
+
+    async def iter_array(self) -> AsyncIterator[Any]:
+        """Итерировать элементы массива.
+        """
+        await self._expect("[")
+        if await self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield await self.read_value()
+            if not await self._next_item("]"):
+                return
+
+    async def expect_end(self):
+        """Убедиться, что после разобранного значения в потоке ничего нет.
+        """
+        if await self.peek() != "":
+            raise self._error("Extra data")
+
+    async def _next_item(self, closing: str) -> bool:
+        char = await self.peek()
+        if char == ",":
+            self._pos += 1
+            return True
+        if char == closing:
+            self._pos += 1
+            return False
+        raise self._error(f"Expecting ',' delimiter")
+
+    async def _expect(self, char: str):
+        if await self.peek() != char:
+            raise self._error(f"Expecting '{char}'")
+        self._pos += 1
+
+    async def _fill(self) -> bool:
+        """Дочитать порцию данных в буфер.
+
+        Возвращает False, если поток закончился.
+        """
+        if self._eof:
+            return False
+        chunk = await self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            text = self._utf8.decode(b"", final=True)
+        else:
+            self._size += len(chunk)
+            if self._max_size is not None and self._size > self._max_size:
+                raise web.HTTPRequestEntityTooLarge(
+                    max_size=self._max_size, actual_size=self._size
+                )
+            text = self._utf8.decode(chunk)
+        self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+        return bool(text) or not self._eof
+
+    def _error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(msg, self._buffer, self._pos)
+
+
+async def load_citizens_batches(
+    parser: JsonStreamParser, load_citizen: Callable[[Any], Citizen], batch_size: int
+) -> AsyncIterator[List[Citizen]]:
+    """Разобрать импорт вида {"citizens": [...]} и отдавать жителей пачками.
+
+    Ошибки валидации копятся до конца потока и выбрасываются одним
+    ValidationError того же вида, что и у ImportsSchema. После первой
+    ошибки пачки больше не отдаются, но поток дочитывается до конца.
+    """
+    errors = {}
+    citizens_errors = {}
+    citizens_seen = False
+    # Повторы citizen_id или родственников сломают вставку в базу
+    # раньше, чем дойдет дело до проверок всего набора.
+    broken = False
+    seen_ids = set()
+    graph = []
+    batch = []
+    if await parser.peek() != "{":
+        await parser.read_value()
+        await parser.expect_end()
+        raise ValidationError({"_schema": ["Invalid input type."]})
+    async for key in parser.iter_object():
+        if key != "citizens":
+            await parser.read_value()
+            errors[key] = ["Unknown field."]
+            continue
+        if citizens_seen:
+            raise ValidationError({"citizens": ["Поле указано несколько раз."]})
+        citizens_seen = True
+        if await parser.peek() != "[":
+            value = await parser.read_value()
+            if value is None:
+                errors["citizens"] = ["Field may not be null."]
+            else:
+                errors["citizens"] = ["Not a valid list."]
+            continue
+        index = 0
+        async for item in parser.iter_array():
+            try:
+                citizen = load_citizen(item)
+            except ValidationError as exc:
+                citizens_errors[index] = exc.messages
+            else:
+                graph.append((citizen.citizen_id, citizen.relatives))
+                duplicated = citizen.citizen_id in seen_ids
+                if duplicated or len(set(citizen.relatives)) != len(citizen.relatives):
+                    broken = True
+                seen_ids.add(citizen.citizen_id)
+                if not (broken or errors or citizens_errors):
+                    batch.append(citizen)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+            index += 1
+    await parser.expect_end()
+
+    if not citizens_seen:
+        errors["citizens"] = ["Missing data for required field."]
+    if citizens_errors:
+        errors["citizens"] = citizens_errors
+    elif citizens_seen and "citizens" not in errors:
+        # Проверки всего набора, как в CitizenSchema, выполняются
+        # только при отсутствии ошибок в отдельных жителях.
+        schema_errors = collect_citizens_set_errors(graph)
+        if schema_errors:
+            errors["citizens"] = {"_schema": schema_errors}
+    if errors:
+        raise ValidationError(errors)
+    if batch:
+        yield batch
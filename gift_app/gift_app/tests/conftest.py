@@ -18,7 +18,10 @@ from gift_app.storage import Storage, create_tables
 @pytest.fixture(scope="session")
 def config():
     db_config = {"name": "test_db", "username": "postgres", "password": None}
-    config = Config({"db": db_config})
+    # Тесты с базой работают через одно соединение, и фоновое удаление
+    # пересекалось бы на нем со следующими запросами теста.
+    api_config = {"purge_in_background": False}
+    config = Config({"db": db_config, "api": api_config})
     return config
 
 
@@ -69,7 +72,11 @@ async def storage(loop, config, test_db, logger):
             async def initialize_mock(*x):
                 return
 
+            async def close_mock(*x):
+                return
+
             x.initialize = MagicMock(x.initialize, side_effect=initialize_mock)
+            x.close = MagicMock(x.close, side_effect=close_mock)
             x._pool = MagicMock(x._pool)
             x._pool.transaction.side_effect = transaction_mock
             x._pool.acquire.side_effect = acquire_mock
@@ -81,11 +88,11 @@ async def storage(loop, config, test_db, logger):
 
 @pytest.fixture
 async def app(loop, test_db, config, storage):
-    def configuraiton(binder: Binder):
+    def configuration(binder: Binder):
         binder.bind(Config, config)
         binder.bind(Storage, storage)
 
-    app = await init_func([], extra_modules=[configuraiton])
+    app = await init_func([], extra_modules=[configuration])
     return app
 
 
@@ -94,6 +101,48 @@ async def http(loop, aiohttp_client, app):
     return await aiohttp_client(app)
 
 
+class FakeStorage:
+    """Хранилище без базы данных.
+
+    Тесты наследуются от него и добавляют только нужные им методы.
+    """
+
+    async def initialize(self):
+        return self
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_config(config):
+    """Конфиг с настройками теста поверх окружения и тестовой базой.
+    """
+
+    def create(**overrides) -> Config:
+        fake_config = Config(overrides)
+        fake_config.db = config.db
+        return fake_config
+
+    return create
+
+
+@pytest.fixture
+async def fake_app(loop, aiohttp_client, fake_config):
+    """Клиент приложения поверх хранилища без базы данных.
+    """
+
+    async def create(storage: FakeStorage, **overrides):
+        def configuration(binder: Binder):
+            binder.bind(Config, fake_config(**overrides))
+            binder.bind(Storage, storage)
+
+        app = await init_func([], extra_modules=[configuration])
+        return await aiohttp_client(app)
+
+    return create
+
+
 def db_url(config, db_name):
     DSN = "postgresql://{username}:{password}@{host}/{db_name}"
     url = DSN.format(
@@ -0,0 +1,104 @@
+import datetime as dt
+
+import pytest
+import sqlalchemy as sa
+
+from gift_app.storage import (
+    Storage,
+    birthday_presents_table,
+    citizen_table,
+    relative_table,
+    town_birth_dates_table,
+)
+
+
+async def presents_from_scratch(storage: Storage, import_id: int):
+    """Подарки по месяцам, посчитанные заново по таблицам жителей и родни.
+    """
+    birth_month = sa.func.date_part("month", citizen_table.c.birth_date).cast(
+        sa.Integer
+    )
+    joined = citizen_table.join(
+        relative_table,
+        sa.and_(
+            citizen_table.c.citizen_id == relative_table.c.citizen_id,
+            citizen_table.c.import_id == relative_table.c.import_id,
+        ),
+    )
+    async with storage.pool.acquire() as conn:
+        rows = await conn.fetch(
+            sa.select(
+                [birth_month, relative_table.c.relative_citizen_id, sa.func.count()]
+            )
+            .select_from(joined)
+            .where(citizen_table.c.import_id == import_id)
+            .group_by(birth_month, relative_table.c.relative_citizen_id)
+        )
+    return sorted(tuple(row) for row in rows)
+
+
+async def stored_presents(storage: Storage, import_id: int):
+    presents = birthday_presents_table
+    async with storage.pool.acquire() as conn:
+        rows = await conn.fetch(
+            sa.select([presents.c.month, presents.c.citizen_id, presents.c.presents])
+            .where(presents.c.import_id == import_id)
+            .where(presents.c.presents > 0)
+        )
+    return sorted(tuple(row) for row in rows)
+
+
+async def town_birth_dates(storage: Storage, import_id: int):
+    histogram = town_birth_dates_table
+    async with storage.pool.acquire() as conn:
+        rows = await conn.fetch(
+            sa.select(
+                [histogram.c.town, histogram.c.birth_date, histogram.c.citizens]
+            ).where(histogram.c.import_id == import_id)
+        )
+    return sorted(tuple(row) for row in rows)
+
+
+async def test_analytics_built_on_import(storage: Storage, import_batch_first):
+    """Аналитика строится при импорте.
+    """
+    assert await stored_presents(storage, import_batch_first) == (
+        await presents_from_scratch(storage, import_batch_first)
+    )
+    assert await town_birth_dates(storage, import_batch_first) == [
+        ("Керчь", dt.date(1986, 11, 23), 1),
+        ("Москва", dt.date(1986, 12, 26), 1),
+        ("Москва", dt.date(1997, 4, 1), 1),
+    ]
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        {"birth_date": dt.date(1986, 4, 23)},
+        {"relatives": [1, 2]},
+        {"relatives": []},
+        {"town": "Москва"},
+        {"town": "Москва", "birth_date": dt.date(1997, 4, 1), "relatives": [2]},
+    ],
+)
+async def test_analytics_follow_updates(storage: Storage, import_batch_first, update):
+    """Аналитика после обновления жителя совпадает с пересчетом с нуля.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    await storage.update_citizen(import_id, 1, {"relatives": [2, 3]})
+    # ACT
+    await storage.update_citizen(import_id, 3, dict(update))
+    # ASSERT
+    assert await stored_presents(storage, import_id) == (
+        await presents_from_scratch(storage, import_id)
+    )
+    citizens = await storage.list_citizens(import_id)
+    histogram = {}
+    for citizen in citizens:
+        key = (citizen.town, citizen.birth_date)
+        histogram[key] = histogram.get(key, 0) + 1
+    assert await town_birth_dates(storage, import_id) == sorted(
+        (town, birth_date, count) for (town, birth_date), count in histogram.items()
+    )
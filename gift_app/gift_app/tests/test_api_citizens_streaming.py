@@ -0,0 +1,107 @@
+import pytest
+from injector import Binder
+
+from gift_app.config import Config
+from gift_app.errors import InvalidUsage
+from gift_app.main import init_func
+from gift_app.schemas import CitizenSchema
+from gift_app.storage import Storage
+
+from . import conftest
+
+STREAMING_API = {"streaming_citizens_list": True, "citizens_list_batch_size": 2}
+
+
+class FakeStorage(conftest.FakeStorage):
+    """Хранилище с одним набором данных в памяти.
+    """
+
+    def __init__(self, citizens):
+        self.citizens = citizens
+        self.closed = False
+
+    async def iter_citizens(self, import_id, batch_size):
+        if import_id != 1:
+            raise InvalidUsage.not_found(f"Набора данных №{import_id} не найдено.")
+        try:
+            for i in range(0, len(self.citizens), batch_size):
+                yield self.citizens[i : i + batch_size]
+            if not self.citizens:
+                yield []
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def fake_storage(citizen_ivan, citizen_sergei, citizen_maria):
+    return FakeStorage([citizen_ivan, citizen_sergei, citizen_maria])
+
+
+@pytest.fixture
+async def fake_http(fake_app, fake_storage):
+    return await fake_app(fake_storage, api=STREAMING_API)
+
+
+async def test_streaming_list_is_valid_json(fake_http, fake_storage):
+    """Список жителей, отданный по частям, совпадает с обычной сериализацией.
+    """
+    # ACT
+    rv = await fake_http.get("/imports/1/citizens")
+    # ASSERT
+    assert rv.status == 200, await rv.text()
+    assert rv.content_type == "application/json"
+    jsn = await rv.json()
+    assert jsn == {"data": CitizenSchema(many=True).dump(fake_storage.citizens)}
+    assert fake_storage.closed
+
+
+@pytest.mark.parametrize("citizens_count", [0, 1, 2])
+async def test_streaming_list_edge_sizes(fake_http, fake_storage, citizens_count):
+    """Пустой набор и набор ровно на одну пачку сериализуются корректно.
+    """
+    # ARRANGE
+    fake_storage.citizens = fake_storage.citizens[:citizens_count]
+    # ACT
+    rv = await fake_http.get("/imports/1/citizens")
+    # ASSERT
+    assert rv.status == 200, await rv.text()
+    jsn = await rv.json()
+    assert len(jsn["data"]) == citizens_count
+
+
+async def test_streaming_list_unknown_import(fake_http):
+    """Несуществующий набор дает 404 и в потоковом режиме.
+    """
+    # ACT
+    rv = await fake_http.get("/imports/2/citizens")
+    # ASSERT
+    assert rv.status == 404, await rv.text()
+
+
+@pytest.fixture
+async def app(loop, test_db, fake_config, storage):
+    """Приложение с потоковой выдачей списка жителей.
+    """
+
+    def configuration(binder: Binder):
+        binder.bind(Config, fake_config(api=STREAMING_API))
+        binder.bind(Storage, storage)
+
+    app = await init_func([], extra_modules=[configuration])
+    return app
+
+
+async def test_streaming_list_from_db(
+    http, storage, import_batch_first, married_ivan_and_maria
+):
+    """Список жителей из базы в потоковом режиме совпадает с list_citizens.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    citizens = await storage.list_citizens(import_id)
+    # ACT
+    rv = await http.get(f"/imports/{import_id}/citizens")
+    # ASSERT
+    assert rv.status == 200, await rv.text()
+    jsn = await rv.json()
+    assert jsn == {"data": CitizenSchema(many=True).dump(citizens)}
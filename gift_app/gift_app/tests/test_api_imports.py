@@ -157,3 +157,22 @@ async def test_cannot_have_birth_date_in_future(
     assert rv.status == 400, await rv.text()
     jsn = await rv.json()
     assert "birth_date" in str(jsn["error"])
+
+
+async def test_delete_import(http, imports_sample):
+    """Удаленный набор данных больше не отдается, в том числе из кэша.
+    """
+    # ARRANGE
+    rv = await http.post("/imports", json=imports_sample)
+    import_id = (await rv.json())["data"]["import_id"]
+    rv = await http.get(f"/imports/{import_id}/citizens/birthdays")
+    assert rv.status == 200, await rv.text()
+    # ACT
+    rv = await http.delete(f"/imports/{import_id}")
+    # ASSERT
+    assert rv.status == 200, await rv.text()
+    assert (await rv.json())["data"] == {"import_id": import_id}
+    rv = await http.get(f"/imports/{import_id}/citizens/birthdays")
+    assert rv.status == 404, await rv.text()
+    rv = await http.delete(f"/imports/{import_id}")
+    assert rv.status == 404, await rv.text()
@@ -1,3 +1,13 @@
+import datetime as dt
+import random
+
+import numpy as np
+import sqlalchemy as sa
+
+from gift_app.models import Citizen, Gender, TownAgeStat
+from gift_app.storage import Storage, citizen_table
+
+
 async def test_percentile_example_ok(http, import_batch_first):
     """Пример статистики по городам из задания работает как надо.
     """
@@ -12,3 +22,47 @@ async def test_percentile_example_ok(http, import_batch_first):
             {"town": "Москва", "p50": 27.0, "p75": 29.5, "p99": 31.9},
         ]
     }
+
+
+async def test_percentiles_match_numpy(storage: Storage):
+    """Перцентили из базы совпадают с np.percentile по возрастам жителей.
+    """
+    # ARRANGE
+    rnd = random.Random(0)
+    citizens = [
+        Citizen(
+            citizen_id=citizen_id,
+            town=rnd.choice(["Москва", "Керчь", "Тверь"]),
+            street="Льва Толстого",
+            building="16к7стр5",
+            apartment=7,
+            name="Иванов Иван Иванович",
+            birth_date=dt.date(1940, 1, 1) + dt.timedelta(days=rnd.randrange(25000)),
+            gender=Gender.male,
+            relatives=[],
+        )
+        for citizen_id in range(1, 300)
+    ]
+    import_id = await storage.import_citizens(citizens)
+    age = sa.func.date_part("year", sa.func.age(citizen_table.c.birth_date))
+    async with storage.pool.acquire() as conn:
+        rows = await conn.fetch(
+            sa.select([citizen_table.c.town, age]).where(
+                citizen_table.c.import_id == import_id
+            )
+        )
+    ages = {}
+    for town, citizen_age in rows:
+        ages.setdefault(town, []).append(citizen_age)
+    expected = []
+    for town in sorted(ages):
+        p50, p75, p99 = np.percentile(ages[town], [50, 75, 99])
+        expected.append(
+            TownAgeStat(
+                town=town, p50=round(p50, 2), p75=round(p75, 2), p99=round(p99, 2)
+            )
+        )
+    # ACT
+    stats = await storage.retrieve_age_stats(import_id)
+    # ASSERT
+    assert stats == expected
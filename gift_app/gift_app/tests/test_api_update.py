@@ -105,3 +105,62 @@ async def test_maria_can_divorce(
             "relatives": [],
         }
     }
+
+
+async def test_can_update_citizens_in_bulk(
+    http,
+    citizen_ivan: Citizen,
+    citizen_sergei: Citizen,
+    citizen_maria: Citizen,
+    import_batch_first: int,
+):
+    """Несколько жителей обновляются одним запросом, связи остаются двусторонними.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    data = {
+        "citizens": [
+            {"citizen_id": citizen_maria.citizen_id, "relatives": [1], "town": "Тверь"},
+            {"citizen_id": citizen_sergei.citizen_id, "relatives": []},
+        ]
+    }
+    # ACT
+    rv = await http.patch(f"/imports/{import_id}/citizens", json=data)
+    # ASSERT
+    assert rv.status == 200, await rv.json()
+    jsn = await rv.json()
+    assert [(x["citizen_id"], x["relatives"]) for x in jsn["data"]] == [
+        (3, [1]),
+        (2, []),
+    ]
+    assert jsn["data"][0]["town"] == "Тверь"
+    rv = await http.get(f"/imports/{import_id}/citizens")
+    jsn = await rv.json()
+    assert [x["relatives"] for x in jsn["data"]] == [[3], [], [1]]
+
+
+@pytest.mark.parametrize(
+    "citizens,status",
+    [
+        (
+            [{"citizen_id": 3, "relatives": [1]}, {"citizen_id": 1, "relatives": []}],
+            400,
+        ),
+        ([{"citizen_id": 3}, {"citizen_id": 3}], 400),
+        ([{"relatives": []}], 400),
+        ([{"citizen_id": 3, "relatives": [4]}], 400),
+        ([{"citizen_id": 4, "name": "Некто"}], 404),
+    ],
+)
+async def test_bulk_update_is_validated(http, import_batch_first, citizens, status):
+    """Противоречивые, повторные и неизвестные обновления отклоняются целиком.
+    """
+    # ACT
+    rv = await http.patch(
+        f"/imports/{import_batch_first}/citizens", json={"citizens": citizens}
+    )
+    # ASSERT
+    assert rv.status == status, await rv.json()
+    rv = await http.get(f"/imports/{import_batch_first}/citizens")
+    jsn = await rv.json()
+    assert [x["relatives"] for x in jsn["data"]] == [[2], [1], []]
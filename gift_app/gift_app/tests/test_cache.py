@@ -0,0 +1,206 @@
+import datetime as dt
+from unittest.mock import patch
+
+from gift_app.cache import ResponseCache
+from gift_app.models import Citizen
+
+
+def test_cache_returns_stored_body():
+    """Сохраненный ответ возвращается по ключу, промахи и попадания считаются.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    # ACT
+    miss = cache.get((1, "list_citizens", 0))
+    cache.put((1, "list_citizens", 0), b"[]")
+    hit = cache.get((1, "list_citizens", 0))
+    # ASSERT
+    assert miss is None
+    assert hit == b"[]"
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+        "invalidations": 0,
+        "entries": 1,
+        "size_bytes": 2,
+        "max_bytes": 100,
+        "tracking": False,
+    }
+
+
+def test_cache_evicts_least_recently_used():
+    """При превышении размера вытесняются давно не запрошенные записи.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=10)
+    cache.put((1, "a", 0), b"1234")
+    cache.put((2, "a", 0), b"1234")
+    cache.get((1, "a", 0))
+    # ACT
+    cache.put((3, "a", 0), b"1234")
+    # ASSERT
+    assert cache.get((1, "a", 0)) == b"1234"
+    assert cache.get((2, "a", 0)) is None
+    assert cache.get((3, "a", 0)) == b"1234"
+    assert cache.evictions == 1
+    assert cache.size_bytes == 8
+
+
+def test_cache_skips_too_large_body():
+    """Ответ больше лимита не кэшируется, при нулевом лимите кэш пуст.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=0)
+    # ACT
+    cache.put((1, "a", 0), b"1")
+    # ASSERT
+    assert len(cache) == 0
+    assert cache.size_bytes == 0
+
+
+def test_cache_replaces_same_key():
+    """Повторная запись по ключу не удваивает занятый размер.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=10)
+    cache.put((1, "a", 0), b"1234")
+    # ACT
+    cache.put((1, "a", 0), b"12")
+    # ASSERT
+    assert cache.get((1, "a", 0)) == b"12"
+    assert cache.size_bytes == 2
+
+
+def test_cache_invalidate_import():
+    """Инвалидация удаляет все записи одного набора данных.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    cache.put((1, "a", 0), b"1")
+    cache.put((1, "b", 1), b"2")
+    cache.put((2, "a", 0), b"3")
+    # ACT
+    cache.invalidate(1)
+    # ASSERT
+    assert len(cache) == 1
+    assert cache.get((2, "a", 0)) == b"3"
+    assert cache.size_bytes == 1
+
+
+def test_cache_trusts_versions_only_while_tracking():
+    """Запомненные версии используются только при подписке на уведомления.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    cache.remember_version(1, 3, cache.generation)
+    assert cache.known_version(1) is None
+    # ACT
+    cache.start_tracking()
+    cache.remember_version(1, 3, cache.generation)
+    # ASSERT
+    assert cache.known_version(1) == 3
+    cache.stop_tracking()
+    assert cache.known_version(1) is None
+
+
+def test_cache_ignores_version_read_before_tracking():
+    """Версия, прочитанная из базы до подписки, не запоминается.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    generation = cache.generation
+    # ACT
+    cache.start_tracking()
+    cache.remember_version(1, 3, generation)
+    # ASSERT
+    assert cache.known_version(1) is None
+
+
+def test_cache_notification_invalidates_import():
+    """Уведомление о новой версии сбрасывает записи набора.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    cache.start_tracking()
+    cache.remember_version(1, 0, cache.generation)
+    cache.put((1, "a", 0), b"1")
+    cache.put((2, "a", 0), b"2")
+    # ACT
+    cache.set_version(1, 1)
+    # ASSERT
+    assert cache.known_version(1) == 1
+    assert cache.get((1, "a", 0)) is None
+    assert cache.get((2, "a", 0)) == b"2"
+    assert cache.invalidations == 1
+
+
+def test_cache_keeps_newest_version():
+    """Версия, прочитанная из базы, не перетирает более новую из уведомления,
+    а ответ по старой версии не кэшируется.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    cache.start_tracking()
+    generation = cache.generation
+    cache.set_version(1, 2)
+    # ACT
+    cache.remember_version(1, 1, generation)
+    cache.put((1, "a", 1), b"1")
+    # ASSERT
+    assert cache.known_version(1) == 2
+    assert len(cache) == 0
+
+
+async def test_update_is_visible_after_cached_read(
+    http, citizen_maria: Citizen, import_batch_first: int
+):
+    """После изменения жителя закэшированные ответы не отдаются.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    citizen_id = citizen_maria.citizen_id
+    await http.get(f"/imports/{import_id}/citizens")
+    rv = await http.get(f"/imports/{import_id}/citizens")
+    assert rv.status == 200
+    stats = (await (await http.get("/x/cache")).json())["data"]
+    assert stats["hits"] == 1
+    # ACT
+    await http.patch(
+        f"/imports/{import_id}/citizens/{citizen_id}", json={"name": "Мария"}
+    )
+    rv = await http.get(f"/imports/{import_id}/citizens")
+    # ASSERT
+    assert rv.status == 200
+    jsn = await rv.json()
+    names = {x["citizen_id"]: x["name"] for x in jsn["data"]}
+    assert names[citizen_id] == "Мария"
+
+
+async def test_cached_import_not_found(http):
+    """Запрос несуществующего набора возвращает 404 и не кэшируется.
+    """
+    # ACT
+    rv = await http.get("/imports/999999/citizens/birthdays")
+    # ASSERT
+    assert rv.status == 404
+    stats = (await (await http.get("/x/cache")).json())["data"]
+    assert stats["entries"] == 0
+
+
+async def test_age_stats_are_cached_per_day(http, import_batch_first: int):
+    """Возрасты меняются со временем, поэтому перцентили кэшируются на день.
+    """
+    # ARRANGE
+    url = f"/imports/{import_batch_first}/towns/stat/percentile/age"
+    await http.get(url)
+    tomorrow = dt.date.today() + dt.timedelta(days=1)
+    # ACT
+    with patch("gift_app.decorators.dt") as fake_dt:
+        fake_dt.date.today.return_value = tomorrow
+        rv = await http.get(url)
+    # ASSERT
+    assert rv.status == 200
+    stats = (await (await http.get("/x/cache")).json())["data"]
+    assert stats["hits"] == 0
+    assert stats["entries"] == 2
@@ -0,0 +1,190 @@
+import copy
+import datetime as dt
+import random
+
+import pytest
+from marshmallow import ValidationError
+
+from gift_app.fast_schemas import FastImportsSchema
+from gift_app.schemas import CitizenSchema, ImportsSchema
+
+TODAY = dt.date.today()
+
+FIELD_VALUES = {
+    "citizen_id": [0, 1, 2, 3, -1, "1", "x", 1.0, 1.5, True, None, [], 2 ** 70],
+    "apartment": [0, 7, -7, "7", 7.0, 7.9, False, None, {}],
+    "town": ["Москва", "", "x" * 257, "x" * 258, 1, None, [], b"x", " "],
+    "street": ["Льва Толстого", "", None, 0],
+    "building": ["16к7стр5", "", ["2"]],
+    "name": ["Иванов Иван Иванович", "", "x" * 300, 5],
+    "birth_date": [
+        "26.12.1986",
+        "1.1.1986",
+        "01.01.86",
+        "01.01.0001",
+        "00.01.2000",
+        "31.02.2000",
+        "29.02.2000",
+        "29.02.2019",
+        "01.13.2000",
+        " 01.01.2000",
+        "01.01.2000 ",
+        "01-01-2000",
+        "٠١.٠١.٢٠٠٠",
+        "",
+        None,
+        19861226,
+        TODAY.strftime("%d.%m.%Y"),
+        (TODAY - dt.timedelta(days=1)).strftime("%d.%m.%Y"),
+        (TODAY + dt.timedelta(days=1)).strftime("%d.%m.%Y"),
+    ],
+    "gender": ["male", "female", "helicopter", "Male", "", None, 1, ["male"]],
+    "relatives": [
+        [],
+        [1],
+        [2],
+        [1, 2],
+        [2, 2],
+        [88],
+        [-1],
+        ["2"],
+        [True],
+        [2.0],
+        None,
+        "2",
+        {},
+    ],
+}
+
+
+def assert_same_result(data):
+    """Загрузка быстрой схемой дает тот же результат, что и ImportsSchema.
+    """
+    try:
+        expected = ImportsSchema().load(copy.deepcopy(data))
+    except ValidationError as exc:
+        with pytest.raises(ValidationError) as actual:
+            FastImportsSchema().load(copy.deepcopy(data))
+        assert actual.value.messages == exc.messages
+    else:
+        assert FastImportsSchema().load(copy.deepcopy(data)) == expected
+
+
+@pytest.fixture
+def imports_sample(citizen_ivan_sample, citizen_sergei_sample, citizen_maria_sample):
+    d = {"citizens": [citizen_ivan_sample, citizen_sergei_sample, citizen_maria_sample]}
+    return d
+
+
+def test_sample_is_loaded(imports_sample):
+    """Пример импорта из задания загружается так же, как схемой.
+    """
+    assert_same_result(imports_sample)
+
+
+@pytest.mark.parametrize(
+    "field,value",
+    [(field, value) for field, values in FIELD_VALUES.items() for value in values],
+)
+def test_field_values(imports_sample, field, value):
+    """Значения отдельных полей обрабатываются так же, как схемой.
+    """
+    imports_sample["citizens"][0][field] = value
+    assert_same_result(imports_sample)
+
+
+@pytest.mark.parametrize("field", sorted(FIELD_VALUES))
+def test_missing_field(imports_sample, field):
+    """Отсутствие поля дает ту же ошибку.
+    """
+    del imports_sample["citizens"][1][field]
+    assert_same_result(imports_sample)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        None,
+        [],
+        "citizens",
+        {},
+        {"citizens": None},
+        {"citizens": []},
+        {"citizens": {}},
+        {"citizens": "x"},
+        {"citizens": [None]},
+        {"citizens": [[]]},
+        {"citizens": [], "unknown": 1},
+    ],
+)
+def test_import_shapes(data):
+    """Структура импорта проверяется так же, как схемой.
+    """
+    assert_same_result(data)
+
+
+def test_unknown_citizen_field(imports_sample):
+    """Лишнее поле жителя дает ту же ошибку.
+    """
+    imports_sample["citizens"][2]["unknown"] = 1
+    assert_same_result(imports_sample)
+
+
+@pytest.mark.parametrize(
+    "relatives",
+    [
+        ([2], [1], []),
+        ([2], [], []),
+        ([], [], [3]),
+        ([1], [], []),
+        ([2, 3], [1], [1]),
+        ([2, 3], [1, 3], [2]),
+        ([2, 2], [1], []),
+        ([88], [99], []),
+        ([3, 2], [], []),
+    ],
+)
+def test_relatives_graph(imports_sample, relatives):
+    """Ошибки графа родственников совпадают с ошибками схемы.
+    """
+    for citizen, citizen_relatives in zip(imports_sample["citizens"], relatives):
+        citizen["relatives"] = list(citizen_relatives)
+    assert_same_result(imports_sample)
+
+
+def test_duplicated_citizens(imports_sample):
+    """Повторы citizen_id дают ту же ошибку.
+    """
+    imports_sample["citizens"][1]["citizen_id"] = 1
+    assert_same_result(imports_sample)
+
+
+def test_random_mutations(imports_sample):
+    """Случайные сочетания значений полей обрабатываются так же, как схемой.
+    """
+    rnd = random.Random(0)
+    for _ in range(500):
+        data = copy.deepcopy(imports_sample)
+        for _ in range(rnd.randint(1, 3)):
+            citizen = rnd.choice(data["citizens"])
+            field = rnd.choice(sorted(FIELD_VALUES))
+            if rnd.random() < 0.1:
+                citizen.pop(field, None)
+            else:
+                citizen[field] = copy.deepcopy(rnd.choice(FIELD_VALUES[field]))
+        assert_same_result(data)
+
+
+@pytest.mark.parametrize("field,value", [("gender", "helicopter"), ("apartment", 1)])
+def test_load_citizen(citizen_ivan_sample, field, value):
+    """Загрузка одного жителя совпадает с CitizenSchema.
+    """
+    citizen_ivan_sample[field] = value
+    try:
+        expected = CitizenSchema().load(dict(citizen_ivan_sample))
+    except ValidationError as exc:
+        with pytest.raises(ValidationError) as actual:
+            FastImportsSchema().load_citizen(dict(citizen_ivan_sample))
+        assert actual.value.messages == exc.messages
+    else:
+        assert FastImportsSchema().load_citizen(dict(citizen_ivan_sample)) == expected
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from gift_app.benchmarks.generator import generate_import_payload
+from gift_app.config import Config
+from gift_app.errors import InvalidUsage
+from gift_app.jobs import ImportJobs
+from gift_app.models import ImportJob, JobStatus
+from gift_app.parsing import ImportParser
+from gift_app.serialization import JsonSerializer
+
+from . import conftest
+
+
+class FakeStorage(conftest.FakeStorage):
+    """Хранилище заданий и импортов в памяти.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.imports = {}
+        self.progress = []
+        self.hidden = []
+        self.purged = []
+        self.purge_allowed = None
+
+    async def create_import_job(self) -> int:
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = ImportJob(job_id, JobStatus.pending, 0, 0)
+        return job_id
+
+    async def update_import_job(self, job_id, **values):
+        job = self.jobs[job_id]
+        for name, value in values.items():
+            setattr(job, name, value)
+        self.progress.append((job.citizens_validated, job.citizens_inserted))
+
+    async def retrieve_import_job(self, job_id) -> ImportJob:
+        if job_id not in self.jobs:
+            raise InvalidUsage.not_found()
+        return self.jobs[job_id]
+
+    async def hide_import(self, import_id):
+        self.hidden.append(import_id)
+
+    async def purge_import(self, import_id):
+        await self.purge_allowed.wait()
+        self.purged.append(import_id)
+
+    async def import_citizens_stream(self, batches):
+        import_id = len(self.imports) + 1
+        citizens = []
+        async for batch in batches:
+            citizens.extend(batch)
+        self.imports[import_id] = citizens
+        return import_id
+
+
+def create_jobs(config: Config, storage: FakeStorage) -> ImportJobs:
+    logger = logging.getLogger(__name__)
+    jobs = ImportJobs(storage, ImportParser(config, logger), config, logger)
+    return jobs
+
+
+@pytest.fixture
+def fake_storage():
+    return FakeStorage()
+
+
+@pytest.fixture
+def import_body(citizen_ivan_sample, citizen_sergei_sample, citizen_maria_sample):
+    data = {
+        "citizens": [citizen_ivan_sample, citizen_sergei_sample, citizen_maria_sample]
+    }
+    return JsonSerializer().dumps(data)
+
+
+@pytest.fixture
+async def jobs_http(fake_app, fake_storage):
+    return await fake_app(fake_storage)
+
+
+async def wait_job(storage: FakeStorage, job_id: int) -> ImportJob:
+    for _ in range(100):
+        job = storage.jobs[job_id]
+        if job.status in (JobStatus.done, JobStatus.failed):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} is not finished")
+
+
+async def test_job_reports_progress(fake_config, fake_storage, import_body):
+    """Задание отмечает провалидированных и записанных жителей пачками.
+    """
+    # ARRANGE
+    jobs = create_jobs(fake_config(api={"import_batch_size": 2}), fake_storage)
+    jobs.start()
+    try:
+        # ACT
+        job_id = await jobs.submit(import_body)
+        job = await wait_job(fake_storage, job_id)
+    finally:
+        await jobs.stop()
+    # ASSERT
+    assert job == ImportJob(job_id, JobStatus.done, 3, 3, import_id=1)
+    assert len(fake_storage.imports[1]) == 3
+    assert fake_storage.progress == [(0, 0), (3, 0), (3, 2), (3, 3), (3, 3)]
+
+
+async def test_job_keeps_validation_errors(
+    fake_config, fake_storage, citizen_ivan_sample
+):
+    """Ошибки валидации сохраняются в задании в том же виде, что и в ответе 400.
+    """
+    # ARRANGE
+    jobs = create_jobs(fake_config(), fake_storage)
+    jobs.start()
+    body = JsonSerializer().dumps({"citizens": [citizen_ivan_sample]})
+    try:
+        # ACT
+        job_id = await jobs.submit(body)
+        job = await wait_job(fake_storage, job_id)
+    finally:
+        await jobs.stop()
+    # ASSERT
+    assert job.status == JobStatus.failed
+    assert job.error == {
+        "citizens": {"_schema": ["У жителя #1 не найден родственник #2."]}
+    }
+    assert not fake_storage.imports
+
+
+async def test_job_waits_for_parse_slot(fake_config, fake_storage, import_body):
+    """Задание при занятой очереди разбора ждет, а не падает с 503, и разбирается
+    в процессе, даже если пул для POST /imports не настроен.
+    """
+    # ARRANGE
+    jobs = create_jobs(fake_config(api={"parse_queue_size": 1}), fake_storage)
+    jobs.start()
+    big_body = JsonSerializer().dumps(generate_import_payload(20000, 2, seed=0))
+    try:
+        parsing = asyncio.ensure_future(jobs.parser.parse_citizens(big_body))
+        await asyncio.sleep(0)
+        # ACT
+        job_id = await jobs.submit(import_body)
+        with pytest.raises(InvalidUsage) as exc:
+            await jobs.parser.parse_citizens(import_body)
+        citizens = await parsing
+        job = await wait_job(fake_storage, job_id)
+        executor = jobs.parser._executor
+    finally:
+        await jobs.stop()
+        await jobs.parser.stop()
+    # ASSERT
+    assert exc.value.status_code == 503
+    assert len(citizens) == 20000
+    assert job == ImportJob(job_id, JobStatus.done, 3, 3, import_id=1)
+    assert isinstance(executor, ProcessPoolExecutor)
+
+
+async def test_jobs_queue_is_bounded(fake_config, fake_storage, import_body):
+    """Задания сверх очереди отклоняются, а ждущие при остановке помечаются
+    неудавшимися.
+    """
+    # ARRANGE
+    jobs = create_jobs(
+        fake_config(api={"import_jobs_concurrency": 0, "import_jobs_queue_size": 1}),
+        fake_storage,
+    )
+    jobs.start()
+    # ACT
+    job_id = await jobs.submit(import_body)
+    with pytest.raises(InvalidUsage) as exc:
+        await jobs.submit(import_body)
+    await jobs.stop()
+    # ASSERT
+    assert exc.value.status_code == 503
+    assert list(fake_storage.jobs) == [job_id]
+    assert fake_storage.jobs[job_id].status == JobStatus.failed
+
+
+async def test_create_import_job(jobs_http, fake_storage, import_body):
+    """Импорт принимается с 202, а результат доступен по номеру задания.
+    """
+    # ACT
+    rv = await jobs_http.post(
+        "/imports/jobs", data=import_body, headers={"Content-Type": "application/json"}
+    )
+    # ASSERT
+    assert rv.status == 202, await rv.text()
+    job_id = (await rv.json())["data"]["job_id"]
+    await wait_job(fake_storage, job_id)
+    rv = await jobs_http.get(f"/imports/jobs/{job_id}")
+    assert rv.status == 200
+    assert await rv.json() == {
+        "data": {
+            "job_id": job_id,
+            "status": "done",
+            "citizens_validated": 3,
+            "citizens_inserted": 3,
+            "import_id": 1,
+            "error": None,
+        }
+    }
+    rv = await jobs_http.get(f"/imports/jobs/{job_id + 1}")
+    assert rv.status == 404
+
+
+async def test_delete_import_purges_in_background(jobs_http, fake_storage):
+    """DELETE отвечает, как только набор скрыт, а строки удаляются после ответа.
+    """
+    # ARRANGE
+    fake_storage.purge_allowed = asyncio.Event()
+    # ACT
+    rv = await jobs_http.delete("/imports/1")
+    # ASSERT
+    assert rv.status == 200, await rv.text()
+    assert fake_storage.hidden == [1]
+    assert fake_storage.purged == []
+    fake_storage.purge_allowed.set()
+    for _ in range(100):
+        if fake_storage.purged:
+            break
+        await asyncio.sleep(0.01)
+    assert fake_storage.purged == [1]
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+
+import pytest
+
+from gift_app.cache import ResponseCache
+from gift_app.config import Config
+from gift_app.listener import ImportsListener
+
+
+class FakeStorage:
+    """Хранилище, которое отдает уведомления и теряет соединение.
+    """
+
+    def __init__(self, notifications):
+        self.notifications = notifications
+        self.connections = 0
+        self.lost = asyncio.Event()
+        self.written = []
+
+    def mark_import_written(self, import_id):
+        self.written.append(import_id)
+
+    async def listen_imports(self, callback, on_listen=None, ping_interval=5):
+        self.connections += 1
+        on_listen()
+        for import_id, version in self.notifications:
+            callback(import_id, version)
+        if self.connections == 1:
+            self.lost.set()
+            raise ConnectionError("connection is lost")
+        await asyncio.sleep(3600)
+
+
+def make_listener(storage, cache, config: Config):
+    return ImportsListener(storage, cache, config, logging.getLogger(__package__))
+
+
+@pytest.fixture
+def listen_config(fake_config):
+    return fake_config(cache={"listen": True, "listen_reconnect_delay": 0})
+
+
+async def test_listener_invalidates_cache(listen_config):
+    """Уведомления сбрасывают записи измененных наборов.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    storage = FakeStorage([(1, 1)])
+    listener = make_listener(storage, cache, listen_config)
+    # ACT
+    listener.start()
+    await asyncio.sleep(0.01)
+    # ASSERT
+    assert cache.tracking
+    assert cache.known_version(1) == 1
+    assert storage.written[0] == 1
+    await listener.stop()
+    assert not cache.tracking
+
+
+async def test_listener_reconnects(listen_config):
+    """После потери соединения подписка восстанавливается, а кэш сбрасывается.
+    """
+    # ARRANGE
+    cache = ResponseCache(max_bytes=100)
+    storage = FakeStorage([])
+    listener = make_listener(storage, cache, listen_config)
+    cache.put((1, "a", 0), b"1")
+    # ACT
+    listener.start()
+    await storage.lost.wait()
+    await asyncio.sleep(0.01)
+    # ASSERT
+    assert storage.connections == 2
+    assert cache.tracking
+    assert len(cache) == 0
+    await listener.stop()
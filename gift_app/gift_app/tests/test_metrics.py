@@ -0,0 +1,95 @@
+import pytest
+
+from gift_app.metrics import Metrics, collect_timings, record, server_timing, timed
+from gift_app.pool import MonitoredPool
+
+from . import conftest
+from .test_pool import FakePool
+
+
+class FakeStorage(conftest.FakeStorage):
+    """Хранилище с одним набором данных, отдающее жителей строками.
+    """
+
+    def __init__(self, citizens):
+        self.citizens = citizens
+
+    async def list_citizens_rows(self, import_id):
+        return [vars(x) for x in self.citizens]
+
+
+@pytest.fixture
+async def metrics_http(fake_app, citizen_ivan, citizen_sergei, citizen_maria):
+    storage = FakeStorage([citizen_ivan, citizen_sergei, citizen_maria])
+    return await fake_app(storage, cache={"max_bytes": 0})
+
+
+def test_timings_outside_request_are_dropped():
+    """Замеры вне запроса не копятся, а внутри суммируются по фазам.
+    """
+    # ACT
+    record("db", 1)
+    with collect_timings() as timings:
+        record("db", 0.5)
+        record("db", 0.25)
+        with timed("serialize"):
+            pass
+    record("db", 1)
+    # ASSERT
+    assert timings["db"] == 0.75
+    assert set(timings) == {"db", "serialize"}
+    assert server_timing({"db": 0.75}) == "db;dur=750.0"
+
+
+def test_metrics_render_prometheus_histograms(config):
+    """Гистограммы отдаются накопленными корзинами с суммой и количеством.
+    """
+    # ARRANGE
+    metrics = Metrics(config)
+    route = "/imports/{import_id}/citizens"
+    # ACT
+    metrics.observe_request("GET", route, 200, {"total": 0.003})
+    metrics.observe_request("GET", route, 200, {"total": 20})
+    text = metrics.render()
+    # ASSERT
+    labels = f'worker="0",method="GET",route="{route}"'
+    assert f'gift_app_requests_total{{{labels},status="200"}} 2' in text
+    labels += ',phase="total"'
+    assert f'gift_app_request_phase_seconds_bucket{{{labels},le="0.0025"}} 0' in text
+    assert f'gift_app_request_phase_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'gift_app_request_phase_seconds_bucket{{{labels},le="10"}} 1' in text
+    assert f'gift_app_request_phase_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"gift_app_request_phase_seconds_sum{{{labels}}} 20.003" in text
+    assert f"gift_app_request_phase_seconds_count{{{labels}}} 2" in text
+
+
+async def test_pool_records_phases():
+    """Пул пишет в фазы запроса ожидание соединения и время работы с ним.
+    """
+    # ARRANGE
+    pool = MonitoredPool(FakePool(), min_size=1, max_size=1)
+    # ACT
+    with collect_timings() as timings:
+        async with pool.acquire():
+            pass
+    # ASSERT
+    assert set(timings) == {"pool", "db"}
+
+
+async def test_server_timing_and_metrics(metrics_http):
+    """Ответ несет Server-Timing, а запрос попадает в /x/metrics по шаблону маршрута.
+    """
+    # ACT
+    rv = await metrics_http.get("/imports/1/citizens")
+    # ASSERT
+    assert rv.status == 200
+    phases = [x.split(";")[0] for x in rv.headers["Server-Timing"].split(", ")]
+    assert phases == ["serialize", "total"]
+    rv = await metrics_http.get("/x/metrics")
+    assert rv.status == 200
+    assert rv.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = await rv.text()
+    assert (
+        'gift_app_requests_total{worker="0",method="GET",'
+        'route="/imports/{import_id}/citizens",status="200"} 1'
+    ) in text
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import pickle
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from marshmallow import ValidationError
+
+from gift_app.benchmarks.generator import generate_import_payload
+from gift_app.errors import InvalidUsage
+from gift_app.parsing import ImportParser, citizen_from_tuple, parse_import
+from gift_app.schemas import ImportsSchema
+from gift_app.serialization import JsonSerializer
+
+from . import conftest
+
+
+class FakeStorage(conftest.FakeStorage):
+    """Хранилище, запоминающее импортированных жителей.
+    """
+
+    def __init__(self):
+        self.citizens = []
+
+    async def import_citizens(self, citizens):
+        self.citizens = citizens
+        return 1
+
+
+@pytest.fixture
+def fake_storage():
+    return FakeStorage()
+
+
+@pytest.fixture
+async def parser_http(fake_app, fake_storage):
+    return await fake_app(fake_storage, api={"parse_workers": 1})
+
+
+@pytest.mark.parametrize("fast_validation", [False, True])
+def test_parse_import_matches_schema(citizen_ivan_sample, fast_validation):
+    """Жители из кортежей совпадают с загруженными ImportsSchema.
+    """
+    # ARRANGE
+    data = {"citizens": [{**citizen_ivan_sample, "relatives": []}]}
+    body = JsonSerializer().dumps(data)
+    # ACT
+    rows = parse_import(body, fast_validation, "json")
+    # ASSERT
+    citizens = [citizen_from_tuple(x) for x in rows]
+    assert citizens == ImportsSchema().load(data).citizens
+
+
+def test_parse_import_errors_survive_pickle(citizen_ivan_sample):
+    """Ошибки разбора передаются из процесса пула без потерь.
+    """
+    # ARRANGE
+    body = JsonSerializer().dumps({"citizens": [citizen_ivan_sample]})
+    # ACT
+    with pytest.raises(ValidationError) as validation_error:
+        parse_import(body, False, "json")
+    with pytest.raises(InvalidUsage) as invalid_usage:
+        parse_import(b"{", False, "json")
+    # ASSERT
+    exc = pickle.loads(pickle.dumps(validation_error.value))
+    assert exc.normalized_messages() == validation_error.value.normalized_messages()
+    exc = pickle.loads(pickle.dumps(invalid_usage.value))
+    assert (exc.message, exc.status_code) == (
+        "Expecting a valid json body. Try again.",
+        400,
+    )
+
+
+async def test_parser_rejects_over_queue_size(fake_config):
+    """Импорты сверх parse_queue_size получают 503, а не ждут в памяти.
+    """
+    # ARRANGE
+    parser = ImportParser(
+        fake_config(api={"parse_workers": 1, "parse_queue_size": 1}),
+        logging.getLogger(__name__),
+    )
+    await parser.start()
+    body = JsonSerializer().dumps(generate_import_payload(20000, 2, seed=0))
+    try:
+        # ACT
+        first = asyncio.ensure_future(parser.parse_citizens(body))
+        await asyncio.sleep(0)
+        with pytest.raises(InvalidUsage) as exc:
+            await parser.parse_citizens(body)
+        citizens = await first
+    finally:
+        await parser.stop()
+    # ASSERT
+    assert exc.value.status_code == 503
+    assert len(citizens) == 20000
+
+
+async def test_parser_replaces_broken_pool_once(fake_config):
+    """Пул, сломавшийся под ждущими запросами, заменяется один раз.
+    """
+    # ARRANGE
+    parser = ImportParser(
+        fake_config(api={"parse_workers": 1}), logging.getLogger(__name__)
+    )
+    await parser.start()
+    broken = parser._executor
+    body = JsonSerializer().dumps(generate_import_payload(20000, 2, seed=0))
+    parser._create_executor = MagicMock(wraps=parser._create_executor)
+    broken.shutdown = MagicMock(wraps=broken.shutdown)
+    try:
+        parsing = [asyncio.ensure_future(parser.parse_citizens(body)) for _ in range(3)]
+        await asyncio.sleep(0)
+        # ACT
+        for process in list(broken._processes.values()):
+            process.kill()
+        results = await asyncio.gather(*parsing, return_exceptions=True)
+        citizens = await parser.parse_citizens(body)
+    finally:
+        await parser.stop()
+    # ASSERT
+    assert [x.status_code for x in results] == [503] * 3
+    assert parser._create_executor.call_count == 1
+    broken.shutdown.assert_called_once_with(wait=False)
+    assert len(citizens) == 20000
+
+
+async def test_get_stays_fast_during_import(parser_http, fake_storage):
+    """Пока большой импорт валидируется в пуле, GET отвечают без задержек.
+    """
+    # ARRANGE
+    body = JsonSerializer().dumps(generate_import_payload(100000, 2, seed=0))
+    # ACT
+    post = asyncio.ensure_future(
+        parser_http.post(
+            "/imports", data=body, headers={"Content-Type": "application/json"}
+        )
+    )
+    latencies = []
+    while not post.done():
+        started = time.monotonic()
+        rv = await parser_http.get("/x/version")
+        assert rv.status == 200
+        latencies.append(time.monotonic() - started)
+        await asyncio.sleep(0.01)
+    rv = await post
+    # ASSERT
+    assert rv.status == 201, await rv.text()
+    assert len(fake_storage.citizens) == 100000
+    assert len(latencies) > 10
+    assert max(latencies) < 0.2
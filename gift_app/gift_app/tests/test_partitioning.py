@@ -0,0 +1,181 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import asyncpg
+import asyncpgsa
+import pytest
+
+import gift_app.storage as storage_module
+from gift_app.config import Config
+from gift_app.errors import InvalidUsage
+from gift_app.storage import (
+    PARTITIONING_HASH,
+    PARTITIONING_RANGE,
+    Storage,
+    create_tables,
+    retrieve_partitioning,
+)
+
+from .conftest import db_url
+
+
+@pytest.fixture(params=[PARTITIONING_HASH, PARTITIONING_RANGE])
+async def partitioned_storage(request, loop, config, logger):
+    """Хранилище в отдельной базе с секционированными таблицами.
+    """
+    partitioning = request.param
+    db_name = f"test_db_{partitioning}"
+    pool = await asyncpgsa.create_pool(dsn=db_url(config, "postgres"))
+    async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
+        await conn.execute(f"DROP DATABASE IF EXISTS {db_name}")
+        await conn.execute(f"CREATE DATABASE {db_name}")
+    partitioned_config = Config({"db": {**config.db.__dict__, "name": db_name}})
+    x = Storage(partitioned_config, logger)
+    tables_pool = await asyncpgsa.create_pool(dsn=db_url(partitioned_config, db_name))
+    async with tables_pool.acquire() as conn:  # type: asyncpg.connection.Connection
+        await create_tables(conn, partitioning, hash_partitions=4)
+    await tables_pool.close()
+    await x.initialize()
+    try:
+        yield x
+    finally:
+        await x.pool.close()
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            await conn.execute(f"DROP DATABASE IF EXISTS {db_name}")
+        await pool.close()
+
+
+class LockedConnection:
+    """Соединение, на котором первые попытки не дожидаются блокировки.
+    """
+
+    def __init__(self, locked_attempts: int):
+        self.locked_attempts = locked_attempts
+        self.statements = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, sql: str):
+        self.statements.append(sql)
+        if sql.startswith("CREATE TABLE") and self.locked_attempts:
+            self.locked_attempts -= 1
+            raise asyncpg.exceptions.LockNotAvailableError("lock timeout")
+
+
+async def partitions(storage: Storage) -> list:
+    async with storage.pool.acquire() as conn:  # type: asyncpg.connection.Connection
+        rows = await conn.fetch(
+            "SELECT inhrelid::regclass::text AS name FROM pg_inherits "
+            "WHERE inhparent = 'citizen'::regclass ORDER BY 1"
+        )
+    return [row["name"] for row in rows]
+
+
+async def test_partitioning_is_detected(partitioned_storage: Storage):
+    """Вариант секционирования определяется по базе.
+    """
+    # ACT
+    async with partitioned_storage.pool.acquire() as conn:
+        partitioning = await retrieve_partitioning(conn)
+    # ASSERT
+    assert partitioning == partitioned_storage._partitioning
+    assert partitioning in (PARTITIONING_HASH, PARTITIONING_RANGE)
+
+
+async def test_partitioned_import_works(
+    partitioned_storage: Storage, first_citizens, citizen_maria
+):
+    """Импорт, выборка и обновление работают на секционированных таблицах.
+    """
+    # ARRANGE
+    storage = partitioned_storage
+    # ACT
+    import_id = await storage.import_citizens(first_citizens)
+    citizen = await storage.update_citizen(
+        import_id, citizen_maria.citizen_id, {"relatives": [1]}
+    )
+    # ASSERT
+    citizens = await storage.list_citizens(import_id)
+    assert [x.relatives for x in citizens] == [[2, 3], [1], [1]]
+    assert citizen.relatives == [1]
+    if storage._partitioning == PARTITIONING_RANGE:
+        assert await partitions(storage) == [f"citizen_{import_id}"]
+    else:
+        assert len(await partitions(storage)) == 4
+
+
+async def test_partitioned_relatives_keep_integrity(
+    partitioned_storage: Storage, citizen_ivan
+):
+    """Связи между секциями не дают сослаться на несуществующего жителя.
+    """
+    # ARRANGE
+    citizen_ivan.relatives = [42]
+    # ACT
+    with pytest.raises(asyncpg.ForeignKeyViolationError):
+        await partitioned_storage.import_citizens([citizen_ivan])
+    # ASSERT
+    if partitioned_storage._partitioning == PARTITIONING_RANGE:
+        assert await partitions(partitioned_storage) == []
+
+
+async def test_delete_partitioned_import(partitioned_storage: Storage, first_citizens):
+    """Удаление импорта удаляет его секции и не трогает другие импорты.
+    """
+    # ARRANGE
+    storage = partitioned_storage
+    first = await storage.import_citizens(first_citizens)
+    second = await storage.import_citizens(first_citizens)
+    # ACT
+    await storage.delete_import(first)
+    # ASSERT
+    assert len(await storage.list_citizens(second)) == 3
+    with pytest.raises(InvalidUsage):
+        await storage.list_citizens(first)
+    if storage._partitioning == PARTITIONING_RANGE:
+        assert await partitions(storage) == [f"citizen_{second}"]
+
+
+async def test_import_partitions_wait_lock_with_timeout(config, logger, monkeypatch):
+    """Секции набора создаются с коротким ожиданием блокировки и повторами.
+    """
+    # ARRANGE
+    monkeypatch.setattr(storage_module, "PARTITIONS_LOCK_RETRY_DELAY", 0)
+    storage = Storage(config, logger)
+    conn = LockedConnection(locked_attempts=2)
+    # ACT
+    await storage._create_import_partitions_waiting(conn, 7)
+    # ASSERT
+    set_timeout = f"SET LOCAL lock_timeout = '{storage_module.PARTITIONS_LOCK_TIMEOUT}'"
+    create = "CREATE TABLE citizen_7 PARTITION OF citizen FOR VALUES FROM (7) TO (8)"
+    assert conn.statements[:6] == [set_timeout, create] * 3
+    assert conn.locked_attempts == 0
+
+
+async def test_import_does_not_queue_readers(
+    partitioned_storage: Storage, first_citizens, monkeypatch
+):
+    """Импорт, ждущий долгого читателя, не задерживает новые чтения таблицы.
+    """
+    # ARRANGE
+    storage = partitioned_storage
+    if storage._partitioning != PARTITIONING_RANGE:
+        pytest.skip("секции создаются при импорте только при range")
+    monkeypatch.setattr(storage_module, "PARTITIONS_LOCK_TIMEOUT", "50ms")
+    monkeypatch.setattr(storage_module, "PARTITIONS_LOCK_RETRY_DELAY", 0.1)
+    async with storage.pool.acquire() as reader:
+        tx = reader.transaction()
+        await tx.start()
+        await reader.execute("LOCK TABLE citizen IN ACCESS SHARE MODE")
+        importing = asyncio.ensure_future(storage.import_citizens(first_citizens))
+        await asyncio.sleep(0.3)
+        # ACT
+        async with storage.pool.acquire() as conn:
+            count = await conn.fetchval("SELECT count(*) FROM citizen", timeout=1)
+        await tx.rollback()
+    import_id = await importing
+    # ASSERT
+    assert count == 0
+    assert await partitions(storage) == [f"citizen_{import_id}"]
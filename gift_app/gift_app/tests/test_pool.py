@@ -0,0 +1,76 @@
+import asyncio
+
+from gift_app.pool import MonitoredPool
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakeConnection:
+    def transaction(self):
+        return FakeTransaction()
+
+
+class FakeAcquireContext:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        await self.pool.semaphore.acquire()
+        return FakeConnection()
+
+    async def __aexit__(self, *exc):
+        self.pool.semaphore.release()
+
+
+class FakePool:
+    """Пул на одно соединение.
+    """
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(1)
+
+    def acquire(self, timeout=None):
+        return FakeAcquireContext(self)
+
+    def get_size(self):
+        return 1
+
+
+async def test_pool_counts_connections_in_use():
+    """Статистика показывает занятые, свободные и ожидающие соединения.
+    """
+    # ARRANGE
+    pool = MonitoredPool(FakePool(), min_size=1, max_size=1)
+    # ACT
+    async with pool.acquire():
+        waiter = asyncio.ensure_future(pool.acquire().__aenter__())
+        await asyncio.sleep(0.01)
+        busy = pool.stats()
+    await waiter
+    # ASSERT
+    assert busy["in_use"] == 1
+    assert busy["idle"] == 0
+    assert busy["waiting"] == 1
+    stats = pool.stats()
+    assert stats["acquired"] == 2
+    assert stats["waiting"] == 0
+    assert stats["wait_time_max"] >= 0.01
+
+
+async def test_pool_transaction_uses_monitored_acquire():
+    """Транзакции берут соединения через тот же учет.
+    """
+    # ARRANGE
+    pool = MonitoredPool(FakePool(), min_size=1, max_size=1)
+    # ACT
+    async with pool.transaction():
+        in_use = pool.stats()["in_use"]
+    # ASSERT
+    assert in_use == 1
+    assert pool.stats()["in_use"] == 0
@@ -0,0 +1,107 @@
+import pytest
+import sqlalchemy as sa
+from asyncpgsa import compile_query
+
+from gift_app import storage
+from gift_app.queries import CompiledQuery
+
+
+@pytest.mark.parametrize(
+    "build,compiled",
+    [
+        (storage._import_exists_query, storage.IMPORT_EXISTS_QUERY),
+        (storage._import_version_query, storage.IMPORT_VERSION_QUERY),
+        (storage._birthdays_report_query, storage.BIRTHDAYS_REPORT_QUERY),
+        (storage._age_stats_query, storage.AGE_STATS_QUERY),
+        (storage._citizens_with_relatives_query, storage.LIST_CITIZENS_QUERY),
+        (
+            storage._citizens_with_relatives_array_query,
+            storage.ARRAY_LIST_CITIZENS_QUERY,
+        ),
+        (storage._asymmetric_relatives_query, storage.ASYMMETRIC_RELATIVES_QUERY),
+    ],
+)
+def test_compiled_query_matches_asyncpgsa(build, compiled):
+    """Скомпилированный заранее запрос выполняет тот же SQL с теми же значениями.
+    """
+    # ACT
+    sql, args = compiled.bind(import_id=42)
+    # ASSERT
+    expected_sql, expected_args = compile_query(build(42))
+    assert _inline(sql, args) == _inline(expected_sql, expected_args)
+
+
+def test_compiled_query_reuses_named_params():
+    """Один и тот же bindparam в нескольких местах запроса дает один параметр.
+    """
+    # ARRANGE
+    compiled = storage.RETRIEVE_CITIZEN_QUERY
+    # ACT
+    sql, args = compiled.bind(import_id=1, citizen_id=2)
+    # ASSERT
+    assert sorted(args) == [1, 2]
+    assert _inline(sql, args) == _inline(
+        *compile_query(storage._citizens_with_relatives_query(1, 2))
+    )
+
+
+def test_compiled_query_applies_bind_processors():
+    """Значения параметров проходят через обработчики типов.
+    """
+    # ARRANGE
+    compiled = CompiledQuery(
+        sa.select([storage.citizen_table.c.citizen_id]).where(
+            storage.citizen_table.c.gender == sa.bindparam("gender")
+        )
+    )
+    # ACT
+    _, args = compiled.bind(gender=storage.Gender.male)
+    # ASSERT
+    assert args == ["male"]
+
+
+@pytest.mark.parametrize(
+    "build,compiled",
+    [
+        (storage._import_exists_query, storage.IMPORT_EXISTS_QUERY),
+        (storage._import_version_query, storage.IMPORT_VERSION_QUERY),
+        (storage._birthdays_report_query, storage.BIRTHDAYS_REPORT_QUERY),
+        (storage._age_stats_query, storage.AGE_STATS_QUERY),
+        (storage._citizens_with_relatives_query, storage.LIST_CITIZENS_QUERY),
+    ],
+)
+async def test_compiled_query_runs_in_db(storage, import_batch_first, build, compiled):
+    """Скомпилированный запрос выполняется в базе и отдает те же строки.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    sql, args = compiled.bind(import_id=import_id)
+    async with storage._pool.acquire() as conn:
+        # ACT
+        rows = await conn.fetch(sql, *args)
+        # ASSERT
+        expected = await conn.fetch(build(import_id))
+    assert rows
+    assert [tuple(x) for x in rows] == [tuple(x) for x in expected]
+
+
+async def test_storage_reads_use_compiled_queries(storage, import_batch_first):
+    """Чтения хранилища проходят через скомпилированные запросы.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    # ACT
+    citizens = await storage.list_citizens(import_id)
+    citizen = await storage.retrieve_citizen(import_id, citizens[0].citizen_id)
+    version = await storage.retrieve_import_version(import_id)
+    # ASSERT
+    assert citizen == citizens[0]
+    assert version >= 0
+
+
+def _inline(sql: str, args: list) -> str:
+    """Подставить значения в SQL, чтобы сравнивать запросы с разной нумерацией.
+    """
+    for i, value in reversed(list(enumerate(args, start=1))):
+        sql = sql.replace(f"${i}", repr(value))
+    return sql
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+from marshmallow import ValidationError
+
+from gift_app.schemas import _check_relatives_graph_naive, check_relatives_graph
+
+
+def error_message(check, citizens):
+    try:
+        check(citizens)
+    except ValidationError as exc:
+        return exc.messages
+    return None
+
+
+def random_graph(rnd: random.Random, size: int):
+    """Симметричный граф родства, в который внесены случайные поломки.
+    """
+    ids = rnd.sample(range(size * 3), size)
+    graph = {citizen_id: set() for citizen_id in ids}
+    for _ in range(size * 2):
+        a, b = rnd.choice(ids), rnd.choice(ids)
+        graph[a].add(b)
+        graph[b].add(a)
+    citizens = [(citizen_id, sorted(graph[citizen_id])) for citizen_id in ids]
+    for _ in range(rnd.randint(0, 2)):
+        citizen_id, relatives = rnd.choice(citizens)
+        breakage = rnd.choice(["missing", "asymmetric", "repeated"])
+        if breakage == "missing":
+            relatives.append(size * 3 + rnd.randrange(10))
+        elif breakage == "asymmetric" and relatives:
+            relatives.remove(rnd.choice(relatives))
+        elif relatives:
+            relatives.append(relatives[0])
+    return citizens
+
+
+@pytest.mark.parametrize(
+    "citizens",
+    [
+        [],
+        [(1, [])],
+        [(1, [1])],
+        [(1, [2]), (2, [1])],
+        [(1, [2]), (2, [])],
+        [(1, [88])],
+        [(1, [2, 2]), (2, [1])],
+        [(1, [3]), (2, [3, 3]), (3, [1])],
+        [(5, [7, 9]), (7, [5]), (9, [])],
+        [(1, [2]), (1, [])],
+        [(1, [2]), (2, [1]), (1, [3]), (3, [])],
+        [(2 ** 40, [1]), (1, [2 ** 40])],
+        [(2 ** 70, [2 ** 70])],
+    ],
+)
+def test_same_errors_as_naive(citizens):
+    """Векторная проверка находит те же ошибки, что и обход в цикле.
+    """
+    assert error_message(check_relatives_graph, citizens) == error_message(
+        _check_relatives_graph_naive, citizens
+    )
+
+
+def test_same_errors_as_naive_on_random_graphs():
+    """Векторная проверка совпадает с обходом в цикле на случайных графах.
+    """
+    rnd = random.Random(0)
+    for _ in range(300):
+        citizens = random_graph(rnd, rnd.randint(1, 50))
+        assert error_message(check_relatives_graph, citizens) == error_message(
+            _check_relatives_graph_naive, citizens
+        ), citizens
@@ -0,0 +1,161 @@
+import asyncpg
+import asyncpgsa
+import pytest
+
+from gift_app.config import Config
+from gift_app.errors import InvalidUsage
+from gift_app.storage import (
+    PARTITIONING_NONE,
+    PARTITIONING_RANGE,
+    RELATIVES_ARRAY,
+    Storage,
+    create_tables,
+    retrieve_relatives_layout,
+)
+
+from .conftest import db_url
+
+
+@pytest.fixture(params=[PARTITIONING_NONE, PARTITIONING_RANGE])
+async def array_storage(request, loop, config, logger):
+    """Хранилище в отдельной базе с родственниками в массивах.
+    """
+    partitioning = request.param
+    db_name = f"test_db_array_{partitioning}"
+    pool = await asyncpgsa.create_pool(dsn=db_url(config, "postgres"))
+    async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
+        await conn.execute(f"DROP DATABASE IF EXISTS {db_name}")
+        await conn.execute(f"CREATE DATABASE {db_name}")
+    array_config = Config({"db": {**config.db.__dict__, "name": db_name}})
+    x = Storage(array_config, logger)
+    tables_pool = await asyncpgsa.create_pool(dsn=db_url(array_config, db_name))
+    async with tables_pool.acquire() as conn:  # type: asyncpg.connection.Connection
+        await create_tables(conn, partitioning, relatives_layout=RELATIVES_ARRAY)
+    await tables_pool.close()
+    await x.initialize()
+    try:
+        yield x
+    finally:
+        await x.pool.close()
+        async with pool.acquire() as conn:  # type: asyncpg.connection.Connection
+            await conn.execute(f"DROP DATABASE IF EXISTS {db_name}")
+        await pool.close()
+
+
+async def snapshot(storage: Storage, import_id: int) -> dict:
+    """Все, что хранилище отдает по набору данных.
+    """
+    citizens = await storage.list_citizens(import_id)
+    return {
+        "citizens": citizens,
+        "retrieved": [
+            await storage.retrieve_citizen(import_id, x.citizen_id) for x in citizens
+        ],
+        "birthdays": await storage.birthdays_report(import_id),
+        "age_stats": await storage.retrieve_age_stats(import_id),
+    }
+
+
+async def test_relatives_layout_is_detected(array_storage: Storage, storage: Storage):
+    """Вариант хранения родственников определяется по базе.
+    """
+    # ACT
+    async with array_storage.pool.acquire() as conn:
+        layout = await retrieve_relatives_layout(conn)
+    # ASSERT
+    assert layout == array_storage._relatives_layout == RELATIVES_ARRAY
+    assert storage._relatives_layout != RELATIVES_ARRAY
+
+
+async def test_array_layout_gives_same_results(
+    array_storage: Storage, storage: Storage, first_citizens, citizen_maria
+):
+    """Хранилище с массивами отдает то же, что и с таблицей родственников.
+    """
+    # ARRANGE
+    updates = [
+        {"relatives": [1]},
+        {"relatives": [3, 2]},
+        {"relatives": []},
+        {"relatives": [1, 3], "birth_date": citizen_maria.birth_date.replace(month=3)},
+        {"town": "Тверь"},
+    ]
+    results = []
+    for x in [storage, array_storage]:
+        import_id = await x.import_citizens(first_citizens)
+        updated = []
+        # ACT
+        for update in updates:
+            citizen = await x.update_citizen(
+                import_id, citizen_maria.citizen_id, dict(update)
+            )
+            updated.append(citizen)
+            updated.append(await snapshot(x, import_id))
+        citizens = await x.update_citizens(
+            import_id,
+            [
+                {"citizen_id": 1, "relatives": [3]},
+                {"citizen_id": 3, "relatives": [1, 2, 3], "town": "Москва"},
+            ],
+        )
+        updated.append(citizens)
+        updated.append(await snapshot(x, import_id))
+        results.append(updated)
+    # ASSERT
+    table_results, array_results = results
+    assert array_results == table_results
+
+
+async def test_array_relatives_stay_symmetric(
+    array_storage: Storage, first_citizens, citizen_ivan, citizen_maria
+):
+    """Изменение родственников жителя меняет и массивы его родственников.
+    """
+    # ARRANGE
+    import_id = await array_storage.import_citizens(first_citizens)
+    # ACT
+    await array_storage.update_citizen(
+        import_id, citizen_maria.citizen_id, {"relatives": [citizen_maria.citizen_id]}
+    )
+    await array_storage.update_citizen(
+        import_id, citizen_ivan.citizen_id, {"relatives": [citizen_maria.citizen_id]}
+    )
+    # ASSERT
+    citizens = await array_storage.list_citizens(import_id)
+    assert [x.relatives for x in citizens] == [[3], [], [1, 3]]
+
+
+@pytest.mark.parametrize(
+    "relatives,message",
+    [
+        ([[42], [], []], "не найден родственник #42"),
+        ([[2], [], []], "не признает его своим"),
+    ],
+)
+async def test_array_import_checks_relatives(
+    array_storage: Storage, first_citizens, relatives, message
+):
+    """Без внешних ключей корректность родственников проверяет хранилище.
+    """
+    # ARRANGE
+    for citizen, citizen_relatives in zip(first_citizens, relatives):
+        citizen.relatives = citizen_relatives
+    # ACT
+    with pytest.raises(InvalidUsage) as exc:
+        await array_storage.import_citizens(first_citizens)
+    # ASSERT
+    assert message in str(exc.value.message)
+
+
+async def test_array_import_can_be_deleted(array_storage: Storage, first_citizens):
+    """Удаление набора работает и без таблицы родственников.
+    """
+    # ARRANGE
+    first = await array_storage.import_citizens(first_citizens)
+    second = await array_storage.import_citizens(first_citizens)
+    # ACT
+    await array_storage.delete_import(first)
+    # ASSERT
+    with pytest.raises(InvalidUsage):
+        await array_storage.list_citizens(first)
+    assert len(await array_storage.list_citizens(second)) == 3
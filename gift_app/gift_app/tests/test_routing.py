@@ -0,0 +1,161 @@
+from contextlib import asynccontextmanager
+from unittest.mock import MagicMock
+
+from aiohttp.test_utils import make_mocked_request
+
+from gift_app.cache import ResponseCache
+from gift_app.decorators import cached_json_response
+from gift_app.routing import ReadRouter
+from gift_app.serialization import JsonSerializer
+from gift_app.storage import Storage
+
+
+class FakeReplica:
+    """Реплика, на которой набор данных в своей версии.
+    """
+
+    def __init__(self, version):
+        self.version = version
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetchval(self, sql, *args):
+        return self.version
+
+    async def fetch(self, sql, *args):
+        return [{"version": self.version}]
+
+
+class CitizensView:
+    def __init__(self, storage):
+        self.storage = storage
+        self.cache = ResponseCache(max_bytes=1000)
+        self.serializer = JsonSerializer()
+
+    @cached_json_response
+    async def list_citizens(self, request):
+        rows = await self.storage.list_citizens_rows(1)
+        return {"data": rows}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_reads_are_round_robin():
+    """Чтения распределяются по репликам по кругу.
+    """
+    # ARRANGE
+    router = ReadRouter(["a", "b"], window=5)
+    # ACT
+    replicas = [router.replica_for_read(1) for _ in range(4)]
+    # ASSERT
+    assert replicas == ["a", "b", "a", "b"]
+
+
+def test_no_replicas_reads_primary():
+    """Без реплик все читается с основной базы.
+    """
+    # ARRANGE
+    router = ReadRouter([], window=5)
+    # ACT
+    replica = router.replica_for_read(1)
+    # ASSERT
+    assert replica is None
+
+
+def test_recently_written_import_reads_primary():
+    """Недавно измененный набор читается с основной базы, пока не истечет окно.
+    """
+    # ARRANGE
+    clock = Clock()
+    router = ReadRouter(["a"], window=5, clock=clock)
+    router.mark_written(1)
+    # ACT
+    clock.now = 4.9
+    recent = router.replica_for_read(1)
+    other = router.replica_for_read(2)
+    clock.now = 5
+    expired = router.replica_for_read(1)
+    # ASSERT
+    assert recent is None
+    assert other == "a"
+    assert expired == "a"
+
+
+def test_repeated_write_extends_window():
+    """Повторное изменение продлевает окно чтения с основной базы.
+    """
+    # ARRANGE
+    clock = Clock()
+    router = ReadRouter(["a"], window=5, clock=clock)
+    router.mark_written(1)
+    router.mark_written(2)
+    clock.now = 3
+    router.mark_written(1)
+    # ACT
+    clock.now = 6
+    # ASSERT
+    assert router.replica_for_read(1) is None
+    assert router.replica_for_read(2) == "a"
+    assert list(router._written) == [1]
+
+
+async def test_storage_routes_reads_to_replicas(config, logger):
+    """Storage читает с реплик, а недавно измененный набор - с основной базы.
+    """
+    # ARRANGE
+    storage = Storage(config, logger)
+    primary, replica = MagicMock(), MagicMock()
+    storage._pool = primary
+    storage._router = ReadRouter([replica], window=5)
+    # ACT
+    before_write = storage._read_pool(1)
+    storage.mark_import_written(1)
+    after_write = storage._read_pool(1)
+    # ASSERT
+    assert before_write is replica
+    assert after_write is primary
+
+
+def test_pinned_reads_use_one_replica():
+    """Внутри pinned набор читается с одной реплики, а другие наборы - по кругу.
+    """
+    # ARRANGE
+    router = ReadRouter(["a", "b"], window=5)
+    # ACT
+    with router.pinned():
+        first = [router.replica_for_read(1) for _ in range(3)]
+        other = router.replica_for_read(2)
+    after = router.replica_for_read(1)
+    # ASSERT
+    assert first == ["a", "a", "a"]
+    assert other == "b"
+    assert after == "a"
+
+
+async def test_cached_response_matches_replica_version(config, logger):
+    """Версия и данные ответа читаются с одной реплики, поэтому под ключом
+    версии не оказываются данные отстающей реплики.
+    """
+    # ARRANGE
+    storage = Storage(config, logger)
+    storage._pool = MagicMock()
+    storage._router = ReadRouter([FakeReplica(1), FakeReplica(2)], window=5)
+    view = CitizensView(storage)
+    request = make_mocked_request(
+        "GET", "/imports/1/citizens", match_info={"import_id": "1"}
+    )
+    # ACT
+    for _ in range(4):
+        await view.list_citizens(request)
+    # ASSERT
+    for version in (1, 2):
+        body = view.cache.get((1, "list_citizens", version))
+        assert view.serializer.loads(body) == {"data": [{"version": version}]}
@@ -0,0 +1,83 @@
+import json
+from dataclasses import replace
+
+import pytest
+
+from gift_app.models import Citizen
+from gift_app.schemas import CitizenSchema, dump_citizen
+from gift_app.serialization import (
+    SERIALIZERS,
+    JsonSerializer,
+    OrjsonSerializer,
+    create_serializer,
+    orjson,
+)
+
+backends = [
+    JsonSerializer.name,
+    pytest.param(
+        OrjsonSerializer.name,
+        marks=pytest.mark.skipif(not orjson, reason="orjson is not installed"),
+    ),
+]
+
+
+def test_dump_citizen_matches_schema(citizen_ivan: Citizen, citizen_maria: Citizen):
+    """Прямая сериализация совпадает с CitizenSchema.dump.
+    """
+    for citizen in [citizen_ivan, citizen_maria]:
+        assert dump_citizen(vars(citizen)) == CitizenSchema().dump(citizen)
+
+
+def test_dump_citizen_accepts_database_values(citizen_ivan: Citizen):
+    """Пол строкой и NULL вместо пустого списка родственников, как из базы.
+    """
+    # ARRANGE
+    row = {**vars(citizen_ivan), "gender": citizen_ivan.gender.name, "relatives": None}
+    # ACT
+    data = dump_citizen(row)
+    # ASSERT
+    assert data == CitizenSchema().dump(replace(citizen_ivan, relatives=[]))
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_serializer_roundtrip(backend, citizen_ivan: Citizen):
+    """Ответ разбирается стандартным json в те же данные.
+    """
+    # ARRANGE
+    serializer = create_serializer(backend)
+    data = {"data": [dump_citizen(vars(citizen_ivan))]}
+    # ACT
+    body = serializer.dumps(data)
+    # ASSERT
+    assert json.loads(body) == data
+    assert serializer.loads(body) == data
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_serializer_accepts_integer_keys(backend):
+    """Отчет по дням рождения использует номера месяцев как ключи.
+    """
+    # ACT
+    body = create_serializer(backend).dumps({"data": {1: []}})
+    # ASSERT
+    assert json.loads(body) == {"data": {"1": []}}
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_serializer_rejects_invalid_json(backend):
+    """Ошибка разбора - json.JSONDecodeError для любого сериализатора.
+    """
+    with pytest.raises(json.JSONDecodeError):
+        create_serializer(backend).loads(b"{")
+
+
+def test_auto_backend():
+    """Без явного выбора используется orjson, если он установлен.
+    """
+    # ACT
+    serializer = create_serializer()
+    # ASSERT
+    expected = OrjsonSerializer if orjson else JsonSerializer
+    assert type(serializer) is expected
+    assert set(SERIALIZERS) == {JsonSerializer.name, OrjsonSerializer.name}
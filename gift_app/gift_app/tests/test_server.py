@@ -0,0 +1,104 @@
+import os
+import socket
+
+import pytest
+
+from gift_app.config import Config
+from gift_app.server import create_socket
+from gift_app.storage import pool_sizes
+
+from . import conftest
+
+
+class FakeStorage(conftest.FakeStorage):
+    """Хранилище, у которого можно выключить базу.
+    """
+
+    def __init__(self):
+        self.available = True
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    async def ping(self, timeout):
+        if not self.available:
+            raise ConnectionRefusedError()
+
+
+@pytest.fixture
+def fake_storage():
+    return FakeStorage()
+
+
+@pytest.fixture
+async def fake_http(fake_app, fake_storage):
+    return await fake_app(fake_storage, server={"workers": 4, "worker_id": 2})
+
+
+async def test_health_reports_worker(fake_http):
+    """Проверка здоровья отвечает номером процесса сервера.
+    """
+    # ACT
+    rv = await fake_http.get("/x/health")
+    # ASSERT
+    assert rv.status == 200, await rv.text()
+    jsn = await rv.json()
+    assert jsn == {"data": {"status": "ok", "worker_id": 2, "pid": os.getpid()}}
+
+
+async def test_health_without_database(fake_http, fake_storage):
+    """Процесс без базы отвечает 503, чтобы балансировщик его обходил.
+    """
+    # ARRANGE
+    fake_storage.available = False
+    # ACT
+    rv = await fake_http.get("/x/health")
+    # ASSERT
+    assert rv.status == 503
+
+
+async def test_storage_is_closed_on_cleanup(fake_http, fake_storage):
+    """Остановка приложения закрывает пулы хранилища.
+    """
+    # ACT
+    await fake_http.close()
+    # ASSERT
+    assert fake_storage.closed
+
+
+@pytest.mark.parametrize(
+    "host_pool_max_size, workers, expected",
+    [(0, 4, (10, 10)), (40, 4, (10, 10)), (20, 4, (5, 5)), (3, 4, (1, 1))],
+)
+def test_pool_sizes_share_host_limit(config, host_pool_max_size, workers, expected):
+    """Предел соединений хоста делится между процессами сервера.
+    """
+    # ARRANGE
+    worker_config = Config(
+        {
+            "db": {**config.db.__dict__, "host_pool_max_size": host_pool_max_size},
+            "server": {"workers": workers},
+        }
+    )
+    # ACT
+    sizes = pool_sizes(worker_config)
+    # ASSERT
+    assert sizes == expected
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="no SO_REUSEPORT")
+def test_workers_share_port():
+    """С SO_REUSEPORT несколько процессов слушают один порт.
+    """
+    # ARRANGE
+    first = create_socket("127.0.0.1", 0, reuse_port=True)
+    port = first.getsockname()[1]
+    try:
+        # ACT
+        second = create_socket("127.0.0.1", port, reuse_port=True)
+        # ASSERT
+        assert second.getsockname() == first.getsockname()
+        second.close()
+    finally:
+        first.close()
@@ -1,4 +1,18 @@
-from gift_app.storage import Storage
+import asyncio
+import datetime as dt
+from dataclasses import replace
+
+import pytest
+
+from gift_app.errors import InvalidUsage
+from gift_app.models import Gender, ImportJob, JobStatus
+from gift_app.storage import (
+    Storage,
+    birthday_presents_table,
+    citizen_table,
+    import_table,
+    relative_table,
+)
 
 
 async def test_maria_can_divorce(
@@ -43,6 +57,47 @@ async def test_ivan_can_be_relative_to_himself(storage: Storage, citizen_ivan):
     assert citizen_ivan.relatives == [citizen_ivan.citizen_id]
 
 
+async def test_import_with_gender_codec(storage: Storage, first_citizens):
+    """После initialize пол ходит через кодек citizen_gender, в том числе в COPY.
+    """
+    # ARRANGE
+    async with storage.pool.acquire() as conn:
+        gender = await conn.fetchval("SELECT 'female'::citizen_gender")
+    # ACT
+    import_id = await storage.import_citizens(first_citizens)
+    # ASSERT
+    assert gender is Gender.female
+    citizens = await storage.list_citizens(import_id)
+    assert [x.gender for x in citizens] == [x.gender for x in first_citizens]
+
+
+async def test_listener_gets_local_writes_at_once(
+    storage: Storage, import_batch_first, citizen_maria
+):
+    """Подписчик узнает о версии, записанной этим процессом, сразу после коммита,
+    не дожидаясь уведомления из базы.
+    """
+    # ARRANGE
+    versions = []
+    listening = asyncio.Event()
+    listen = asyncio.ensure_future(
+        storage.listen_imports(
+            lambda *x: versions.append(x), on_listen=listening.set, ping_interval=60
+        )
+    )
+    await listening.wait()
+    # ACT
+    try:
+        await storage.update_citizen(
+            import_batch_first, citizen_maria.citizen_id, {"name": "Мария"}
+        )
+    finally:
+        listen.cancel()
+        await asyncio.gather(listen, return_exceptions=True)
+    # ASSERT
+    assert versions == [(import_batch_first, 1)]
+
+
 async def test_update_does_not_affect_others_imports(
     storage: Storage, import_batch_first, import_batch_second, citizen_maria
 ):
@@ -61,3 +116,249 @@ async def test_update_does_not_affect_others_imports(
     )
     assert citizen_maria_first.name.startswith("Нейроманова")
     assert citizen_maria_second.name.startswith("Романова")
+
+
+async def test_list_citizens_matches_retrieve(
+    storage: Storage, citizen_ivan, citizen_sergei, citizen_maria
+):
+    """Список жителей и выборка по одному дают одинаковых жителей,
+    родственники упорядочены, у жителя без родни пустой список.
+    """
+    # ARRANGE
+    citizen_ivan.relatives = [3, 2]
+    citizen_sergei.relatives = [1]
+    citizen_maria.relatives = [1]
+    lonely = replace(citizen_maria, citizen_id=4, relatives=[])
+    import_id = await storage.import_citizens(
+        [citizen_ivan, citizen_sergei, citizen_maria, lonely]
+    )
+    # ACT
+    citizens = await storage.list_citizens(import_id)
+    # ASSERT
+    assert [x.relatives for x in citizens] == [[2, 3], [1], [1], []]
+    for citizen in citizens:
+        assert await storage.retrieve_citizen(import_id, citizen.citizen_id) == citizen
+
+
+async def test_update_replaces_many_relatives(storage: Storage, citizen_maria):
+    """Замена большого списка родственников сохраняет связи в обе стороны.
+    """
+    # ARRANGE
+    citizens = [
+        replace(citizen_maria, citizen_id=i, relatives=[0] if i else [])
+        for i in range(201)
+    ]
+    citizens[0].relatives = list(range(1, 201))
+    import_id = await storage.import_citizens(citizens)
+    new_relatives = [0] + list(range(101, 201))
+    # ACT
+    citizen = await storage.update_citizen(import_id, 0, {"relatives": new_relatives})
+    # ASSERT
+    assert citizen.relatives == new_relatives
+    citizens = await storage.list_citizens(import_id)
+    for x in citizens[1:]:
+        assert x.relatives == ([0] if x.citizen_id > 100 else [])
+
+
+async def test_update_rejects_missing_relative(
+    storage: Storage, import_batch_first, citizen_maria
+):
+    """Нельзя добавить родственника, которого нет в наборе.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    update = {"relatives": [1, 2, 42]}
+    # ACT
+    with pytest.raises(InvalidUsage) as exc:
+        await storage.update_citizen(import_id, citizen_maria.citizen_id, update)
+    # ASSERT
+    assert exc.value.status_code == 400
+    assert "#42" in exc.value.message
+
+
+async def test_update_unknown_import_or_citizen(
+    storage: Storage, import_batch_first, citizen_maria
+):
+    """Обновление в несуществующем наборе или несуществующего жителя дает 404.
+    """
+    # ACT
+    with pytest.raises(InvalidUsage) as unknown_import:
+        await storage.update_citizen(100500, citizen_maria.citizen_id, {"name": "X"})
+    with pytest.raises(InvalidUsage) as unknown_citizen:
+        await storage.update_citizen(import_batch_first, 100500, {"name": "X"})
+    # ASSERT
+    assert unknown_import.value.status_code == 404
+    assert "Набора данных" in unknown_import.value.message
+    assert unknown_citizen.value.status_code == 404
+    assert "Житель #100500" in unknown_citizen.value.message
+
+
+async def test_update_returns_saved_citizen(
+    storage: Storage, import_batch_first, citizen_maria
+):
+    """Обновление возвращает жителя таким, каким его вернет выборка,
+    и увеличивает версию набора.
+    """
+    # ARRANGE
+    import_id = import_batch_first
+    citizen_id = citizen_maria.citizen_id
+    version = await storage.retrieve_import_version(import_id)
+    # ACT
+    only_relatives = await storage.update_citizen(
+        import_id, citizen_id, {"relatives": [2, 1]}
+    )
+    only_fields = await storage.update_citizen(import_id, citizen_id, {"town": "Тверь"})
+    # ASSERT
+    assert only_relatives.relatives == [1, 2]
+    assert only_fields.town == "Тверь"
+    assert only_fields == await storage.retrieve_citizen(import_id, citizen_id)
+    assert await storage.retrieve_import_version(import_id) == version + 2
+
+
+async def test_bulk_update_matches_single_updates(
+    storage: Storage, first_citizens, citizen_ivan, citizen_maria
+):
+    """Пакетное обновление дает тот же набор, что и обновления по одному.
+    """
+    # ARRANGE
+    updates = [
+        {"citizen_id": citizen_maria.citizen_id, "relatives": [1, 3], "town": "Тверь"},
+        {
+            "citizen_id": citizen_ivan.citizen_id,
+            "birth_date": citizen_ivan.birth_date.replace(month=2),
+            "name": "Иванов Иван",
+        },
+    ]
+    single_import = await storage.import_citizens(first_citizens)
+    bulk_import = await storage.import_citizens(first_citizens)
+    for update in updates:
+        update = dict(update)
+        await storage.update_citizen(single_import, update.pop("citizen_id"), update)
+    # ACT
+    citizens = await storage.update_citizens(bulk_import, updates)
+    # ASSERT
+    assert [x.citizen_id for x in citizens] == [3, 1]
+    assert citizens[1].relatives == [2, 3]
+    for method in ["list_citizens", "birthdays_report", "retrieve_age_stats"]:
+        expected = await getattr(storage, method)(single_import)
+        assert await getattr(storage, method)(bulk_import) == expected
+
+
+async def test_bulk_update_applies_merged_graph(storage: Storage, first_citizens):
+    """Связи из разных обновлений пакета складываются в один граф.
+    """
+    # ARRANGE
+    import_id = await storage.import_citizens(first_citizens)
+    updates = [
+        {"citizen_id": 1, "relatives": [3]},
+        {"citizen_id": 3, "relatives": [1, 2]},
+    ]
+    # ACT
+    citizens = await storage.update_citizens(import_id, updates)
+    # ASSERT
+    assert [x.relatives for x in citizens] == [[3], [1, 2]]
+    citizens = await storage.list_citizens(import_id)
+    assert [x.relatives for x in citizens] == [[3], [3], [1, 2]]
+
+
+async def test_bulk_update_rejects_inconsistent_relatives(
+    storage: Storage, import_batch_first
+):
+    """Обновления, противоречащие друг другу, не применяются.
+    """
+    # ARRANGE
+    updates = [
+        {"citizen_id": 3, "relatives": [1]},
+        {"citizen_id": 1, "relatives": [2], "name": "Иванов Иван"},
+    ]
+    # ACT
+    with pytest.raises(InvalidUsage) as exc:
+        await storage.update_citizens(import_batch_first, updates)
+    # ASSERT
+    assert exc.value.status_code == 400
+    assert "Родственник #1 жителя #3" in exc.value.message
+
+
+async def test_delete_import(
+    storage: Storage, import_batch_first, import_batch_second, monkeypatch
+):
+    """Удаление импорта пачками удаляет его жителей и аналитику,
+    другие импорты остаются.
+    """
+    # ARRANGE
+    monkeypatch.setattr(storage.config.db, "delete_batch_size", 2)
+    # ACT
+    await storage.delete_import(import_batch_first)
+    # ASSERT
+    with pytest.raises(InvalidUsage):
+        await storage.list_citizens(import_batch_first)
+    with pytest.raises(InvalidUsage):
+        await storage.birthdays_report(import_batch_first)
+    with pytest.raises(InvalidUsage):
+        await storage.delete_import(import_batch_first)
+    assert len(await storage.list_citizens(import_batch_second)) == 3
+    async with storage.pool.acquire() as conn:
+        for table in [citizen_table, relative_table, birthday_presents_table]:
+            rows = await conn.fetch(
+                table.select().where(table.c.import_id == import_batch_first)
+            )
+            assert rows == []
+
+
+async def test_deleted_import_is_hidden(
+    storage: Storage, import_batch_first, citizen_maria
+):
+    """Помеченный удаленным набор не виден и не обновляется,
+    даже если его строки еще не удалены.
+    """
+    # ARRANGE
+    async with storage.pool.acquire() as conn:
+        await storage._bump_import_version(conn, import_batch_first, delete=True)
+    # ACT & ASSERT
+    with pytest.raises(InvalidUsage):
+        await storage.retrieve_import_version(import_batch_first)
+    with pytest.raises(InvalidUsage):
+        await storage.retrieve_citizen(import_batch_first, citizen_maria.citizen_id)
+    with pytest.raises(InvalidUsage):
+        await storage.update_citizen(
+            import_batch_first, citizen_maria.citizen_id, {"town": "Тверь"}
+        )
+
+
+async def test_purge_imports(storage: Storage, import_batch_first, import_batch_second):
+    """Удаляются только старые наборы.
+    """
+    # ARRANGE
+    async with storage.pool.acquire() as conn:
+        await conn.execute(
+            import_table.update()
+            .where(import_table.c.import_id == import_batch_first)
+            .values(created_at=import_table.c.created_at - dt.timedelta(days=2))
+        )
+    # ACT
+    purged = await storage.purge_imports(dt.timedelta(days=1))
+    # ASSERT
+    assert purged == [import_batch_first]
+    with pytest.raises(InvalidUsage):
+        await storage.list_citizens(import_batch_first)
+    assert len(await storage.list_citizens(import_batch_second)) == 3
+
+
+async def test_import_job_state(storage: Storage):
+    """Состояние задания импорта вместе с ошибками валидации читается из базы.
+    """
+    # ARRANGE
+    job_id = await storage.create_import_job()
+    error = {"citizens": {"_schema": ["У жителя #1 не найден родственник #2."]}}
+    # ACT
+    created = await storage.retrieve_import_job(job_id)
+    await storage.update_import_job(job_id, status=JobStatus.running)
+    await storage.update_import_job(
+        job_id, status=JobStatus.failed, citizens_validated=3, error=error
+    )
+    # ASSERT
+    assert created == ImportJob(job_id, JobStatus.pending, 0, 0)
+    job = await storage.retrieve_import_job(job_id)
+    assert job == ImportJob(job_id, JobStatus.failed, 3, 0, error=error)
+    with pytest.raises(InvalidUsage):
+        await storage.retrieve_import_job(job_id + 1)
@@ -0,0 +1,161 @@
+import json
+
+import pytest
+from injector import Binder
+from marshmallow import ValidationError
+
+from gift_app.config import Config
+from gift_app.main import init_func
+from gift_app.schemas import CitizenSchema, ImportsSchema
+from gift_app.storage import Storage
+from gift_app.streaming import JsonStreamParser, load_citizens_batches
+
+
+class BytesStream:
+    """Поток, отдающий данные порциями заданного размера.
+    """
+
+    def __init__(self, data: bytes, chunk_size: int):
+        self._data = data
+        self._chunk_size = chunk_size
+
+    async def read(self, n=-1):
+        size = min(n, self._chunk_size)
+        chunk, self._data = self._data[:size], self._data[size:]
+        return chunk
+
+
+@pytest.fixture
+def imports_sample(citizen_ivan_sample, citizen_sergei_sample, citizen_maria_sample):
+    d = {"citizens": [citizen_ivan_sample, citizen_sergei_sample, citizen_maria_sample]}
+    return d
+
+
+async def load_batches(data, chunk_size=7, batch_size=2):
+    parser = JsonStreamParser(BytesStream(data, chunk_size))
+    batches = []
+    async for batch in load_citizens_batches(parser, CitizenSchema().load, batch_size):
+        batches.append(batch)
+    return batches
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1024])
+async def test_parser_reads_values_split_by_chunks(chunk_size):
+    """Значения, разрезанные на границах порций, собираются целиком.
+    """
+    # ARRANGE
+    value = {"a": [12345, -1.5e3, "Москва", True, None, {"b": []}], "c": "\\u0416"}
+    data = json.dumps(value, ensure_ascii=False).encode()
+    parser = JsonStreamParser(BytesStream(data, chunk_size))
+    # ACT
+    result = {}
+    async for key in parser.iter_object():
+        if key == "a":
+            result[key] = [x async for x in parser.iter_array()]
+        else:
+            result[key] = await parser.read_value()
+    await parser.expect_end()
+    # ASSERT
+    assert result == value
+
+
+async def test_parser_rejects_broken_json():
+    """Невалидный json приводит к JSONDecodeError.
+    """
+    parser = JsonStreamParser(BytesStream(b'{"citizens": [1, 2', 4))
+    with pytest.raises(json.JSONDecodeError):
+        async for _ in parser.iter_object():
+            async for _ in parser.iter_array():
+                pass
+
+
+async def test_citizens_are_loaded_in_batches(imports_sample):
+    """Жители отдаются пачками в исходном порядке.
+    """
+    # ARRANGE
+    data = json.dumps(imports_sample).encode()
+    # ACT
+    batches = await load_batches(data)
+    # ASSERT
+    assert [len(batch) for batch in batches] == [2, 1]
+    citizens = [citizen for batch in batches for citizen in batch]
+    assert citizens == ImportsSchema().load(imports_sample).citizens
+
+
+@pytest.mark.parametrize(
+    "mutate",
+    [
+        lambda d: d["citizens"][0].update(gender="helicopter"),
+        lambda d: d["citizens"][1].pop("name"),
+        lambda d: d["citizens"][2].update(relatives=[88]),
+        lambda d: d["citizens"][1].update(citizen_id=1),
+        lambda d: d["citizens"][0].update(relatives=[2, 2]),
+        lambda d: d.update(unknown=1),
+        lambda d: d.update(citizens=None),
+        lambda d: d.update(citizens={}),
+        lambda d: d.pop("citizens"),
+    ],
+)
+async def test_errors_are_the_same_as_in_schema(imports_sample, mutate):
+    """Ошибки потокового разбора совпадают с ошибками ImportsSchema.
+    """
+    # ARRANGE
+    mutate(imports_sample)
+    data = json.dumps(imports_sample).encode()
+    with pytest.raises(ValidationError) as expected:
+        ImportsSchema().load(imports_sample)
+    # ACT
+    with pytest.raises(ValidationError) as actual:
+        await load_batches(data)
+    # ASSERT
+    assert actual.value.messages == expected.value.messages
+
+
+async def test_no_batches_after_duplicated_citizen(imports_sample):
+    """После повтора citizen_id пачки в базу больше не отдаются.
+    """
+    # ARRANGE
+    imports_sample["citizens"][1]["citizen_id"] = 1
+    parser = JsonStreamParser(BytesStream(json.dumps(imports_sample).encode(), 7))
+    batches = []
+    # ACT
+    with pytest.raises(ValidationError):
+        async for batch in load_citizens_batches(parser, CitizenSchema().load, 1):
+            batches.append(batch)
+    # ASSERT
+    assert [[c.citizen_id for c in batch] for batch in batches] == [[1]]
+
+
+@pytest.fixture
+async def app(loop, test_db, fake_config, storage):
+    """Приложение с потоковой загрузкой импортов.
+    """
+
+    def configuration(binder: Binder):
+        binder.bind(Config, fake_config(api={"streaming_imports": True}))
+        binder.bind(Storage, storage)
+
+    app = await init_func([], extra_modules=[configuration])
+    return app
+
+
+async def test_can_import_the_sample_streaming(http, imports_sample):
+    """Пример импорта из задания загружается в потоковом режиме.
+    """
+    # ACT
+    rv = await http.post("/imports", json=imports_sample)
+    # ASSERT
+    assert rv.status == 201, await rv.text()
+    import_id = (await rv.json())["data"]["import_id"]
+    rv = await http.get(f"/imports/{import_id}/citizens")
+    assert rv.status == 200, await rv.text()
+    assert len((await rv.json())["data"]) == 3
+
+
+async def test_streaming_import_rejects_invalid_json(http):
+    """Невалидный json в потоковом режиме дает 400.
+    """
+    # ACT
+    rv = await http.post("/imports", data=b'{"citizens": [')
+    # ASSERT
+    assert rv.status == 400, await rv.text()
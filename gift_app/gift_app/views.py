@@ -1,49 +1,140 @@
+import json
 import logging
+import os
 
 from aiohttp import web
 from injector import inject
 
 import gift_app
-from .decorators import expect_json_body, json_response
+from .cache import ResponseCache
+from .config import Config
+from .decorators import cached_json_response, expect_json_body, json_response
+from .errors import InvalidUsage
+from .fast_schemas import FastImportsSchema
+from .jobs import ImportJobs
+from .metrics import Metrics, timed
+from .parsing import ImportParser
 from .schemas import (
     CitizenSchema,
+    CitizensUpdateSchema,
     CitizenUpdateSchema,
+    ImportJobSchema,
     ImportsSchema,
     TownAgeStatSchema,
+    dump_citizen,
 )
+from .serialization import JsonSerializer
 from .storage import Storage
+from .streaming import JsonStreamParser, load_citizens_batches
+
+# Сколько ждать соединения и ответа базы при проверке здоровья, секунд.
+HEALTH_CHECK_TIMEOUT = 1
 
 
 @inject
 class ImportsView:
-    def __init__(self, storage: Storage, logger: logging.Logger):
+    def __init__(
+        self,
+        storage: Storage,
+        config: Config,
+        cache: ResponseCache,
+        serializer: JsonSerializer,
+        parser: ImportParser,
+        jobs: ImportJobs,
+        metrics: Metrics,
+        logger: logging.Logger,
+    ):
         self.storage = storage
+        self.config = config
+        self.cache = cache
+        self.serializer = serializer
+        self.parser = parser
+        self.jobs = jobs
+        self.metrics = metrics
         self.logger = logger
 
+    async def import_citizens(self, request: web.Request):
+        if self.config.api.streaming_imports:
+            return await self._import_citizens_streaming(request)
+        if self.parser.enabled:
+            return await self._import_citizens_offloaded(request)
+        return await self._import_citizens(request)
+
     @expect_json_body
     @json_response(status=201)
-    async def import_citizens(self, request):
-        jsn = await request.json()
+    async def _import_citizens(self, request: web.Request):
+        jsn = request["json"]
 
-        schema = ImportsSchema()
-        import_message = schema.load(jsn)
+        if self.config.api.fast_validation:
+            schema = FastImportsSchema()
+        else:
+            schema = ImportsSchema()
+        with timed("validate"):
+            import_message = schema.load(jsn)
 
         import_id = await self.storage.import_citizens(import_message.citizens)
 
         result = {"data": {"import_id": import_id}}
         return result
 
+    @json_response(status=201)
+    async def _import_citizens_offloaded(self, request: web.Request):
+        """Разобрать и провалидировать тело в пуле процессов.
+        """
+        citizens = await self.parser.parse_citizens(await request.read())
+
+        import_id = await self.storage.import_citizens(citizens)
+
+        result = {"data": {"import_id": import_id}}
+        return result
+
+    @json_response(status=201)
+    async def _import_citizens_streaming(self, request: web.Request):
+        parser = JsonStreamParser(
+            request.content, max_size=self.config.api.client_max_size
+        )
+        if self.config.api.fast_validation:
+            load_citizen = FastImportsSchema().load_citizen
+        else:
+            load_citizen = CitizenSchema().load
+        batches = load_citizens_batches(
+            parser, load_citizen, self.config.api.import_batch_size
+        )
+        try:
+            import_id = await self.storage.import_citizens_stream(batches)
+        except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+            self.logger.exception(exc)
+            raise InvalidUsage.bad_request("Expecting a valid json body. Try again.")
+
+        result = {"data": {"import_id": import_id}}
+        return result
+
+    @json_response(status=202)
+    async def create_import_job(self, request: web.Request):
+        """Принять импорт в очередь, тело разбирается уже в задании.
+        """
+        job_id = await self.jobs.submit(await request.read())
+        result = {"data": {"job_id": job_id}}
+        return result
+
+    @json_response
+    async def retrieve_import_job(self, request: web.Request):
+        job_id = int(request.match_info["job_id"])
+        job = await self.storage.retrieve_import_job(job_id)
+        schema = ImportJobSchema()
+        result = {"data": schema.dump(job)}
+        return result
+
     @expect_json_body
     @json_response
     async def update_citizen(self, request: web.Request):
         import_id = int(request.match_info["import_id"])
         citizen_id = int(request.match_info["citizen_id"])
-        jsn = await request.json()
+        jsn = request["json"]
 
         schema = CitizenUpdateSchema()
-        citizen_update = schema.load(jsn)
-
-        await self.storage.retrieve_citizen(import_id, citizen_id)
+        with timed("validate"):
+            citizen_update = schema.load(jsn)
 
         citizen = await self.storage.update_citizen(
             import_id, citizen_id, citizen_update
@@ -52,22 +143,91 @@ class ImportsView:
         result = {"data": schema.dump(citizen)}
         return result
 
+    @expect_json_body
     @json_response
-    async def list_citizens(self, request: web.Request):
+    async def update_citizens(self, request: web.Request):
         import_id = int(request.match_info["import_id"])
-        citizens = await self.storage.list_citizens(import_id)
+        jsn = request["json"]
+
+        schema = CitizensUpdateSchema()
+        with timed("validate"):
+            updates = schema.load(jsn)
+
+        citizens = await self.storage.update_citizens(import_id, updates)
         schema = CitizenSchema(many=True)
         result = {"data": schema.dump(citizens)}
         return result
 
     @json_response
+    async def delete_import(self, request: web.Request):
+        import_id = int(request.match_info["import_id"])
+        if self.config.api.purge_in_background:
+            # Удаление строк большого набора держало бы запрос долго.
+            await self.storage.hide_import(import_id)
+            self.jobs.purge_later(import_id)
+        else:
+            await self.storage.delete_import(import_id)
+        # Записи и так перестанут отдаваться, но память лучше освободить сразу.
+        self.cache.invalidate(import_id)
+        result = {"data": {"import_id": import_id}}
+        return result
+
+    async def list_citizens(self, request: web.Request):
+        if self.config.api.streaming_citizens_list:
+            return await self._list_citizens_streaming(request)
+        return await self._list_citizens(request)
+
+    @cached_json_response
+    async def _list_citizens(self, request: web.Request):
+        import_id = int(request.match_info["import_id"])
+        rows = await self.storage.list_citizens_rows(import_id)
+        # Строки сериализуются напрямую, минуя Citizen и CitizenSchema.
+        with timed("serialize"):
+            result = {"data": [dump_citizen(row) for row in rows]}
+        return result
+
+    async def _list_citizens_streaming(self, request: web.Request):
+        """Отдать список жителей по частям, не собирая весь ответ в памяти.
+        """
+        import_id = int(request.match_info["import_id"])
+        batches = self.storage.iter_citizens(
+            import_id, self.config.api.citizens_list_batch_size
+        )
+        try:
+            # Первая пачка читается до отправки заголовков, чтобы ошибки
+            # вернулись обычным ответом.
+            batch = await batches.__anext__()
+            response = web.StreamResponse(
+                headers={"Content-Type": "application/json; charset=utf-8"}
+            )
+            await response.prepare(request)
+            await response.write(b'{"data": [')
+            separator = b""
+            while True:
+                if batch:
+                    chunk = b", ".join(
+                        self.serializer.dumps(dump_citizen(vars(x))) for x in batch
+                    )
+                    await response.write(separator + chunk)
+                    separator = b", "
+                try:
+                    batch = await batches.__anext__()
+                except StopAsyncIteration:
+                    break
+            await response.write(b"]}")
+            await response.write_eof()
+            return response
+        finally:
+            await batches.aclose()
+
+    @cached_json_response
     async def list_birthdays(self, request: web.Request):
         import_id = int(request.match_info["import_id"])
         report = await self.storage.birthdays_report(import_id)
         result = {"data": report}
         return result
 
-    @json_response
+    @cached_json_response(by_date=True)
     async def retrieve_age_stats(self, request: web.Request):
         import_id = int(request.match_info["import_id"])
         stats = await self.storage.retrieve_age_stats(import_id)
@@ -81,6 +241,39 @@ class ImportsView:
         result = {"data": {"version": gift_app.VERSION}}
         return result
 
+    @json_response
+    async def retrieve_health(self, request: web.Request):
+        try:
+            await self.storage.ping(HEALTH_CHECK_TIMEOUT)
+        except Exception as exc:
+            self.logger.warning("Health check failed: %r", exc)
+            raise InvalidUsage.unavailable("Database is unavailable")
+        # Номер процесса показывает, какой из процессов сервера ответил.
+        result = {
+            "data": {
+                "status": "ok",
+                "worker_id": self.config.server.worker_id,
+                "pid": os.getpid(),
+            }
+        }
+        return result
+
+    async def retrieve_metrics(self, request: web.Request):
+        return web.Response(
+            body=self.metrics.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    @json_response
+    async def retrieve_cache_stats(self, request: web.Request):
+        result = {"data": self.cache.stats()}
+        return result
+
+    @json_response
+    async def retrieve_pool_stats(self, request: web.Request):
+        result = {"data": self.storage.pool_stats()}
+        return result
+
     @json_response
     async def create_a_problem(self, request: web.Request):
         raise RuntimeError("We have a problem")
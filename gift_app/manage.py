@@ -1,10 +1,14 @@
 import asyncio
+import datetime as dt
+import logging
 
 import click
 from injector import Injector
 
 import gift_app.storage as storage_module
+from gift_app.config import Config
 from gift_app.providers import ApplicationModule
+from gift_app.server import Server
 from gift_app.storage import Storage
 
 
@@ -14,13 +18,36 @@ def cli():
 
 
 @cli.command()
-def init_db():
+@click.option(
+    "--partitioning",
+    type=click.Choice(
+        [
+            storage_module.PARTITIONING_NONE,
+            storage_module.PARTITIONING_HASH,
+            storage_module.PARTITIONING_RANGE,
+        ]
+    ),
+    default=storage_module.PARTITIONING_NONE,
+    show_default=True,
+    help="Секционирование жителей и родственников по import_id.",
+)
+@click.option("--hash-partitions", default=16, show_default=True)
+@click.option(
+    "--relatives",
+    type=click.Choice([storage_module.RELATIVES_TABLE, storage_module.RELATIVES_ARRAY]),
+    default=storage_module.RELATIVES_TABLE,
+    show_default=True,
+    help="Хранить родственников в таблице relative или массивом в строке жителя.",
+)
+def init_db(partitioning, hash_partitions, relatives):
     storage = _get_storage()
 
     async def go():
         await storage.initialize()
         async with storage.pool.acquire() as conn:
-            await storage_module.create_tables(conn)
+            await storage_module.create_tables(
+                conn, partitioning, hash_partitions, relatives
+            )
 
     asyncio.run(go())
 
@@ -36,6 +63,37 @@ def drop_db():
     asyncio.run(go())
 
 
+@cli.command()
+@click.option(
+    "--older-than",
+    type=int,
+    required=True,
+    help="Удалить наборы данных старше указанного числа дней.",
+)
+def purge_imports(older_than):
+    async def go():
+        storage = _get_storage()
+        await storage.initialize()
+        import_ids = await storage.purge_imports(dt.timedelta(days=older_than))
+        click.echo(f"Purged imports: {import_ids}")
+
+    asyncio.run(go())
+
+
+@cli.command()
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", default=8080, show_default=True)
+@click.option(
+    "--workers", type=int, help="Число процессов, по умолчанию GIFT_APP_SERVER_WORKERS."
+)
+def serve(host, port, workers):
+    injector = Injector(modules=[ApplicationModule])
+    config = injector.get(Config)
+    logger = injector.get(logging.Logger)
+    server = Server(host, port, workers or config.server.workers, config, logger)
+    server.run()
+
+
 def _get_storage() -> Storage:
     injector = Injector(modules=[ApplicationModule])
     storage = injector.get(Storage)